@@ -0,0 +1,144 @@
+# bench_corpus.py
+"""
+Синтетический корпус для bench_pipeline.py: LaTeX с заданной плотностью
+формул и цитат, .docx с формулами OMML и ZIP-проекты с крупными рисунками.
+Генерация детерминирована (seed), так что замеры разных версий сравнимы.
+"""
+import random
+import zipfile
+
+WORDS = (
+    "the model of stochastic process is defined by drift and volatility we show that "
+    "estimate converges under mild assumptions results table parameter value figure "
+    "method analysis data sample error bound proof theorem lemma observe following "
+    "numerical experiments confirm theoretical predictions for large samples"
+).split()
+
+MATH = (r"$x_{i}^{2}$", r"$\mu$", r"$\sigma^2 t$", r"$\int_0^t W_s\,ds$", r"$dX_t$", r"$\alpha+\beta$")
+
+
+def _sentence(rng, math_density, cite_density):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    if rng.random() < math_density:
+        words.insert(rng.randrange(len(words)), rng.choice(MATH))
+    if rng.random() < cite_density:
+        words.append(f"\\cite{{ref{rng.randint(1, 500)}}}")
+    return " ".join(words).capitalize() + "."
+
+
+def generate_latex_body(size, math_density=0.3, cite_density=0.1, seed=0):
+    """Тело документа примерно из size байт: абзацы, разделы, формулы, \\cite, \\ref"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    paragraph = 0
+    while total < size:
+        if paragraph % 12 == 0:
+            block = f"\\section{{{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}}}\\label{{sec:{paragraph}}}"
+        elif rng.random() < math_density / 4:
+            block = (
+                "\\begin{equation}\n"
+                f"  X_t = X_0 + \\int_0^t \\mu\\,ds + \\sigma W_t \\label{{eq:{paragraph}}}\n"
+                "\\end{equation}"
+            )
+        else:
+            sentences = [_sentence(rng, math_density, cite_density) for _ in range(rng.randint(2, 6))]
+            if rng.random() < 0.2:
+                sentences.append(f"See Figure~\\ref{{fig:{rng.randint(1, 50)}}}.")
+            block = " ".join(sentences)
+        parts.append(block)
+        total += len(block) + 2
+        paragraph += 1
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_latex(size, math_density=0.3, cite_density=0.1, seed=0):
+    """Полный документ: преамбула, тело size байт, библиография"""
+    return (
+        "\\documentclass{article}\n"
+        "\\usepackage{amsmath}\n"
+        "\\usepackage{graphicx}\n"
+        "\\title{Synthetic benchmark document}\n"
+        "\\begin{document}\n"
+        "\\maketitle\n\n"
+        + generate_latex_body(size, math_density, cite_density, seed)
+        + "\n\\bibliographystyle{plain}\n\\bibliography{refs}\n\\end{document}\n"
+    )
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def generate_docx_xml(size, omml_density=0.3, seed=0):
+    """word/document.xml примерно из size байт с формулами OMML в части абзацев"""
+    rng = random.Random(seed)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+        'xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math"><w:body>'
+    ]
+    total = len(parts[0])
+    while total < size:
+        runs = []
+        for _ in range(rng.randint(1, 4)):
+            text = _sentence(rng, 0.1, 0.0)
+            runs.append(f'<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">{text} </w:t></w:r>')
+            if rng.random() < omml_density:
+                runs.append('<m:oMath><m:r><m:t>x</m:t></m:r><m:sSup><m:e><m:r><m:t>y</m:t></m:r></m:e>'
+                            '<m:sup><m:r><m:t>2</m:t></m:r></m:sup></m:sSup></m:oMath>')
+        paragraph = "<w:p>" + "".join(runs) + "</w:p>"
+        parts.append(paragraph)
+        total += len(paragraph)
+    parts.append("<w:sectPr/></w:body></w:document>")
+    return "".join(parts).encode("utf-8")
+
+
+def generate_docx(path, size, omml_density=0.3, seed=0):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        docx.writestr("_rels/.rels", _DOCX_RELS)
+        docx.writestr("word/document.xml", generate_docx_xml(size, omml_density, seed))
+    return path
+
+
+def generate_zip(path, size, tex_share=0.05, figure_bytes=4 * 1024 * 1024, seed=0):
+    """
+    ZIP-проект размером около size байт: main.tex (tex_share объёма), остальное —
+    несжимаемые «рисунки» по figure_bytes, на которые ссылается документ.
+    """
+    rng = random.Random(seed)
+    tex_size = max(2048, int(size * tex_share))
+    figures_total = max(size - tex_size, 0)
+    count = max(1, -(-figures_total // figure_bytes)) if figures_total else 0
+
+    body = generate_latex_body(tex_size, seed=seed)
+    figures = "\n".join(f"\\includegraphics{{figures/fig{i}.png}}" for i in range(count))
+    tex = (
+        "\\documentclass{article}\n\\usepackage{graphicx}\n\\begin{document}\n"
+        + body + figures + "\n\\end{document}\n"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("main.tex", tex)
+        remaining = figures_total
+        for i in range(count):
+            chunk = min(figure_bytes, remaining)
+            remaining -= chunk
+            # Рисунки уже сжаты — храним как есть, как это делают архивы arXiv
+            archive.writestr(f"figures/fig{i}.png", rng.randbytes(chunk), compress_type=zipfile.ZIP_STORED)
+    return path
@@ -0,0 +1,373 @@
+# bench_pipeline.py
+"""
+Замер локальных (без сети) этапов конвейера на синтетическом корпусе разного
+размера: маскирование и сборка в translate_body, разбиение на чанки, заглушки,
+add_russian_preamble, формулы и абзацы .docx, перепаковка ZIP.
+
+Перевод выполняет бэкенд-заглушка (TRANSLATION_BACKEND=stub) в одном потоке,
+кэш переводов и подбор чанков отключены — измеряется только наш код.
+Для каждого этапа и размера печатаются лучшее время из нескольких повторов,
+пропускная способность и пиковая память (tracemalloc, отдельным прогоном).
+По двум последним размерам оценивается показатель роста t ~ size^k
+(k≈1 — линейный этап, k≈2 — квадратичный); если прогноз для следующего
+размера больше --budget секунд, он пропускается (квадратичный этап на 50 МБ
+не дождаться).
+
+    python bench_pipeline.py [--sizes 10K,100K,1M,10M,50M] [--stages tex_translate,zip_rewrite]
+                             [--json pipeline.json] [--compare baseline.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+DEFAULT_SIZES = "10K,100K,1M,10M,50M"
+DEFAULT_BUDGET = 60.0
+# Во сколько раз этап должен замедлиться относительно базового прогона, чтобы считаться регрессией
+REGRESSION_RATIO = 1.25
+# Замеры короче этого слишком шумные для сравнения
+MIN_COMPARE_SECONDS = 0.001
+# Повторяем замер, пока суммарное время меньше этого порога (не больше --repeat раз)
+MIN_TOTAL_SECONDS = 0.5
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def _configure_environment(work_dir):
+    """Окружение без сети и побочных файлов; вызывается до импорта модулей конвейера"""
+    os.environ["TRANSLATION_BACKEND"] = "stub"
+    os.environ["TRANSLATION_CONCURRENCY"] = "1"
+    os.environ["TRANSLATION_CACHE"] = "0"
+    os.environ["ADAPTIVE_CHUNKS"] = "0"
+    os.environ["MODEL_STATS_PATH"] = os.path.join(work_dir, "model_stats.json")
+    os.environ["TQDM_DISABLE"] = "1"
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ("G", "M", "K"):
+        if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+            return f"{size // _UNITS[unit]}{unit}"
+    return str(size)
+
+
+# --- Этапы: setup(size, work_dir) готовит данные (не замеряется), run(state) — замеряемая часть ---
+
+_latex_cache = {}
+
+
+def _latex(size):
+    from bench_corpus import generate_latex
+    if size not in _latex_cache:
+        _latex_cache.clear()  # держим в памяти только текущий размер
+        _latex_cache[size] = generate_latex(size)
+    return _latex_cache[size]
+
+
+def _setup_latex(size, work_dir):
+    return _latex(size)
+
+
+def _run_tex_translate(content):
+    from translate_tex import translate_latex_text
+    translate_latex_text(content, max_chunk_size=2000)
+
+
+def _run_tex_segments(content):
+    from segment_map import extract_segment_markers
+    from translate_tex import translate_latex_text
+    segments = []
+    extract_segment_markers(translate_latex_text(content, max_chunk_size=2000, segments=segments), segments)
+
+
+def _run_chunk_sentences(content):
+    from common import chunk_text_by_sentences_safe
+    chunk_text_by_sentences_safe(content, max_tokens=500)
+
+
+def _setup_placeholders(size, work_dir):
+    import re
+    blocks = []
+
+    def protect(match):
+        blocks.append(match.group(0))
+        return f"__PROTECTED_{len(blocks) - 1}__"
+
+    masked = re.sub(r'\$[^$]+\$|\\(?:cite|ref|label)\{[^}]*\}', protect, _latex(size))
+    return masked, blocks
+
+
+def _run_placeholders(state):
+    import translation_cache
+    from translate_tex import _restore_protected
+    masked, blocks = state
+    normalized, mapping = translation_cache.normalize_placeholders(masked)
+    _restore_protected(translation_cache.restore_placeholders(normalized, mapping), blocks)
+
+
+def _run_russian_preamble(content):
+    from translate_tex import add_russian_preamble
+    add_russian_preamble(content)
+
+
+def _run_docx_mask_formulas(content):
+    from translate_docx import mask_text_formulas, unmask_text_formulas
+    unmask_text_formulas(*mask_text_formulas(content))
+
+
+def _setup_docx_xml(size, work_dir):
+    from bench_corpus import generate_docx_xml
+    return generate_docx_xml(size)
+
+
+def _run_docx_story_part(xml_bytes):
+    from docx_package import translate_story_part
+    translate_story_part(xml_bytes)
+
+
+def _setup_docx_file(size, work_dir):
+    from bench_corpus import generate_docx
+    return generate_docx(os.path.join(work_dir, f"bench_{size}.docx"), size)
+
+
+def _run_docx_rebuild(path):
+    # Прежний путь через python-docx: извлечь абзац с OMML и собрать его заново
+    from docx import Document
+    from translate_docx import extract_paragraph_with_math, rebuild_paragraph_with_math
+    document = Document(path)
+    for paragraph in document.paragraphs:
+        text, math_elements = extract_paragraph_with_math(paragraph)
+        rebuild_paragraph_with_math(paragraph, text, math_elements)
+    document.save(io.BytesIO())
+
+
+def _setup_zip(size, work_dir):
+    from bench_corpus import generate_zip
+    source = os.path.join(work_dir, f"bench_{size}.zip")
+    if not os.path.exists(source):
+        for name in os.listdir(work_dir):
+            if name.startswith("bench_") and name.endswith(".zip"):
+                os.remove(os.path.join(work_dir, name))
+        generate_zip(source, size)
+    return source, work_dir
+
+
+def _run_zip_rewrite(state):
+    from zip_utils import rewrite_zip_members
+    source, work_dir = state
+    target = os.path.join(work_dir, "rewrite.zip")
+    shutil.copyfile(source, target)
+    rewrite_zip_members(target, {"main.tex": b"\\documentclass{article}\n"})
+
+
+def _run_zip_translate(state):
+    from translate_tex import process_zip_for_translation
+    source, work_dir = state
+    output_dir = os.path.join(work_dir, "out")
+    os.makedirs(output_dir, exist_ok=True)
+    process_zip_for_translation(source, output_dir)
+
+
+# имя: (описание, подготовка, замер, необходимые пакеты)
+STAGES = {
+    "tex_translate": ("translate_latex_text: маскирование, чанки, сборка", _setup_latex, _run_tex_translate, ()),
+    "tex_segments": ("то же с маркерами фрагментов", _setup_latex, _run_tex_segments, ()),
+    "chunk_sentences": ("chunk_text_by_sentences_safe", _setup_latex, _run_chunk_sentences, ()),
+    "placeholders": ("нормализация и восстановление заглушек", _setup_placeholders, _run_placeholders, ()),
+    "russian_preamble": ("add_russian_preamble", _setup_latex, _run_russian_preamble, ()),
+    "docx_mask_formulas": ("mask/unmask_text_formulas", _setup_latex, _run_docx_mask_formulas, ()),
+    "docx_story_part": ("translate_story_part (lxml)", _setup_docx_xml, _run_docx_story_part, ("lxml",)),
+    "docx_rebuild": ("python-docx: extract/rebuild_paragraph_with_math", _setup_docx_file, _run_docx_rebuild, ("docx",)),
+    "zip_rewrite": ("rewrite_zip_members (копирование без распаковки)", _setup_zip, _run_zip_rewrite, ()),
+    "zip_translate": ("process_zip_for_translation: распаковка, перевод, упаковка", _setup_zip, _run_zip_translate, ()),
+}
+
+
+def _missing_packages(packages):
+    import importlib.util
+    return [name for name in packages if importlib.util.find_spec(name) is None]
+
+
+def measure(run, state, repeat, with_memory=True):
+    """(лучшее_время_с, пик_памяти_байт или None)"""
+    timings = []
+    while len(timings) < repeat:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            run(state)
+            timings.append(time.perf_counter() - started)
+        if sum(timings) >= MIN_TOTAL_SECONDS:
+            break
+
+    peak = None
+    if with_memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run(state)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return min(timings), peak
+
+
+def scaling_exponent(points):
+    """k в t ~ size^k по двум последним замерам [(size, seconds)] или None"""
+    if len(points) < 2:
+        return None
+    (size_a, time_a), (size_b, time_b) = points[-2:]
+    if size_a == size_b or time_a <= 0 or time_b <= 0:
+        return None
+    return math.log(time_b / time_a) / math.log(size_b / size_a)
+
+
+def run_benchmarks(stage_names, sizes, work_dir, repeat=3, budget=DEFAULT_BUDGET, with_memory=True):
+    results = []
+    for name in stage_names:
+        description, setup, run, packages = STAGES[name]
+        print(f"\n▶ {name} — {description}")
+        missing = _missing_packages(packages)
+        if missing:
+            print(f"  ⏭️ пропуск: не установлены {', '.join(missing)}")
+            continue
+        points = []
+        for size in sizes:
+            if points:
+                last_size, last_seconds = points[-1]
+                # Мелкие размеры шумные — растёт хотя бы линейно
+                exponent = max(scaling_exponent(points) or 1.0, 1.0)
+                predicted = last_seconds * (size / last_size) ** exponent
+                if predicted > budget:
+                    print(f"  {format_size(size):>6}  ⏭️ пропуск (прогноз {predicted:.0f} с > {budget:.0f} с)")
+                    results.append({"stage": name, "size_bytes": size, "skipped": True})
+                    continue
+            state = setup(size, work_dir)
+            seconds, peak = measure(run, state, repeat, with_memory)
+            points.append((size, seconds))
+            throughput = size / seconds / _UNITS["M"] if seconds > 0 else None
+            peak_text = f"{peak / _UNITS['M']:>8.1f} МБ" if peak is not None else "       —"
+            print(
+                f"  {format_size(size):>6}  {seconds * 1000:>10.1f} мс  "
+                f"{throughput or 0:>8.1f} МБ/с  пик {peak_text}"
+            )
+            results.append({
+                "stage": name,
+                "size_bytes": size,
+                "seconds": round(seconds, 6),
+                "mb_per_s": round(throughput, 3) if throughput else None,
+                "peak_mb": round(peak / _UNITS["M"], 3) if peak is not None else None,
+            })
+        exponent = scaling_exponent(points)
+        if exponent is not None:
+            verdict = "линейно" if exponent < 1.3 else "сверхлинейно" if exponent < 1.7 else "квадратично"
+            print(f"  рост: t ~ size^{exponent:.2f} ({verdict})")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Печатает изменения относительно сохранённого прогона; возвращает число регрессий"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {
+        (item["stage"], item["size_bytes"]): item
+        for item in baseline.get("results", []) if not item.get("skipped")
+    }
+
+    print(f"\n📊 Сравнение с {baseline_path} (коммит {baseline.get('meta', {}).get('commit') or '?'}):")
+    regressions = 0
+    for item in results:
+        before = previous.get((item["stage"], item["size_bytes"]))
+        if before is None or item.get("skipped"):
+            continue
+        if max(before["seconds"], item["seconds"]) < MIN_COMPARE_SECONDS:
+            continue
+        ratio = item["seconds"] / before["seconds"] if before["seconds"] else 1.0
+        mark = "  "
+        if ratio > REGRESSION_RATIO:
+            mark = "🔺"
+            regressions += 1
+        elif ratio < 1 / REGRESSION_RATIO:
+            mark = "🔻"
+        print(
+            f"  {mark} {item['stage']:<20} {format_size(item['size_bytes']):>6}  "
+            f"{before['seconds'] * 1000:>10.1f} → {item['seconds'] * 1000:>10.1f} мс  (×{ratio:.2f})"
+        )
+    print(f"  Регрессий (медленнее в {REGRESSION_RATIO}× и более): {regressions}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер локальных этапов конвейера на синтетическом корпусе")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"размеры документов (по умолчанию {DEFAULT_SIZES})")
+    parser.add_argument("--stages", help=f"этапы через запятую: {', '.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="максимум повторов на замер (берётся лучший)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="после замера дольше стольких секунд большие размеры этапа пропускаются")
+    parser.add_argument("--no-memory", action="store_true", help="не замерять пиковую память (быстрее)")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прежнего прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    sizes = sorted(parse_size(size) for size in args.sizes.split(","))
+    stage_names = [name.strip() for name in args.stages.split(",")] if args.stages else list(STAGES)
+    unknown = [name for name in stage_names if name not in STAGES]
+    if unknown:
+        parser.error(f"неизвестные этапы: {', '.join(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    _configure_environment(work_dir)
+    print(f"⏱️ Этапы конвейера, размеры: {', '.join(format_size(size) for size in sizes)}")
+    try:
+        results = run_benchmarks(stage_names, sizes, work_dir, args.repeat, args.budget, not args.no_memory)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"\n💾 Результаты: {args.json}")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
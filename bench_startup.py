@@ -0,0 +1,90 @@
+# bench_startup.py
+"""
+Замер времени запуска: сколько стоит импорт для каждого режима и типа файла.
+
+Каждый сценарий запускается в отдельном процессе интерпретатора несколько раз,
+печатается медиана времени и список тяжёлых зависимостей, которые он загрузил.
+Сценарий «всё сразу» воспроизводит прежнее поведение main.py (все модули при старте).
+
+    python bench_startup.py [--runs 7] [--json startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("requests", "tqdm", "docx", "lxml", "dotenv")
+
+SCENARIOS = [
+    ("CLI (меню/--help)", "import main"),
+    ("компиляция .tex/.zip", "import main, formats; formats.preload('a.tex', translate=False, compile_after=True)"),
+    ("перевод .tex", "import main, formats; formats.preload('a.tex')"),
+    ("перевод .tex + компиляция", "import main, formats; formats.preload('a.zip', compile_after=True)"),
+    ("перевод .docx", "import main, formats; formats.preload('a.docx')"),
+    ("всё сразу", "import requests, dotenv, docx, common, translate_tex, translate_docx, docx_package, "
+                  "pdf_converter, compile_pool"),
+]
+
+_PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "{code}\n"
+    "elapsed = time.perf_counter() - started\n"
+    "heavy = [m for m in {heavy!r} if m in sys.modules]\n"
+    "print(repr((elapsed, heavy)))\n"
+)
+
+
+def run_scenario(code, runs):
+    """Возвращает (медиана_процесса_с, медиана_импорта_с, загруженные_тяжёлые_модули)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = _PROBE.format(code=code, heavy=HEAVY_MODULES)
+    process_times = []
+    import_times = []
+    heavy = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", probe],
+            cwd=here, capture_output=True, text=True, check=True,
+        )
+        process_times.append(time.perf_counter() - started)
+        elapsed, heavy = eval(result.stdout.strip().splitlines()[-1])
+        import_times.append(elapsed)
+    return statistics.median(process_times), statistics.median(import_times), heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер времени запуска LLM-Translator")
+    parser.add_argument("--runs", type=int, default=7, help="запусков на сценарий")
+    parser.add_argument("--json", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    print(f"⏱️ Время запуска (медиана из {args.runs}):")
+    print(f"  {'сценарий':<28} {'процесс':>9} {'импорт':>9}  тяжёлые зависимости")
+    report = []
+    for name, code in SCENARIOS:
+        try:
+            process_time, import_time, heavy = run_scenario(code, args.runs)
+        except subprocess.CalledProcessError as e:
+            print(f"  {name:<28} ❌ {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+            continue
+        print(f"  {name:<28} {process_time * 1000:>7.0f}мс {import_time * 1000:>7.0f}мс  {', '.join(heavy) or '—'}")
+        report.append({
+            "scenario": name,
+            "process_ms": round(process_time * 1000, 1),
+            "import_ms": round(import_time * 1000, 1),
+            "heavy_modules": heavy,
+        })
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"💾 Результаты: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
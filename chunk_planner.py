@@ -0,0 +1,193 @@
+# chunk_planner.py
+"""
+Подбор размера чанка по наблюдаемой скорости модели.
+
+Крупные чанки — меньше запросов, но дольше хвост задержки и чаще обрезанный
+ответ (finish_reason=length); лучший размер у каждой модели свой. Для каждой
+модели копятся последние наблюдения (размер запроса, задержка, обрезан ли
+ответ, ошибка) в .cache/model_stats.json, и по ним оценивается:
+
+    задержка(s) ≈ a + b·s                  (МНК по успешным запросам)
+    неудача(s)  — доля обрезанных/ошибочных запросов близкого размера
+    время(s)    ≈ ⌈⌈N/s⌉ / C⌉ · задержка(s) / (1 − неудача(s))
+
+где N — объём текста, C — число одновременных запросов. Выбирается размер
+с минимальным временем. Пока наблюдений мало, используется DEFAULT_CHUNK_CHARS.
+"""
+import atexit
+import heapq
+import json
+import math
+import os
+import threading
+
+MODEL_STATS_PATH = os.path.abspath(
+    os.getenv("MODEL_STATS_PATH", os.path.join(".cache", "model_stats.json"))
+)
+
+DEFAULT_CHUNK_CHARS = 2000
+CANDIDATE_CHUNK_CHARS = (800, 1200, 1600, 2000, 3000, 4000, 6000)
+MIN_OBSERVATIONS = 10
+MAX_OBSERVATIONS = 300
+
+# Предел длины ответа: русский текст ~0.5 токена на символ исходника, с запасом
+# на разметку; короткому чанку — короткий предел, оборвавшийся ответ дописывается
+OUTPUT_TOKENS_PER_CHAR = 0.6
+OUTPUT_TOKENS_MARGIN = 256
+MIN_OUTPUT_TOKENS = 256
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", "16000"))
+
+_SAVE_EVERY = 20
+
+_lock = threading.Lock()
+_stats = None
+_unsaved = 0
+
+
+def is_enabled():
+    return os.getenv("ADAPTIVE_CHUNKS", "1") != "0"
+
+
+def _load():
+    global _stats
+    if _stats is None:
+        try:
+            with open(MODEL_STATS_PATH, "r", encoding="utf-8") as f:
+                _stats = json.load(f)
+        except (OSError, ValueError):
+            _stats = {}
+        atexit.register(save)
+    return _stats
+
+
+def save():
+    """Сохраняет накопленные наблюдения (атомарно)"""
+    global _unsaved
+    with _lock:
+        if _stats is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(MODEL_STATS_PATH), exist_ok=True)
+            tmp_path = MODEL_STATS_PATH + f".tmp{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(_stats, f)
+            os.replace(tmp_path, MODEL_STATS_PATH)
+            _unsaved = 0
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить статистику моделей: {e}")
+
+
+def record(model, chars, latency, ok=True, truncated=False):
+    """Запоминает результат одного запроса к модели"""
+    global _unsaved
+    if not model:
+        return
+    with _lock:
+        observations = _load().setdefault(model, [])
+        observations.append([chars, round(latency, 3), int(bool(ok)), int(bool(truncated))])
+        del observations[:-MAX_OBSERVATIONS]
+        _unsaved += 1
+        flush = _unsaved >= _SAVE_EVERY
+    if flush:
+        save()
+
+
+def _observations(model):
+    with _lock:
+        return list(_load().get(model, []))
+
+
+def _fit_latency(observations):
+    """(a, b) для задержка ≈ a + b·символы по успешным запросам"""
+    points = [(chars, latency) for chars, latency, ok, truncated in observations if ok and not truncated]
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        # Все запросы одного размера — задержка пропорциональна размеру
+        return 0.0, mean_y / max(mean_x, 1)
+    b = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    b = max(b, 0.0)
+    a = max(mean_y - b * mean_x, 0.0)
+    return a, b
+
+
+def _failure_rate(observations, size):
+    """Доля обрезанных или неудачных запросов размера около size (со сглаживанием)"""
+    near = [(ok, truncated) for chars, _, ok, truncated in observations if size / 1.5 <= chars <= size * 1.5]
+    failures = sum(1 for ok, truncated in near if truncated or not ok)
+    # Сглаживание Лапласа: без данных — 1 неудача на 20 запросов
+    rate = (failures + 0.5) / (len(near) + 10)
+    if not near:
+        # Выше наблюдавшегося диапазона размеров — не доверяем экстраполяции
+        largest = max(chars for chars, _, _, _ in observations)
+        if size > largest * 1.5:
+            rate = max(rate, 0.5)
+    return min(rate, 0.95)
+
+
+def estimate_time(observations, size, total_chars, concurrency=1):
+    fit = _fit_latency(observations)
+    if fit is None:
+        return None
+    a, b = fit
+    requests = math.ceil(total_chars / size)
+    waves = math.ceil(requests / max(concurrency, 1))
+    return waves * (a + b * min(size, total_chars)) / (1 - _failure_rate(observations, size))
+
+
+def plan_chunk_size(model, total_chars, concurrency=1):
+    """Размер чанка (в символах), минимизирующий общее время перевода total_chars"""
+    if not is_enabled() or not model:
+        return DEFAULT_CHUNK_CHARS
+    observations = _observations(model)
+    if len(observations) < MIN_OBSERVATIONS:
+        return DEFAULT_CHUNK_CHARS
+
+    best_size, best_time = DEFAULT_CHUNK_CHARS, None
+    for size in CANDIDATE_CHUNK_CHARS:
+        estimate = estimate_time(observations, size, max(total_chars, 1), concurrency)
+        if estimate is not None and (best_time is None or estimate < best_time):
+            best_size, best_time = size, estimate
+    return best_size
+
+
+def estimate_wall_time(model, sizes, concurrency=1):
+    """
+    Время перевода запросов размеров sizes (в символах, в порядке отправки) при
+    concurrency одновременных запросах: задержка каждого — по той же модели
+    задержки и неудач; None, если наблюдений для оценки нет.
+    """
+    observations = _observations(model)
+    fit = _fit_latency(observations)
+    if fit is None or not sizes:
+        return None
+    a, b = fit
+    # Каждый запрос берёт первый освободившийся слот
+    slots = [0.0] * max(concurrency, 1)
+    for size in sizes:
+        started = heapq.heappop(slots)
+        heapq.heappush(slots, started + (a + b * size) / (1 - _failure_rate(observations, size)))
+    return max(slots)
+
+
+def max_output_tokens(chars):
+    """Предел длины ответа для запроса из chars символов"""
+    limit = int(chars * OUTPUT_TOKENS_PER_CHAR) + OUTPUT_TOKENS_MARGIN
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, limit))
+
+
+def describe(model):
+    """Краткая сводка по модели для вывода пользователю"""
+    observations = _observations(model)
+    if not observations:
+        return f"{model}: наблюдений нет"
+    fit = _fit_latency(observations)
+    truncated = sum(1 for _, _, _, t in observations if t)
+    text = f"{model}: {len(observations)} запросов, обрезано {truncated}"
+    if fit:
+        text += f", задержка ≈ {fit[0]:.1f} с + {fit[1] * 1000:.2f} с/1000 симв."
+    return text
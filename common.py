@@ -1,9 +1,12 @@
 # common.py
 import os
-import requests
-from tqdm import tqdm
-from dotenv import load_dotenv
 import re
+import threading
+
+import tracing
+
+# requests и python-dotenv импортируются по требованию: режиму компиляции они
+# не нужны, а запуск без них заметно быстрее (см. bench_startup.py)
 
 # Настройки
 INPUT_DIR = "inputs"
@@ -53,9 +56,17 @@ TRANSLATABLE_ENVIRONMENTS = {
 }
 
 # Глобальные переменные
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-OPENROUTER_API_KEY = None
+TRANSLATION_BACKEND = None  # см. translation_backends
 CURRENT_MODEL = None
+TARGET_LANGUAGE = None  # см. languages; None — TARGET_LANGUAGE из .env или русский
+
+# Сколько раз дозапрашивать продолжение ответа, оборванного по max_tokens
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "3"))
+# Обрезанные ответы: сколько было, сколько запросов-продолжений, сколько так и не дописано
+truncation_stats = {"truncated": 0, "continuations": 0, "unfinished": 0}
+_stats_lock = threading.Lock()
+# Запросы к API текущего потока (см. request_usage)
+_request_usage = threading.local()
 
 # Рекомендуемые платные модели (дешёвые и качественные для перевода)
 PAID_MODELS = [
@@ -103,11 +114,24 @@ FREE_MODELS = [
 
 
 def load_env_vars():
-    global OPENROUTER_API_KEY
+    """Читает .env и настраивает бэкенд перевода (ValueError, если не хватает ключа)"""
+    global TRANSLATION_BACKEND
+    from dotenv import load_dotenv
+    from translation_backends import get_backend
     load_dotenv()
-    OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-    if not OPENROUTER_API_KEY:
-        raise ValueError("❌ OPENROUTER_API_KEY не найден в .env. Добавьте его.")
+    TRANSLATION_BACKEND = get_backend()
+
+
+def get_translation_backend():
+    """Текущий бэкенд перевода; .env загружается при первом обращении"""
+    if TRANSLATION_BACKEND is None:
+        load_env_vars()
+    return TRANSLATION_BACKEND
+
+
+def _model_key(model):
+    # Один и тот же ID модели у разных бэкендов — разные модели (кэш, статистика)
+    return f"{get_translation_backend().name}:{model}"
 
 
 def set_current_model(model_name):
@@ -119,31 +143,33 @@ def get_current_model():
     return CURRENT_MODEL
 
 
+def set_target_language(lang):
+    global TARGET_LANGUAGE
+    from languages import get_language
+    get_language(lang)
+    TARGET_LANGUAGE = lang
+
+
+def get_target_language():
+    from languages import DEFAULT_LANGUAGE
+    return TARGET_LANGUAGE or os.getenv("TARGET_LANGUAGE", DEFAULT_LANGUAGE).strip().lower()
+
+
 def test_model_connection(model_name, silent=False):
     """Проверяет подключение к модели"""
+    backend = get_translation_backend()
     if not silent:
-        print(f"🔌 Проверка модели: {model_name}...", end=" ")
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": "https://github.com/llm-translator",
-        "X-Title": "LLM Translator"
-    }
-    payload = {
-        "model": model_name,
-        "messages": [{"role": "user", "content": "test"}],
-        "max_tokens": 10
-    }
+        print(f"🔌 Проверка модели: {model_name} ({backend.label})...", end=" ")
+
     try:
-        response = requests.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=15)
-        if response.status_code == 200:
+        completion = backend.complete(model_name, "test", 10, timeout=15)
+        if completion.status == 200:
             if not silent:
                 print("✅")
             return True
         else:
             if not silent:
-                print(f"❌ (HTTP {response.status_code})")
+                print(f"❌ (HTTP {completion.status})")
             return False
     except Exception as e:
         if not silent:
@@ -164,8 +190,27 @@ def auto_select_free_model():
     return None
 
 
+def _select_backend_model(backend):
+    """Выбор модели для бэкенда, отличного от OpenRouter (свой список моделей)"""
+    print(f"\n🤖 Бэкенд перевода: {backend.describe()}")
+    while True:
+        default = backend.default_model
+        prompt = f"Введите ID модели [{default}]: " if default else "Введите ID модели: "
+        model = input(prompt).strip() or default
+        if model and test_model_connection(model):
+            print(f"✅ Выбрана модель: {model}")
+            return model
+        retry = input("Попробовать снова? (y/n): ").strip().lower()
+        if retry != 'y':
+            raise Exception("❌ Не удалось выбрать модель для перевода.")
+
+
 def select_translation_model():
     """Интерактивный выбор модели с возможностью автоперебора"""
+    backend = get_translation_backend()
+    if backend.name != "openrouter":
+        return _select_backend_model(backend)
+
     print("\n" + "="*70)
     print("🤖 ВЫБОР МОДЕЛИ ДЛЯ ПЕРЕВОДА")
     print("="*70)
@@ -244,11 +289,17 @@ def select_translation_model():
     raise Exception("❌ Не удалось выбрать модель для перевода.")
 
 
-def chunk_text_by_sentences_safe(text, max_tokens=1500):
-    """Разбивает текст на чанки по предложениям"""
+def chunk_text_by_sentences_safe(text, max_tokens=None):
+    """
+    Разбивает текст на чанки по предложениям.
+    max_tokens=None — размер подбирает chunk_planner по статистике текущей модели.
+    """
     if not text.strip():
         return [text]
 
+    if max_tokens is None:
+        max_tokens = plan_chunk_chars(len(text)) // 4
+
     sentences = re.split(r'(?<=[.!?])\s+(?=[A-ZА-Я\d(])', text.strip())
     if not sentences:
         return [text]
@@ -277,13 +328,186 @@ def chunk_text_by_sentences_safe(text, max_tokens=1500):
     return chunks
 
 
-def translate_chunk(text, retries=3):
-    """Переводит один чанк текста через OpenRouter"""
+def plan_chunk_chars(total_chars):
+    """Размер чанка для текста из total_chars символов (см. chunk_planner)"""
+    from chunk_planner import plan_chunk_size
+    backend = get_translation_backend()
+    return plan_chunk_size(_model_key(get_current_model()), total_chars, backend.concurrency)
+
+
+def estimate_wall_time(sizes):
+    """Время перевода запросов размеров sizes текущей моделью (см. chunk_planner.estimate_wall_time)"""
+    from chunk_planner import estimate_wall_time as estimate
+    backend = get_translation_backend()
+    return estimate(_model_key(get_current_model()), sizes, backend.concurrency)
 
-    if re.fullmatch(r'[\s\\{}\[\]_^&$__PROTECTED_\d+__]+', text):
-        return text
-
-    prompt = f"""Переведи весь английский текст на русский. КРИТИЧЕСКИ ВАЖНО:
+
+def translate_chunks(chunks, desc="Перевод", lang=None):
+    """
+    Переводит список чанков, держа одновременно до backend.concurrency запросов.
+    Порядок результатов совпадает с порядком чанков.
+    """
+    return translate_jobs([(chunk, lang) for chunk in chunks], desc)
+
+
+def translate_jobs(jobs, desc="Перевод"):
+    """
+    Переводит пары (чанк, язык) общим пулом: при переводе на несколько языков
+    кэш, ограничение параллельности и клиент бэкенда общие для всех языков.
+    В режиме координатора (см. work_queue) чанки переводят воркеры.
+    """
+    import translation_budget
+    import work_queue
+    if work_queue.get_queue_path() and not translation_budget.is_dry_run():
+        return work_queue.run_jobs(jobs, desc, get_current_model())
+
+    from tqdm import tqdm
+
+    def run(job):
+        return translate_chunk(job[0], lang=job[1])
+
+    workers = min(get_translation_backend().concurrency, len(jobs))
+    with tracing.span("translate.chunks", chunks=len(jobs), workers=workers):
+        if workers <= 1:
+            return [run(job) for job in tqdm(jobs, desc=desc)]
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translate") as pool:
+            return list(tqdm(pool.map(run, jobs), total=len(jobs), desc=desc))
+
+
+def _count_truncation(kind):
+    with _stats_lock:
+        truncation_stats[kind] += 1
+
+
+def reset_truncation_stats():
+    for kind in truncation_stats:
+        truncation_stats[kind] = 0
+
+
+def print_truncation_report():
+    """Печатает счётчики обрезанных ответов, если такие были"""
+    if truncation_stats["truncated"]:
+        print(
+            f"✂️ Обрезанных ответов: {truncation_stats['truncated']}, "
+            f"запросов-продолжений: {truncation_stats['continuations']}, "
+            f"не дописано: {truncation_stats['unfinished']}"
+        )
+
+
+def _acquire_quota(backend, prompt, text, lang):
+    """
+    Ждёт разрешения общей для всех процессов квоты ключа API (см. shared_quota).
+    Возвращает (ключ, оценка токенов) для _settle_quota или None — квоты нет.
+    """
+    import shared_quota
+    import translation_budget
+
+    key = backend.quota_key() if shared_quota.is_enabled() else None
+    if key is None:
+        return None
+    tokens = translation_budget.estimate_tokens(prompt) + translation_budget.estimate_completion_tokens(text, lang)
+    shared_quota.acquire(key, tokens)
+    return key, tokens
+
+
+def _settle_quota(permit, completion):
+    """
+    Сообщает квоте итог запроса: 429 — общая пауза, usage — фактический расход;
+    completion=None — запрос не состоялся, токены возвращаются.
+    """
+    if permit is None:
+        return
+    import shared_quota
+
+    key, tokens = permit
+    if completion is None:
+        shared_quota.settle(key, tokens, {})
+        return
+    shared_quota.report(key, completion.status, completion.retry_after)
+    shared_quota.settle(key, tokens, completion.usage if completion.status == 200 else {})
+
+
+def _send(backend, model, prompt, text, max_tokens, lang, continue_from=None):
+    """
+    Один запрос к модели в пределах лимита расхода и общей квоты: резерв и
+    разрешение берутся до запроса и уточняются по ответу. Неудачный запрос —
+    и тот, что оборвался исключением (таймаут, обрыв соединения), — не
+    оплачивается: резерв возвращается. BudgetExceeded — запрос не отправлен.
+    """
+    import time
+
+    import translation_budget
+
+    estimated_prompt = prompt if continue_from is None else prompt + continue_from
+    reserved = translation_budget.reserve(estimated_prompt, text, lang)
+    permit = None
+    completion = None
+    started = time.monotonic()
+    try:
+        permit = _acquire_quota(backend, estimated_prompt, text, lang)
+        completion = backend.complete(model, prompt, max_tokens, source=text, continue_from=continue_from)
+    finally:
+        paid = completion is not None and completion.status == 200
+        translation_budget.settle(reserved, completion.usage if paid else {})
+        _settle_quota(permit, completion)
+        _count_request(completion, estimated_prompt, text, lang, time.monotonic() - started)
+    return completion
+
+
+def _count_request(completion, prompt, text, lang, seconds):
+    """Учитывает отправленный запрос: токены по usage ответа, без него — по оценке"""
+    import translation_budget
+
+    tokens = 0
+    if completion is not None and completion.status == 200:
+        usage = completion.usage or {}
+        tokens = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+        if not tokens:
+            tokens = translation_budget.estimate_tokens(prompt) + translation_budget.estimate_completion_tokens(text, lang)
+    _request_usage.requests = getattr(_request_usage, "requests", 0) + 1
+    _request_usage.tokens = getattr(_request_usage, "tokens", 0) + tokens
+    _request_usage.seconds = getattr(_request_usage, "seconds", 0.0) + seconds
+
+
+def request_usage():
+    """
+    (запросов, токенов, секунд) к API из текущего потока с начала работы.
+    Ответы из кэша, памяти переводов и пропущенные фильтром фрагменты сюда не
+    попадают; неудачные запросы считаются без токенов.
+    """
+    return (
+        getattr(_request_usage, "requests", 0),
+        getattr(_request_usage, "tokens", 0),
+        getattr(_request_usage, "seconds", 0.0),
+    )
+
+
+def _continue_truncated(backend, model, prompt, text, max_tokens, partial, lang):
+    """
+    Дозапрашивает продолжение ответа, оборванного по max_tokens, вместо
+    повторного перевода всего чанка. Возвращает (текст, дописан_ли_полностью).
+    """
+    for _ in range(MAX_CONTINUATIONS):
+        _count_truncation("continuations")
+        with tracing.span("api.continuation", "api", chars=len(partial)) as span_args:
+            completion = _send(backend, model, prompt, text, max_tokens, lang, continue_from=partial)
+            span_args["finish_reason"] = completion.finish_reason
+        if not completion.ok:
+            return partial, False
+        partial += completion.text
+        if not completion.truncated:
+            return partial, True
+    return partial, False
+
+
+def build_prompt(text, lang):
+    """Промпт перевода на язык lang (см. languages)"""
+    from languages import get_language
+    language = get_language(lang)
+    introduction, parameter, value = language["examples"]
+    return f"""Переведи весь английский текст на {language['prompt']}. КРИТИЧЕСКИ ВАЖНО:
 
 1. Переводи АБСОЛЮТНО ВСЁ что является текстом (слова, заголовки, подписи, содержимое таблиц)
 2. НЕ ТРОГАЙ:
@@ -291,8 +515,8 @@ def translate_chunk(text, retries=3):
    - LaTeX команды: \\section, \\caption, \\textbf, \\begin, \\end
    - Структуру таблиц: &, \\\\, \\hline
    - Маркеры __PROTECTED_N__
-3. Переводи содержимое внутри фигурных скобок: \\section{{Introduction}} → \\section{{Введение}}
-4. Переводи содержимое таблиц: Parameter → Параметр, Value → Значение
+3. Переводи содержимое внутри фигурных скобок: \\section{{Introduction}} → \\section{{{introduction}}}
+4. Переводи содержимое таблиц: Parameter → {parameter}, Value → {value}
 5. НЕ добавляй комментарии, пояснения, не пиши "Вот перевод"
 
 Текст для перевода:
@@ -300,41 +524,122 @@ def translate_chunk(text, retries=3):
 
 Переведённый текст:"""
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": "https://github.com/llm-translator",
-        "X-Title": "LLM Translator"
-    }
-
-    payload = {
-        "model": get_current_model(),
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 4000,
-        "temperature": 0.2,
-        "top_p": 0.95
-    }
 
+def translate_chunk(text, retries=3, lang=None, model=None):
+    """
+    Переводит один чанк текста через выбранный бэкенд (см. translation_backends)
+    на язык lang (None — get_target_language()) моделью model (None — текущая
+    или уровни моделей, см. translation_tiers).
+    """
+
+    if re.fullmatch(r'[\s\\{}\[\]_^&$__PROTECTED_\d+__]+', text):
+        return text
+
+    lang = lang or get_target_language()
+
+    # Числа, макросы, ссылки, код и уже переведённый текст модели не отправляем
+    import segment_filter
+    if segment_filter.should_skip(text, lang):
+        return text
+
+    # Уровни моделей: быстрая для всего, сильная — где локальные проверки нашли изъян
+    if model is None:
+        import translation_tiers
+        if translation_tiers.is_enabled():
+            return translation_tiers.translate(text, retries, lang)
+        model = get_current_model()
+
+    import time
+    import chunk_planner
+    import translation_budget
+    import translation_cache
+    import translation_memory
+
+    # Заглушки перенумерованы с нуля — одинаковые абзацы дают одинаковый промпт
+    text, placeholders = translation_cache.normalize_placeholders(text)
+
+    prompt = build_prompt(text, lang)
+
+    backend = get_translation_backend()
+    model_key = _model_key(model)
+    # Язык входит в промпт, а значит и в ключ кэша; память переводов — своя для каждого языка
+    memory_key = model_key if lang == "ru" else f"{model_key}>{lang}"
+    key = translation_cache.cache_key(model_key, prompt)
+    with tracing.span("cache.lookup", "cache") as span_args:
+        cached = translation_cache.lookup(key)
+        span_args["hit"] = cached is not None
+    if cached is not None:
+        translation_budget.record_cached()
+        return translation_cache.restore_placeholders(cached, placeholders)
+
+    # Почти такой же фрагмент уже переводился — переиспользуем или даём модели как образец
+    request_prompt = prompt
+    match = None
+    if not translation_cache.is_bypassed():
+        with tracing.span("tm.lookup", "cache") as span_args:
+            match = translation_memory.find(memory_key, text)
+            span_args["similarity"] = match[2] if match else None
+    if match:
+        source, previous, _ = match
+        reused = translation_memory.reuse(source, previous, text)
+        if reused is not None:
+            translation_memory.count("reused")
+            translation_budget.record_cached()
+            translation_cache.store(key, model_key, reused)
+            return translation_cache.restore_placeholders(reused, placeholders)
+        translation_memory.count("referenced")
+        request_prompt = translation_memory.reference_prompt(text, source, previous, lang)
+
+    # Оценка без запросов к API: запрос только учитывается (см. translation_budget)
+    if translation_budget.is_dry_run():
+        translation_budget.record_request(key, request_prompt, text, lang)
+        return translation_cache.restore_placeholders(text, placeholders)
+
+    max_tokens = chunk_planner.max_output_tokens(len(text))
     for attempt in range(retries):
+        started = time.monotonic()
         try:
-            response = requests.post(OPENROUTER_API_URL, json=payload, headers=headers, timeout=120)
-            if response.status_code == 200:
-                result = response.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+            # За лимит расхода не выходим (BudgetExceeded прерывает перевод);
+            # частоту запросов к одному ключу делят все процессы на машине
+            with tracing.span("api.request", "api", chars=len(text), attempt=attempt + 1) as span_args:
+                completion = _send(backend, model, request_prompt, text, max_tokens, lang)
+                span_args["status"] = completion.status
+                span_args["finish_reason"] = completion.finish_reason
+            if completion.status == 200:
+                result = completion.text
+                chunk_planner.record(model_key, len(text), time.monotonic() - started, bool(result), completion.truncated)
+                complete = not completion.truncated
+                if result and completion.truncated:
+                    # Ответ упёрся в max_tokens — просим дописать с места обрыва
+                    _count_truncation("truncated")
+                    result, complete = _continue_truncated(
+                        backend, model, request_prompt, text, max_tokens, result, lang,
+                    )
+                    if not complete:
+                        _count_truncation("unfinished")
                 if result:
-                    return result
-            elif response.status_code == 429:
+                    # Недописанный перевод в кэш не кладём
+                    if complete:
+                        translation_cache.store(key, model_key, result)
+                        translation_memory.add(memory_key, text, result)
+                    return translation_cache.restore_placeholders(result, placeholders)
+            elif completion.status == 429:
                 print(f"⚠️ Rate limit (попытка {attempt+1}/{retries})")
-                import time
-                time.sleep(3)
+                # С общей квотой паузу для всех процессов выдержит следующий _acquire_quota
+                if backend.quota_key() is None:
+                    tracing.traced_sleep(3, "rate_limit.wait")
             else:
-                print(f"⚠️ HTTP {response.status_code} (попытка {attempt+1}/{retries})")
+                chunk_planner.record(model_key, len(text), time.monotonic() - started, ok=False)
+                print(f"⚠️ HTTP {completion.status} (попытка {attempt+1}/{retries})")
+        except translation_budget.BudgetExceeded:
+            raise
         except Exception as e:
+            chunk_planner.record(model_key, len(text), time.monotonic() - started, ok=False)
             print(f"⚠️ Ошибка: {str(e)[:50]} (попытка {attempt+1}/{retries})")
             pass
         if attempt < retries - 1:
-            import time
-            time.sleep(2)
-    return text
+            tracing.traced_sleep(2, "retry.backoff")
+    return translation_cache.restore_placeholders(text, placeholders)
 
 
 def get_files_list(directory):
@@ -357,3 +662,33 @@ def select_file_by_number(total_count):
                 print(f"❌ Номер должен быть от 1 до {total_count}.")
         except ValueError:
             print("❌ Введите число.")
+
+
+def select_files_by_numbers(total_count):
+    """Выбор одного или нескольких файлов: «2», «1,3», «1-4» или «all»"""
+    while True:
+        raw = input(f"\nВыберите номера файлов (1-{total_count}; например 1,3 или 1-4; all — все): ").strip().lower()
+        if raw in ('all', '*'):
+            return list(range(1, total_count + 1))
+
+        choices = []
+        try:
+            for part in raw.replace(' ', '').split(','):
+                if not part:
+                    continue
+                if '-' in part:
+                    start, end = (int(x) for x in part.split('-', 1))
+                    choices.extend(range(start, end + 1))
+                else:
+                    choices.append(int(part))
+        except ValueError:
+            print("❌ Введите числа через запятую или диапазон.")
+            continue
+
+        if not choices:
+            print("❌ Ничего не выбрано.")
+            continue
+        if any(not 1 <= choice <= total_count for choice in choices):
+            print(f"❌ Номера должны быть от 1 до {total_count}.")
+            continue
+        return list(dict.fromkeys(choices))
@@ -0,0 +1,120 @@
+# compile_cache.py
+"""
+Контентно-адресуемый кэш результатов компиляции.
+
+Ключ — хэш главного файла, всех найденных зависимостей (tex_deps), выбранного
+компилятора и исполнителя (docker, local с версией TeX хоста, stub). В записи хранятся PDF и лог latexmk. Размер кэша ограничен
+COMPILE_CACHE_MAX_MB, при переполнении удаляются давно не использованные записи (LRU
+по времени модификации каталога записи, которое обновляется при каждом попадании).
+"""
+import hashlib
+import os
+import shutil
+import threading
+
+from tex_executor import TEXLIVE_IMAGE
+
+COMPILE_CACHE_DIR = os.path.abspath(os.getenv("COMPILE_CACHE_DIR", os.path.join(".cache", "compile")))
+COMPILE_CACHE_MAX_MB = int(os.getenv("COMPILE_CACHE_MAX_MB", "512"))
+
+# Меняется, когда меняется сам конвейер компиляции (патчи классов, опции latexmk)
+CACHE_VERSION = "1"
+
+PDF_NAME = "output.pdf"
+LOG_NAME = "output.log"
+
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return os.getenv("COMPILE_CACHE", "1") != "0"
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def compute_cache_key(root_dir, files, compiler, executor_identity=""):
+    """
+    Ключ кэша: версия, образ TeX, компилятор, исполнитель (см.
+    TexExecutor.cache_identity) и содержимое всех входных файлов
+    """
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}\0{TEXLIVE_IMAGE}\0{compiler}\0{executor_identity}\0".encode("utf-8"))
+    for rel_path in sorted(files):
+        h.update(rel_path.replace(os.sep, "/").encode("utf-8") + b"\0")
+        h.update(_file_digest(os.path.join(root_dir, rel_path)).encode("ascii") + b"\0")
+    return h.hexdigest()
+
+
+def lookup(key):
+    """Возвращает (путь_к_pdf, путь_к_логу_или_None) из кэша или None"""
+    entry = os.path.join(COMPILE_CACHE_DIR, key)
+    pdf_path = os.path.join(entry, PDF_NAME)
+    if not os.path.isfile(pdf_path):
+        return None
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    log_path = os.path.join(entry, LOG_NAME)
+    return pdf_path, (log_path if os.path.isfile(log_path) else None)
+
+
+def store(key, pdf_path, log_path=None):
+    """Кладёт PDF (и лог) в кэш и при необходимости вытесняет старые записи"""
+    entry = os.path.join(COMPILE_CACHE_DIR, key)
+    tmp_entry = entry + f".tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.makedirs(tmp_entry, exist_ok=True)
+        shutil.copy2(pdf_path, os.path.join(tmp_entry, PDF_NAME))
+        if log_path and os.path.isfile(log_path):
+            shutil.copy2(log_path, os.path.join(tmp_entry, LOG_NAME))
+        with _lock:
+            if os.path.isdir(entry):
+                shutil.rmtree(tmp_entry, ignore_errors=True)
+            else:
+                os.replace(tmp_entry, entry)
+            _evict()
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить PDF в кэш: {e}")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+
+def _entry_size(entry):
+    total = 0
+    for name in os.listdir(entry):
+        try:
+            total += os.path.getsize(os.path.join(entry, name))
+        except OSError:
+            pass
+    return total
+
+
+def _evict():
+    limit = COMPILE_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    for name in os.listdir(COMPILE_CACHE_DIR):
+        entry = os.path.join(COMPILE_CACHE_DIR, name)
+        if ".tmp" in name or not os.path.isdir(entry):
+            continue
+        try:
+            entries.append((os.path.getmtime(entry), _entry_size(entry), entry))
+        except OSError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def clear():
+    """Полностью очищает кэш компиляции"""
+    shutil.rmtree(COMPILE_CACHE_DIR, ignore_errors=True)
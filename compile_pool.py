@@ -0,0 +1,142 @@
+# compile_pool.py
+"""
+Параллельная компиляция нескольких документов.
+
+CompileScheduler запускает до N компиляций одновременно (N выбирается по числу CPU
+и свободной памяти), остальные ждут в очереди. Для каждого документа фиксируются
+длительность и статус; итог печатается таблицей.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from pdf_converter import compile_tex_to_pdf_via_docker, compile_zip_to_pdf_via_docker
+
+# Оценка памяти на одну компиляцию (LuaLaTeX с fontspec — самый тяжёлый случай)
+COMPILE_JOB_MEMORY_MB = int(os.getenv("COMPILE_JOB_MEMORY_MB", "1024"))
+COMPILE_MAX_WORKERS = int(os.getenv("COMPILE_MAX_WORKERS", "0"))
+
+
+def _available_memory_mb():
+    """Свободная память (MemAvailable) в МБ или None, если определить нельзя"""
+    try:
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def plan_workers(max_workers=None):
+    """Число одновременных компиляций в пределах бюджета CPU и памяти"""
+    workers = os.cpu_count() or 1
+    memory_mb = _available_memory_mb()
+    if memory_mb is not None:
+        workers = min(workers, max(1, memory_mb // COMPILE_JOB_MEMORY_MB))
+    limit = max_workers or COMPILE_MAX_WORKERS
+    if limit:
+        workers = min(workers, limit)
+    return max(1, workers)
+
+
+class CompileScheduler:
+    """Очередь компиляций с ограниченным числом одновременно работающих задач"""
+
+    def __init__(self, max_workers=None, quiet=True):
+        self.max_workers = plan_workers(max_workers)
+        self.quiet = quiet
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="compile")
+        self._futures = []
+        # Один и тот же проект собирается в одном каталоге — не параллельно
+        self._project_locks = {}
+        self._guard = threading.Lock()
+
+    def _project_lock(self, path):
+        key = os.path.abspath(path)
+        with self._guard:
+            return self._project_locks.setdefault(key, threading.Lock())
+
+    def submit(self, path, main_tex_name=None, force_clean=False):
+        """Ставит в очередь .tex (main_tex_name=None) или ZIP с главным файлом main_tex_name"""
+        future = self._pool.submit(self._compile, path, main_tex_name, force_clean)
+        self._futures.append(future)
+        return future
+
+    def _compile(self, path, main_tex_name, force_clean):
+        name = os.path.basename(path)
+        started = time.monotonic()
+        compile_result = None
+        try:
+            with tracing.span("compile", "compile", file=name), self._project_lock(path):
+                if main_tex_name is None:
+                    compile_result = compile_tex_to_pdf_via_docker(
+                        path, force_clean=force_clean, quiet=self.quiet,
+                    )
+                else:
+                    compile_result = compile_zip_to_pdf_via_docker(
+                        path, main_tex_name, force_clean=force_clean, quiet=self.quiet,
+                    )
+            ok = bool(compile_result)
+            status = compile_result.short_status() if ok else f"ошибка; {compile_result.short_status()}"
+        except Exception as e:
+            ok = False
+            status = f"исключение: {str(e)[:60]}"
+
+        result = {
+            "name": name,
+            "path": path,
+            "main_tex_name": main_tex_name,
+            "ok": ok,
+            "status": status,
+            "duration": time.monotonic() - started,
+            "compile": compile_result,
+        }
+        print(f"{'✅' if ok else '❌'} {name}: {status} ({result['duration']:.1f} с)")
+        return result
+
+    def pending(self):
+        return sum(1 for future in self._futures if not future.done())
+
+    def wait(self):
+        """Ждёт все поставленные задачи; результаты — в порядке постановки"""
+        results = [future.result() for future in self._futures]
+        self._futures = []
+        return results
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def print_compile_report(results):
+    if not results:
+        return
+    print("\n" + "=" * 70)
+    print("📊 ИТОГИ КОМПИЛЯЦИИ")
+    print("-" * 70)
+    for result in results:
+        mark = "✅" if result["ok"] else "❌"
+        print(f"{mark} {result['name']:<45} {result['duration']:>7.1f} с  {result['status']}")
+    ok_count = sum(1 for result in results if result["ok"])
+    print("-" * 70)
+    print(f"Успешно: {ok_count}/{len(results)}")
+
+
+def compile_many(jobs, max_workers=None, force_clean=False):
+    """
+    Компилирует несколько документов параллельно.
+    jobs — список пар (путь, главный_tex_для_zip_или_None). Возвращает список результатов.
+    """
+    scheduler = CompileScheduler(max_workers)
+    print(f"🐳 Компиляция {len(jobs)} документов, одновременно до {scheduler.max_workers}...")
+    try:
+        for path, main_tex_name in jobs:
+            scheduler.submit(path, main_tex_name, force_clean=force_clean)
+        results = scheduler.wait()
+    finally:
+        scheduler.shutdown()
+    print_compile_report(results)
+    return results
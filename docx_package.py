@@ -0,0 +1,278 @@
+# docx_package.py
+"""
+Низкоуровневый backend для .docx: работает напрямую с XML-частями пакета через lxml.
+
+В отличие от python-docx не строит объектную модель документа и не пересохраняет
+весь пакет: переводятся только story-части (document, header*, footer*, footnotes,
+endnotes, comments), а остальные части (картинки, шрифты, стили) копируются в
+выходной архив байт в байт, без распаковки и повторного сжатия.
+"""
+import io
+import re
+import sys
+import zipfile
+
+from lxml import etree
+from tqdm import tqdm
+
+import tracing
+from common import translate_chunk, chunk_text_by_sentences_safe
+from zip_utils import copy_zip_member_raw
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+M_NS = "http://schemas.openxmlformats.org/officeDocument/2006/math"
+
+W_P = f"{{{W_NS}}}p"
+W_R = f"{{{W_NS}}}r"
+W_T = f"{{{W_NS}}}t"
+W_RPR = f"{{{W_NS}}}rPr"
+W_PPR = f"{{{W_NS}}}pPr"
+W_HYPERLINK = f"{{{W_NS}}}hyperlink"
+W_INS = f"{{{W_NS}}}ins"
+W_DEL = f"{{{W_NS}}}del"
+W_SMARTTAG = f"{{{W_NS}}}smartTag"
+W_CUSTOMXML = f"{{{W_NS}}}customXml"
+W_FLDSIMPLE = f"{{{W_NS}}}fldSimple"
+W_SDT = f"{{{W_NS}}}sdt"
+W_SDTCONTENT = f"{{{W_NS}}}sdtContent"
+M_OMATH = f"{{{M_NS}}}oMath"
+M_OMATHPARA = f"{{{M_NS}}}oMathPara"
+
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# Части пакета, содержащие переводимый текст
+STORY_PART_RE = re.compile(
+    r'^word/(document|header\d*|footer\d*|footnotes|endnotes|comments)\.xml$'
+)
+
+# Элементы внутри run, которые считаются обычным текстом
+_TEXT_RUN_CHILDREN = {W_RPR, W_T}
+
+# Обёртки run'ов внутри параграфа: в тексте параграфа — placeholder на своём
+# месте, их собственный текст переводится отдельно (см. translate_paragraph_xml)
+_CONTAINER_TAGS = {W_HYPERLINK, W_INS, W_SMARTTAG, W_CUSTOMXML, W_FLDSIMPLE, W_SDT}
+# Сохраняются как есть и на своём месте: формулы и удалённый в рецензии текст
+_OPAQUE_TAGS = {M_OMATH, M_OMATHPARA, W_DEL}
+
+
+def _run_text(run):
+    """Возвращает текст run'а или None, если run содержит не только текст"""
+    parts = []
+    for child in run:
+        if child.tag not in _TEXT_RUN_CHILDREN:
+            return None
+        if child.tag == W_T:
+            parts.append(child.text or "")
+    return "".join(parts)
+
+
+def extract_paragraph_xml(p):
+    """
+    Извлекает текст параграфа (или контейнера внутри него), заменяя OMML,
+    нетекстовые run'ы и контейнеры (гиперссылки, правки, smartTag, sdt) на placeholder'ы.
+    Возвращает: (текст_с_placeholder'ами, список_сохраняемых_элементов, список_дочерних_элементов)
+    """
+    kept_elements = []
+    parts = []
+    children = []
+
+    for child in p:
+        if child.tag == W_R:
+            text = _run_text(child)
+            if text is None:
+                # Рисунки, поля, сноски и т.п. — переносим как есть
+                kept_elements.append(child)
+                parts.append(f"__MATH_{len(kept_elements)-1}__")
+            else:
+                parts.append(text)
+            children.append(child)
+        elif child.tag in _OPAQUE_TAGS or child.tag in _CONTAINER_TAGS:
+            kept_elements.append(child)
+            parts.append(f"__MATH_{len(kept_elements)-1}__")
+            children.append(child)
+
+    return "".join(parts), kept_elements, children
+
+
+def rebuild_paragraph_xml(p, translated_text, kept_elements, children):
+    """
+    Заменяет run'ы параграфа на переведённый текст, сохраняя форматирование
+    первого текстового run'а; OMML и контейнеры встают на места своих placeholder'ов.
+    Остальные дочерние элементы (pPr, закладки) остаются на месте.
+    """
+    template_rpr = None
+    for child in children:
+        if child.tag == W_R and _run_text(child) is not None:
+            rpr = child.find(W_RPR)
+            if rpr is not None:
+                template_rpr = rpr
+            break
+
+    if children:
+        insert_at = p.index(children[0])
+    else:
+        ppr = p.find(W_PPR)
+        insert_at = p.index(ppr) + 1 if ppr is not None else 0
+
+    for child in children:
+        p.remove(child)
+
+    new_children = []
+    for part in re.split(r'(__MATH_\d+__)', translated_text):
+        math_match = re.fullmatch(r'__MATH_(\d+)__', part)
+        if math_match:
+            idx = int(math_match.group(1))
+            if idx < len(kept_elements):
+                new_children.append(kept_elements[idx])
+        elif part:
+            run = etree.Element(W_R)
+            if template_rpr is not None:
+                run.append(_copy_element(template_rpr))
+            t = etree.SubElement(run, W_T)
+            t.text = part
+            t.set(XML_SPACE, "preserve")
+            new_children.append(run)
+
+    for offset, child in enumerate(new_children):
+        p.insert(insert_at + offset, child)
+
+
+def _translate_text(full_text):
+    """Перевод текста с placeholder'ами; None — в нём нечего переводить"""
+    from translate_docx import mask_text_formulas, unmask_text_formulas
+
+    clean_text, text_formulas = mask_text_formulas(full_text)
+
+    temp_check = re.sub(r'__(?:TEXT)?MATH_\d+__', "", clean_text)
+    if not re.search(r'[a-zA-Z]{2,}', temp_check):
+        return None
+
+    chunks = chunk_text_by_sentences_safe(clean_text)
+    translated = " ".join(
+        translate_chunk(chunk)
+        for chunk in chunks if chunk.strip()
+    )
+    return unmask_text_formulas(translated, text_formulas)
+
+
+def translate_paragraph_xml(element):
+    """
+    Переводит параграф на месте: сначала текст контейнеров (гиперссылка
+    посреди фразы остаётся на своём месте и со своим адресом), затем сам
+    параграф с placeholder'ами вместо них. Возвращает True, если что-то переведено.
+    """
+    full_text, kept_elements, children = extract_paragraph_xml(element)
+    changed = False
+    for kept in kept_elements:
+        if kept.tag in _CONTAINER_TAGS:
+            content = kept.find(W_SDTCONTENT) if kept.tag == W_SDT else kept
+            if content is not None and translate_paragraph_xml(content):
+                changed = True
+
+    if full_text.strip():
+        translated = _translate_text(full_text)
+        if translated is not None:
+            rebuild_paragraph_xml(element, translated, kept_elements, children)
+            changed = True
+    return changed
+
+
+def _copy_element(element):
+    return etree.fromstring(etree.tostring(element))
+
+
+def _paragraph_plain_text(p):
+    return "".join(t.text or "" for t in p.iter(W_T))
+
+
+def translate_story_part(xml_bytes, skip_references=False, desc=None):
+    """
+    Переводит одну story-часть пакета. Возвращает новые байты XML
+    или None, если в части нечего переводить.
+    """
+    from translate_docx import REFERENCE_TITLES
+
+    # iterparse собирает только параграфы верхнего уровня (вложенные — из надписей —
+    # обрабатываются вместе с ними как непрозрачные run'ы)
+    paragraphs = []
+    root = None
+    with tracing.span("docx.parse", bytes=len(xml_bytes)):
+        for event, element in etree.iterparse(io.BytesIO(xml_bytes), events=("start", "end")):
+            if root is None:
+                root = element
+            if event == "end" and element.tag == W_P and not _has_paragraph_ancestor(element):
+                paragraphs.append(element)
+
+    changed = False
+    in_references = False
+
+    for p in tqdm(paragraphs, desc=desc or "Перевод .docx", leave=False):
+        plain = _paragraph_plain_text(p).strip()
+        if not plain:
+            continue
+
+        if skip_references:
+            if plain.lower() in REFERENCE_TITLES:
+                in_references = True
+                continue
+            if in_references:
+                continue
+
+        if translate_paragraph_xml(p):
+            changed = True
+
+    if not changed:
+        return None
+
+    with tracing.span("docx.serialize"):
+        return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+def _has_paragraph_ancestor(element):
+    parent = element.getparent()
+    while parent is not None:
+        if parent.tag == W_P:
+            return True
+        parent = parent.getparent()
+    return False
+
+
+def translate_docx_package(input_path, output_path):
+    """Переводит DOCX на уровне XML-частей, копируя остальные части пакета байт в байт"""
+    try:
+        src_zip = zipfile.ZipFile(input_path, "r")
+    except Exception as e:
+        print(f"❌ Не удалось открыть .docx: {e}")
+        sys.exit(1)
+
+    with src_zip:
+        story_parts = [
+            info for info in src_zip.infolist() if STORY_PART_RE.match(info.filename)
+        ]
+        # Основной текст первым — как в интерактивном выводе python-docx backend'а
+        story_parts.sort(key=lambda info: info.filename != "word/document.xml")
+
+        patched = {}
+        for info in story_parts:
+            is_main = info.filename == "word/document.xml"
+            with tracing.span("docx.story_part", part=info.filename):
+                new_xml = translate_story_part(
+                    src_zip.read(info),
+                    skip_references=is_main,
+                    desc=f"Перевод {info.filename}",
+                )
+            if new_xml is not None:
+                patched[info.filename] = new_xml
+
+        with tracing.span("docx.write", parts=len(patched)), \
+                zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as dst_zip:
+            for info in src_zip.infolist():
+                if info.filename in patched:
+                    new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                    new_info.compress_type = zipfile.ZIP_DEFLATED
+                    new_info.external_attr = info.external_attr
+                    dst_zip.writestr(new_info, patched[info.filename])
+                else:
+                    copy_zip_member_raw(src_zip, dst_zip, info)
+
+    print(f"\n✅ Перевод завершён: {output_path}")
@@ -0,0 +1,158 @@
+# formats.py
+"""
+Реестр входных форматов (.tex, .zip, .docx).
+
+Модули перевода и компиляции импортируются лениво — только когда выбранному
+режиму и типу файла они действительно нужны. Так режим компиляции не тянет
+requests, python-docx/lxml и tqdm, а каждый запуск CLI в пакетном режиме
+стартует быстрее.
+"""
+import importlib
+import os
+
+
+def _translate_tex(input_path, output_dir):
+    from translate_tex import translate_tex_file
+    return translate_tex_file(input_path, output_dir), None
+
+
+def _translate_zip(input_path, output_dir):
+    from translate_tex import process_zip_for_translation
+    return process_zip_for_translation(input_path, output_dir)
+
+
+def _translate_docx(input_path, output_dir):
+    from common import get_target_language
+    from languages import output_suffix
+    from translate_docx import translate_docx
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    output_path = os.path.join(output_dir, f"{base}{output_suffix(get_target_language())}.docx")
+    translate_docx(input_path, output_path)
+    return output_path, None
+
+
+def _translate_tex_languages(input_path, output_dir, langs, on_preview=None):
+    from translate_tex import translate_tex_file_languages
+    preview = None
+    if on_preview is not None:
+        def preview(drafts):
+            on_preview([(lang, drafts[lang], None) for lang in langs])
+    outputs = translate_tex_file_languages(input_path, output_dir, langs, preview)
+    return [(lang, outputs[lang], None) for lang in langs]
+
+
+def _translate_zip_languages(input_path, output_dir, langs, on_preview=None):
+    from translate_tex import process_zip_languages
+    preview = None
+    if on_preview is not None:
+        def preview(drafts, main_tex_name):
+            on_preview([(lang, drafts[lang], main_tex_name) for lang in langs])
+    outputs, main_tex_name = process_zip_languages(input_path, output_dir, langs, preview)
+    return [(lang, outputs[lang], main_tex_name) for lang in langs]
+
+
+def _translate_docx_languages(input_path, output_dir, langs, on_preview=None):
+    from common import get_target_language, set_target_language
+    # Абзацы .docx переводятся прямо в дереве документа — по проходу на язык
+    # (разбор пакета дёшев по сравнению с запросами к модели)
+    previous = get_target_language()
+    results = []
+    try:
+        for lang in langs:
+            set_target_language(lang)
+            output_path, _ = _translate_docx(input_path, output_dir)
+            results.append((lang, output_path, None))
+    finally:
+        set_target_language(previous)
+    return results
+
+
+def _compile_tex(path, main_tex_name=None, **kwargs):
+    from pdf_converter import compile_tex_to_pdf_via_docker
+    return compile_tex_to_pdf_via_docker(path, **kwargs)
+
+
+def _compile_zip(path, main_tex_name=None, **kwargs):
+    from pdf_converter import compile_zip_to_pdf_via_docker
+    if main_tex_name is None:
+        main_tex_name = find_main_tex_in_zip(path)
+        if main_tex_name is None:
+            print("❌ В архиве нет .tex файлов.")
+            from tex_log import CompileResult
+            return CompileResult(False)
+    return compile_zip_to_pdf_via_docker(path, main_tex_name, **kwargs)
+
+
+# translate(входной_путь, каталог_результатов) -> (путь_результата, главный_tex_для_zip_или_None)
+# translate_languages(входной_путь, каталог, [языки], on_preview=None) -> [(язык, путь_результата, главный_tex_или_None)]
+#   on_preview([(язык, путь_черновика, главный_tex_или_None)]) — черновик с переведённым
+#   началом документа для предпросмотра (у .docx черновика нет)
+# compile(путь, главный_tex_для_zip=None, **опции) -> CompileResult
+FORMATS = {
+    ".tex": {
+        "label": "LaTeX",
+        "translate": _translate_tex,
+        "translate_languages": _translate_tex_languages,
+        "compile": _compile_tex,
+        "modules": ("translate_tex",),
+    },
+    ".zip": {
+        "label": "архив LaTeX",
+        "translate": _translate_zip,
+        "translate_languages": _translate_zip_languages,
+        "compile": _compile_zip,
+        "modules": ("translate_tex",),
+    },
+    ".docx": {
+        "label": "Word",
+        "translate": _translate_docx,
+        "translate_languages": _translate_docx_languages,
+        "compile": None,
+        "modules": ("translate_docx", "docx_package"),
+    },
+}
+
+COMPILE_MODULES = ("pdf_converter", "compile_pool")
+
+
+def get_format(path):
+    """Описание формата по расширению файла или None"""
+    return FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def translatable_extensions():
+    return tuple(FORMATS)
+
+
+def compilable_extensions():
+    return tuple(ext for ext, backend in FORMATS.items() if backend["compile"])
+
+
+def preload(path, translate=True, compile_after=False):
+    """
+    Заранее импортирует модули, нужные для файла (например, чтобы ошибка
+    отсутствующей зависимости всплыла до начала длинного перевода).
+    """
+    backend = get_format(path)
+    if backend is None:
+        return
+    modules = backend["modules"] if translate else ()
+    if compile_after and backend["compile"]:
+        modules += COMPILE_MODULES
+    for module in modules:
+        importlib.import_module(module)
+
+
+def find_main_tex_in_zip(zip_path):
+    """
+    Находит главный .tex файл архива (по \\documentclass в заголовке); None, если .tex нет.
+    Архив распаковывается один раз в кэш рабочих копий (см. workspace).
+    """
+    import workspace
+
+    project = workspace.open_workspace(zip_path)
+    if project["main_tex"] is None:
+        return None
+    if project["main_guessed"]:
+        print("⚠️ Не найден \\begin{document}. Используем первый .tex файл.")
+    return os.path.normpath(project["main_tex"])
@@ -0,0 +1,83 @@
+# languages.py
+"""
+Языки перевода: формулировки для промпта и настройки babel/polyglossia.
+
+По умолчанию перевод идёт на русский (TARGET_LANGUAGE в .env меняет язык);
+translate --lang ru,de,fr переводит документ сразу на несколько языков
+(см. translate_tex.translate_latex_languages).
+"""
+
+# prompt — «на <prompt>», genitive — «поддержка <genitive> языка»,
+# examples — (Introduction, Parameter, Value) для примеров в промпте
+LANGUAGES = {
+    "ru": {
+        "label": "русский", "prompt": "русский", "genitive": "русского",
+        "babel": "russian", "polyglossia": "russian",
+        "examples": ("Введение", "Параметр", "Значение"),
+    },
+    "uk": {
+        "label": "украинский", "prompt": "украинский", "genitive": "украинского",
+        "babel": "ukrainian", "polyglossia": "ukrainian",
+        "examples": ("Вступ", "Параметр", "Значення"),
+    },
+    "de": {
+        "label": "немецкий", "prompt": "немецкий", "genitive": "немецкого",
+        "babel": "ngerman", "polyglossia": "german",
+        "examples": ("Einleitung", "Parameter", "Wert"),
+    },
+    "fr": {
+        "label": "французский", "prompt": "французский", "genitive": "французского",
+        "babel": "french", "polyglossia": "french",
+        "examples": ("Introduction", "Paramètre", "Valeur"),
+    },
+    "es": {
+        "label": "испанский", "prompt": "испанский", "genitive": "испанского",
+        "babel": "spanish", "polyglossia": "spanish",
+        "examples": ("Introducción", "Parámetro", "Valor"),
+    },
+    "it": {
+        "label": "итальянский", "prompt": "итальянский", "genitive": "итальянского",
+        "babel": "italian", "polyglossia": "italian",
+        "examples": ("Introduzione", "Parametro", "Valore"),
+    },
+    "pt": {
+        "label": "португальский", "prompt": "португальский", "genitive": "португальского",
+        "babel": "portuguese", "polyglossia": "portuguese",
+        "examples": ("Introdução", "Parâmetro", "Valor"),
+    },
+    "pl": {
+        "label": "польский", "prompt": "польский", "genitive": "польского",
+        "babel": "polish", "polyglossia": "polish",
+        "examples": ("Wprowadzenie", "Parametr", "Wartość"),
+    },
+}
+
+DEFAULT_LANGUAGE = "ru"
+
+
+def get_language(code):
+    """Описание языка по коду (ru, de...); ValueError для неизвестного кода"""
+    try:
+        return LANGUAGES[code]
+    except KeyError:
+        raise ValueError(
+            f"Неизвестный язык перевода: {code} (доступны: {', '.join(LANGUAGES)})"
+        ) from None
+
+
+def parse_languages(value):
+    """'ru,de, fr' -> ['ru', 'de', 'fr'] без повторов; ValueError для неизвестных кодов"""
+    codes = []
+    for code in value.split(","):
+        code = code.strip().lower()
+        if code and code not in codes:
+            get_language(code)
+            codes.append(code)
+    if not codes:
+        raise ValueError("Не указан ни один язык перевода")
+    return codes
+
+
+def output_suffix(lang):
+    """Суффикс имени результата: _translated для русского (как раньше), _translated_de и т.д."""
+    return "_translated" if lang == DEFAULT_LANGUAGE else f"_translated_{lang}"
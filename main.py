@@ -1,19 +1,30 @@
 # main.py
+"""
+Точка входа: интерактивное меню или команды для пакетного запуска.
+
+    python main.py                              — меню
+    python main.py compile inputs/a.tex b.zip   — только компиляция
+    python main.py translate a.tex --model ID   — перевод (и --compile)
+    python main.py watch --model ID             — наблюдение за inputs/
+    python main.py worker --queue PATH --model ID
+                                                — воркер распределённого перевода (см. work_queue.py)
+    python main.py --profile out/run translate a.tex --model ID
+                                                — куда ушли время и память (см. tracing.py)
+
+Модули перевода и компиляции импортируются по требованию (см. formats.py).
+"""
+import argparse
 import os
 import sys
 
+import tracing
 from common import (
     INPUT_DIR,
     OUTPUT_DIR,
-    test_model_connection,
-    load_env_vars,
     get_files_list,
-    select_file_by_number,
-    select_translation_model
+    select_files_by_numbers,
 )
-from translate_tex import translate_latex_text, add_russian_preamble, process_zip_for_translation, restore_bibliography_commands
-from translate_docx import translate_docx
-from pdf_converter import compile_tex_to_pdf_via_docker, compile_zip_to_pdf_via_docker
+from formats import compilable_extensions, find_main_tex_in_zip, get_format
 
 def show_main_menu():
     """Показывает главное меню"""
@@ -23,7 +34,8 @@ def show_main_menu():
     print("\nВыберите режим работы:")
     print("  1. Перевести и скомпилировать (.tex, .zip, .docx)")
     print("  2. Только скомпилировать в PDF (.tex, .zip)")
-    print("  3. Выход")
+    print("  3. Следить за inputs/: перевод и компиляция при каждом сохранении")
+    print("  4. Выход")
     print("-" * 70)
 
 def compile_only_mode():
@@ -31,7 +43,7 @@ def compile_only_mode():
     print("\n📦 РЕЖИМ КОМПИЛЯЦИИ (без перевода)")
     print("-" * 70)
     
-    available = [f for f in get_files_list(INPUT_DIR) if f.lower().endswith(('.tex', '.zip'))]
+    available = [f for f in get_files_list(INPUT_DIR) if f.lower().endswith(compilable_extensions())]
     if not available:
         print(f"📁 Положите .tex или .zip файлы в папку '{INPUT_DIR}'")
         return
@@ -40,65 +52,77 @@ def compile_only_mode():
     for i, filename in enumerate(available, 1):
         print(f"  {i}. {filename}")
     
-    file_index = select_file_by_number(len(available))
-    filename = available[file_index - 1]
-    input_path = os.path.join(INPUT_DIR, filename)
-    ext = os.path.splitext(filename)[1].lower()
-    
+    selected = [available[i - 1] for i in select_files_by_numbers(len(available))]
+    force_clean = input("🧹 Чистая пересборка (без кэша и старых .aux/.bbl)? (y/n): ").strip().lower() == 'y'
+    compile_paths([os.path.join(INPUT_DIR, filename) for filename in selected], force_clean)
+
+def compile_paths(paths, force_clean=False, max_workers=None):
+    """Компилирует .tex/.zip: один документ — с полным выводом latexmk, несколько — параллельно"""
     try:
-        if ext == '.zip':
-            # Для ZIP нужно найти главный .tex файл
-            import zipfile
-            import tempfile
-            
-            with tempfile.TemporaryDirectory() as tmpdir:
-                with zipfile.ZipFile(input_path, 'r') as zip_ref:
-                    zip_ref.extractall(tmpdir)
-                
-                # Ищем главный .tex файл
-                main_tex = None
-                all_tex = []
-                for root, _, files in os.walk(tmpdir):
-                    for f in files:
-                        if f.lower().endswith('.tex'):
-                            full_path = os.path.join(root, f)
-                            all_tex.append(full_path)
-                            if main_tex is None:
-                                try:
-                                    with open(full_path, 'r', encoding='utf-8') as fp:
-                                        if r'\begin{document}' in fp.read():
-                                            main_tex = full_path
-                                except:
-                                    pass
-                
-                if not all_tex:
-                    print("❌ В архиве нет .tex файлов.")
-                    return
-                
-                if main_tex is None:
-                    print("⚠️ Не найден \\begin{document}. Используем первый .tex файл.")
-                    main_tex = all_tex[0]
-                
-                main_tex_name = os.path.relpath(main_tex, tmpdir)
-            
-            print(f"📄 Главный файл: {main_tex_name}")
-            print("🐳 Компиляция ZIP в PDF...")
-            compile_zip_to_pdf_via_docker(input_path, main_tex_name)
+        jobs = []
+        for input_path in paths:
+            filename = os.path.basename(input_path)
+            if filename.lower().endswith('.zip'):
+                # Для ZIP нужно найти главный .tex файл
+                main_tex_name = find_main_tex_in_zip(input_path)
+                if main_tex_name is None:
+                    print(f"❌ В архиве {filename} нет .tex файлов.")
+                    continue
+                print(f"📄 {filename}: главный файл {main_tex_name}")
+                jobs.append((input_path, main_tex_name))
+            else:
+                jobs.append((input_path, None))
         
-        elif ext == '.tex':
-            print("🐳 Компиляция .tex в PDF...")
-            compile_tex_to_pdf_via_docker(input_path)
+        if len(jobs) == 1:
+            # Один документ — компилируем с полным выводом latexmk
+            input_path, main_tex_name = jobs[0]
+            print("🐳 Компиляция в PDF...")
+            with tracing.span("compile", "compile", file=os.path.basename(input_path)):
+                return [bool(get_format(input_path)["compile"](input_path, main_tex_name, force_clean=force_clean))]
+        elif jobs:
+            from compile_pool import compile_many
+            return [result["ok"] for result in compile_many(jobs, max_workers=max_workers, force_clean=force_clean)]
     
     except Exception as e:
         print(f"\n💥 Ошибка: {e}")
         import traceback
         traceback.print_exc()
+    return [False]
+
+def offer_segment_retranslation(results, scheduler):
+    """Предлагает перевести заново фрагменты, к которым привязаны ошибки компиляции"""
+    for result in results:
+        compile_result = result.get("compile")
+        if compile_result is None or not compile_result.errors:
+            continue
+        failed = compile_result.failed_segments
+        if not failed:
+            continue
+        
+        compile_result.print_summary()
+        count = sum(len(ids) for ids in failed.values())
+        choice = input(f"\n🔁 {result['name']}: перевести заново фрагменты с ошибками ({count})? (y/n): ").strip().lower()
+        if choice != 'y':
+            continue
+        
+        from translate_tex import retranslate_segments
+        from compile_pool import print_compile_report
+        if retranslate_segments(result["path"], failed):
+            scheduler.submit(result["path"], result["main_tex_name"])
+            print_compile_report(scheduler.wait())
 
 def translate_mode():
     """Режим перевода с компиляцией"""
     print("\n🌐 РЕЖИМ ПЕРЕВОДА")
     print("-" * 70)
     
+    from common import load_env_vars, select_translation_model, test_model_connection
+    try:
+        load_env_vars()
+    except ValueError as e:
+        print(f"⚠️ {e}")
+        return
+    
     # Выбор модели
     model_name = select_translation_model()
     
@@ -116,73 +140,304 @@ def translate_mode():
     for i, filename in enumerate(available, 1):
         print(f"  {i}. {filename}")
     
-    file_index = select_file_by_number(len(available))
-    filename = available[file_index - 1]
-    input_path = os.path.join(INPUT_DIR, filename)
-    base, ext = os.path.splitext(filename)
-    ext = ext.lower()
+    selected = [available[i - 1] for i in select_files_by_numbers(len(available))]
     
+    from languages import parse_languages
+    answer = input("\n🌍 Языки перевода через запятую (Enter — ru; например ru,de,fr): ").strip()
+    try:
+        langs = parse_languages(answer) if answer else None
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    
+    paths = [os.path.join(INPUT_DIR, filename) for filename in selected]
+    if input("\n🧮 Сначала оценить запросы, время и стоимость? (y/n): ").strip().lower() == 'y':
+        estimate_paths(paths, model_name, langs)
+        if input("\n▶️ Переводить? (y/n): ").strip().lower() != 'y':
+            return
+    
+    compile_after = False
+    preview = False
+    if any(f.lower().endswith(compilable_extensions()) for f in selected):
+        compile_after = input("\n🐳 Скомпилировать результаты в PDF? (y/n): ").strip().lower() == 'y'
+        if compile_after:
+            preview = input("👀 Сначала черновик PDF по первым разделам? (y/n): ").strip().lower() == 'y'
+    
+    import translation_budget
+    translation_budget.set_limits(model=model_name)
+    translate_paths(paths, model_name, compile_after, langs=langs, preview=preview)
+
+def estimate_paths(paths, model_name, langs=None):
+    """
+    Оценка перевода без запросов к API: документы проходят распаковку, маскирование
+    и нарезку на чанки, результаты пишутся во временный каталог и удаляются
+    (см. translation_budget). Возвращает False, если какой-то файл не разобрался.
+    """
+    import tempfile
+    import translation_budget
+    from common import get_target_language, set_current_model
+    
+    set_current_model(model_name)
+    ok = True
+    with tempfile.TemporaryDirectory() as output_dir, translation_budget.dry_run():
+        for input_path in paths:
+            backend = get_format(input_path)
+            if backend is None:
+                print(f"❌ Неподдерживаемый формат: {input_path}")
+                ok = False
+                continue
+            print(f"\n📄 {os.path.basename(input_path)} ({backend['label']})")
+            try:
+                backend["translate_languages"](input_path, output_dir, langs or [get_target_language()])
+            except Exception as e:
+                print(f"💥 Ошибка: {e}")
+                ok = False
+    translation_budget.print_estimate(model_name)
+    return ok
+
+def translate_paths(paths, model_name, compile_after=False, interactive=True, langs=None, preview=False):
+    """
+    Переводит файлы; результаты .tex/.zip при compile_after компилируются в фоне.
+    langs — список языков (см. languages): документ разбирается один раз,
+    результат пишется на каждый язык; None — язык по умолчанию.
+    preview — сначала переводятся титульная часть и первые разделы, и черновик
+    (остальное на языке оригинала) компилируется, пока переводится остальное.
+    """
+    import segment_filter
+    import shared_quota
+    import translation_budget
+    import translation_tiers
+    from common import get_target_language, print_truncation_report, reset_truncation_stats, set_current_model
+    
+    # Компиляция идёт в фоне, пока переводятся следующие файлы
+    scheduler = None
+    compile_after = compile_after or preview
+    if compile_after:
+        from compile_pool import CompileScheduler
+        scheduler = CompileScheduler()
+    
+    ok = True
     try:
-        from common import set_current_model
         set_current_model(model_name)
         
-        if ext == '.zip':
-            print("\n📦 Обработка архива...")
-            output_zip, main_tex_name = process_zip_for_translation(input_path, OUTPUT_DIR)
-            print(f"✅ Перевод завершён! Архив: {output_zip}")
-            
-            # Спрашиваем, компилировать ли
-            compile_choice = input("\n🐳 Скомпилировать в PDF? (y/n): ").strip().lower()
-            if compile_choice == 'y':
-                print("🐳 Компиляция в PDF...")
-                compile_zip_to_pdf_via_docker(output_zip, main_tex_name)
-        
-        elif ext == '.tex':
-            with open(input_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-            output_tex = os.path.join(OUTPUT_DIR, f"{base}_translated.tex")
-            content_with_preamble = add_russian_preamble(original_content)
-            translated = translate_latex_text(content_with_preamble)
-            translated = restore_bibliography_commands(original_content, translated)
+        for input_path in paths:
+            backend = get_format(input_path)
+            if backend is None:
+                print(f"❌ Неподдерживаемый формат: {input_path}")
+                ok = False
+                continue
             
-            # Восстанавливаем \documentclass из оригинала
-            import re
-            docclass_match = re.search(r'\\documentclass(?:\[[^\]]*\])?\{[^\}]+\}', original_content)
-            if docclass_match:
-                orig_docclass = docclass_match.group(0)
-                translated = re.sub(
-                    r'\\documentclass(?:\[[^\]]*\])?\{[^\}]+\}',
-                    lambda m: orig_docclass,
-                    translated,
-                    count=1
+            print(f"\n📄 {os.path.basename(input_path)} ({backend['label']})")
+            reset_truncation_stats()
+            segment_filter.reset_stats()
+            translation_tiers.reset_stats()
+            on_preview = None
+            if preview and backend["compile"]:
+                def on_preview(drafts):
+                    for lang, draft_path, main_tex_name in drafts:
+                        print(f"\n👀 Черновик ({lang}) готов, компилируется: {draft_path}")
+                        scheduler.submit(draft_path, main_tex_name)
+            with tracing.span("translate", file=os.path.basename(input_path)):
+                outputs = backend["translate_languages"](
+                    input_path, OUTPUT_DIR, langs or [get_target_language()], on_preview,
                 )
-            with open(output_tex, 'w', encoding='utf-8') as f:
-                f.write(translated)
-            print(f"\n✅ Перевод .tex завершён! Результат: {output_tex}")
-            
-            # Спрашиваем, компилировать ли
-            compile_choice = input("\n🐳 Скомпилировать в PDF? (y/n): ").strip().lower()
-            if compile_choice == 'y':
-                print("🐳 Компиляция в PDF...")
-                compile_tex_to_pdf_via_docker(output_tex)
+            for lang, output_path, main_tex_name in outputs:
+                print(f"✅ Перевод завершён ({lang})! Результат: {output_path}")
+            segment_filter.print_report()
+            translation_tiers.print_report()
+            print_truncation_report()
+            if scheduler and backend["compile"]:
+                print("🐳 Компиляция в PDF поставлена в очередь...")
+                for lang, output_path, main_tex_name in outputs:
+                    scheduler.submit(output_path, main_tex_name)
         
-        elif ext == '.docx':
-            output_docx = os.path.join(OUTPUT_DIR, f"{base}_translated.docx")
-            translate_docx(input_path, output_docx)
+        if scheduler:
+            from compile_pool import print_compile_report
+            if scheduler.pending():
+                print(f"\n⏳ Ожидание компиляции ({scheduler.pending()} в работе)...")
+            results = scheduler.wait()
+            print_compile_report(results)
+            ok = ok and all(result["ok"] for result in results)
+            if interactive:
+                offer_segment_retranslation(results, scheduler)
     
     except KeyboardInterrupt:
         print("\n\n❌ Отменено пользователем.")
+        ok = False
+    except translation_budget.BudgetExceeded as e:
+        print(f"\n💸 {e}. Переведённые фрагменты сохранены в кэше — повторный запуск продолжит с них.")
+        ok = False
     except Exception as e:
         print(f"\n💥 Ошибка: {e}")
         import traceback
         traceback.print_exc()
+        ok = False
+    finally:
+        if scheduler:
+            scheduler.shutdown()
+        translation_budget.print_spent()
+        shared_quota.print_report()
+    return ok
+
+def watch_mode():
+    """Режим наблюдения за inputs/"""
+    print("\n👀 РЕЖИМ НАБЛЮДЕНИЯ")
+    print("-" * 70)
+    
+    from common import load_env_vars, select_translation_model, set_current_model
+    try:
+        load_env_vars()
+    except ValueError as e:
+        print(f"⚠️ {e}")
+        return
+    
+    set_current_model(select_translation_model())
+    compile_after = input("\n🐳 Компилировать результаты в PDF? (y/n): ").strip().lower() == 'y'
+    
+    from watch import watch_inputs
+    watch_inputs(INPUT_DIR, OUTPUT_DIR, compile_after=compile_after)
+
+def _resolve_input(path):
+    """Путь как есть или имя файла в папке inputs/"""
+    if not os.path.exists(path) and os.path.exists(os.path.join(INPUT_DIR, path)):
+        return os.path.join(INPUT_DIR, path)
+    return path
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="LLM-Translator: перевод и компиляция LaTeX/DOCX. Без команды — интерактивное меню.",
+    )
+    parser.add_argument("--trace", metavar="FILE.json",
+                        help="записать этапы прогона в Chrome trace JSON (ui.perfetto.dev)")
+    parser.add_argument("--profile", metavar="PREFIX", nargs="?", const="profile",
+                        help="прогон под cProfile и tracemalloc: PREFIX.prof, .trace.json, .folded, .memory.txt")
+    commands = parser.add_subparsers(dest="command")
+    
+    compile_cmd = commands.add_parser("compile", help="скомпилировать .tex/.zip в PDF")
+    compile_cmd.add_argument("files", nargs="+", help="пути или имена файлов в inputs/")
+    compile_cmd.add_argument("--clean", action="store_true", help="чистая пересборка без кэша")
+    compile_cmd.add_argument("--jobs", type=int, default=None, help="число параллельных компиляций")
+    
+    translate_cmd = commands.add_parser("translate", help="перевести .tex/.zip/.docx")
+    translate_cmd.add_argument("files", nargs="+", help="пути или имена файлов в inputs/")
+    translate_cmd.add_argument("--model", required=True, help="ID модели, например openai/gpt-4o-mini")
+    translate_cmd.add_argument("--compile", action="store_true", help="скомпилировать результаты в PDF")
+    translate_cmd.add_argument("--preview", action="store_true",
+                               help="сначала скомпилировать черновик по первым разделам (включает --compile)")
+    translate_cmd.add_argument("--lang", default=None,
+                               help="языки перевода через запятую, например ru,de,fr (по умолчанию ru)")
+    translate_cmd.add_argument("--dry-run", action="store_true",
+                               help="только оценка: запросы, токены, время и стоимость без обращения к API")
+    translate_cmd.add_argument("--max-tokens", type=int, default=None,
+                               help="остановить перевод, не превышая столько токенов")
+    translate_cmd.add_argument("--max-cost", type=float, default=None,
+                               help="остановить перевод, не превышая такой стоимости в $")
+    translate_cmd.add_argument("--escalate-model", metavar="ID", default=None,
+                               help="сильная модель для фрагментов, не прошедших проверки (уровни моделей)")
+    translate_cmd.add_argument("--queue", metavar="PATH", default=None,
+                               help="координатор: отдать сегменты воркерам через очередь PATH (SQLite на общем томе)")
+    
+    watch_cmd = commands.add_parser("watch", help="переводить и компилировать при изменениях в inputs/")
+    watch_cmd.add_argument("--model", required=True, help="ID модели")
+    watch_cmd.add_argument("--no-compile", action="store_true", help="только перевод, без PDF")
+    watch_cmd.add_argument("--poll", action="store_true", help="опрос вместо inotify")
+    watch_cmd.add_argument("--debounce", type=float, default=None, help="пауза после серии сохранений, с")
+    watch_cmd.add_argument("--escalate-model", metavar="ID", default=None,
+                           help="сильная модель для фрагментов, не прошедших проверки")
+    
+    worker_cmd = commands.add_parser("worker", help="переводить сегменты из общей очереди координатора")
+    worker_cmd.add_argument("--queue", metavar="PATH", default=None, help="файл очереди (по умолчанию WORK_QUEUE)")
+    worker_cmd.add_argument("--model", required=True, help="ID модели — та же, что у координатора")
+    worker_cmd.add_argument("--exit-when-idle", action="store_true", help="завершиться, когда очередь опустеет")
+    return parser
 
-def main():
+def run_command(args):
+    """Неинтерактивный запуск; возвращает код завершения процесса"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    
+    if args.command == "watch":
+        from common import load_env_vars, set_current_model
+        from watch import WATCH_DEBOUNCE, watch_inputs
+        try:
+            load_env_vars()
+        except ValueError as e:
+            print(f"⚠️ {e}")
+            return 2
+        set_current_model(args.model)
+        if args.escalate_model:
+            from translation_tiers import set_escalation_model
+            set_escalation_model(args.escalate_model)
+        os.makedirs(INPUT_DIR, exist_ok=True)
+        watch_inputs(
+            INPUT_DIR, OUTPUT_DIR,
+            compile_after=not args.no_compile, polling=args.poll,
+            debounce=WATCH_DEBOUNCE if args.debounce is None else args.debounce,
+        )
+        return 0
+    
+    if args.command == "worker":
+        from common import load_env_vars, set_current_model
+        from work_queue import get_queue_path, run_worker
+        queue_path = os.path.abspath(args.queue) if args.queue else get_queue_path()
+        if not queue_path:
+            print("❌ Укажите очередь: --queue PATH или WORK_QUEUE в .env")
+            return 2
+        try:
+            load_env_vars()
+        except ValueError as e:
+            print(f"⚠️ {e}")
+            return 2
+        set_current_model(args.model)
+        try:
+            run_worker(queue_path, args.model, exit_when_idle=args.exit_when_idle)
+        except KeyboardInterrupt:
+            print("\n🛑 Воркер остановлен, его сегменты возвращены в очередь.")
+        return 0
+    
+    paths = [_resolve_input(path) for path in args.files]
+    if args.command == "compile":
+        results = compile_paths(paths, force_clean=args.clean, max_workers=args.jobs)
+        return 0 if all(results) else 1
+    
+    from common import load_env_vars
     try:
         load_env_vars()
     except ValueError as e:
         print(f"⚠️ {e}")
-        print("ℹ️  Режим компиляции доступен без API ключа.")
+        return 2
+    from languages import parse_languages
+    try:
+        langs = parse_languages(args.lang) if args.lang else None
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    if args.escalate_model:
+        from translation_tiers import set_escalation_model
+        set_escalation_model(args.escalate_model)
+    if args.dry_run:
+        return 0 if estimate_paths(paths, args.model, langs) else 1
+    if args.queue:
+        from work_queue import set_queue_path
+        set_queue_path(args.queue)
+    import translation_budget
+    translation_budget.set_limits(args.max_tokens, args.max_cost, args.model)
+    return 0 if translate_paths(
+        paths, args.model, args.compile, interactive=False, langs=langs, preview=args.preview,
+    ) else 1
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command:
+        if args.profile:
+            with tracing.profile(args.profile):
+                code = run_command(args)
+        elif args.trace:
+            with tracing.trace_to(args.trace):
+                code = run_command(args)
+        else:
+            code = run_command(args)
+        sys.exit(code)
     
     os.makedirs(INPUT_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -191,17 +446,19 @@ def main():
         show_main_menu()
         
         try:
-            choice = input("Выберите режим (1-3): ").strip()
+            choice = input("Выберите режим (1-4): ").strip()
             
             if choice == '1':
                 translate_mode()
             elif choice == '2':
                 compile_only_mode()
             elif choice == '3':
+                watch_mode()
+            elif choice == '4':
                 print("\n👋 До свидания!")
                 sys.exit(0)
             else:
-                print("❌ Выберите 1, 2 или 3")
+                print("❌ Выберите 1, 2, 3 или 4")
                 continue
             
             # Спрашиваем, продолжить ли работу
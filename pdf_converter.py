@@ -1,12 +1,20 @@
 # pdf_converter.py
 
+import json
 import os
-import subprocess
-import tempfile
 import shutil
-import zipfile
+import time
 import re
 
+import compile_cache
+import tex_format
+import tracing
+import workspace
+from segment_map import load_segment_map
+from tex_log import CompileResult, build_compile_result
+from tex_deps import all_project_files, resolve_tex_dependencies
+from tex_executor import cleanup_build_dirs, get_executor, project_build_dir
+
 
 def patch_mdpi_for_lualatex(work_dir):
     """Патчит mdpi.cls для совместимости с LuaLaTeX"""
@@ -26,8 +34,12 @@ def patch_mdpi_for_lualatex(work_dir):
                                 "\\RequirePackage{luatex85}\n\n"
                             )
                             content = content[:pos] + fix + content[pos:]
-                            with open(cls_path, "w", encoding="utf-8") as f:
+                            # Пишем через замену файла: в рабочем каталоге mdpi.cls может
+                            # быть жёсткой ссылкой на оригинал, который менять нельзя
+                            tmp_path = cls_path + ".patched"
+                            with open(tmp_path, "w", encoding="utf-8") as f:
                                 f.write(content)
+                            os.replace(tmp_path, cls_path)
                             print(f"  ✓ Патч применён к {file}")
                             return True
                 except Exception as e:
@@ -51,140 +63,291 @@ def detect_document_class(tex_path):
     return None
 
 
-def _run_latexmk_in_docker(work_dir: str, tex_name: str, compiler: str) -> bool:
+def _run_latexmk(executor, work_dir: str, tex_name: str, compiler: str, quiet: bool = False, fmt=None):
     """
-    Запускает latexmk внутри Docker.
-    Возвращает True, если в work_dir появился PDF, даже если latexmk вернул код 1
-    из‑за undefined citations/refs.
+    Запускает latexmk через выбранный исполнитель (см. tex_executor).
+    Возвращает (успех, RunResult_или_None). Успех — в work_dir появился PDF,
+    даже если latexmk вернул код 1 из‑за undefined citations/refs.
     """
-    try:
-        result = subprocess.run(
-            [
-                "docker", "run", "--rm",
-                "-v", f"{work_dir}:/work",
-                "-w", "/work",
-                "texlive/texlive",
-                "latexmk", f"-{compiler}",
-                "-interaction=nonstopmode",
-                "-file-line-error",
-                "-shell-escape",
-                tex_name,
-            ],
-            capture_output=False,
-            text=True,
-            timeout=240,
-        )
-    except subprocess.TimeoutExpired:
-        print("⚠️ Тайм-аут компиляции (4 мин).")
-        return False
-    except Exception as e:
-        print(f"💥 Ошибка запуска Docker: {e}")
-        return False
+    started = time.time()
+    with tracing.span("tex.latexmk", "compile", executor=executor.name, compiler=compiler, fmt=bool(fmt)) as span_args:
+        run_result = executor.run(work_dir, tex_name, compiler, quiet=quiet, fmt=fmt)
+        if run_result is not None:
+            span_args["returncode"] = run_result.returncode
+    if run_result is None:
+        return False, None
 
     pdf_path = os.path.join(work_dir, os.path.splitext(tex_name)[0] + ".pdf")
     if os.path.exists(pdf_path):
-        # PDF есть — считаем компиляцию успешной, даже если latexmk вернул 1
-        return True
+        # В постоянном каталоге сборки может лежать PDF прошлого запуска:
+        # он годится, только если latexmk счёл его актуальным (код 0)
+        if run_result.returncode == 0 or os.path.getmtime(pdf_path) >= started - 1:
+            # PDF есть — считаем компиляцию успешной, даже если latexmk вернул 1
+            return True, run_result
 
     # PDF нет — это реальная ошибка
     print("⚠️ PDF не найден после компиляции. Проверьте лог latexmk.")
-    return False
+    return False, run_result
 
 
-def compile_tex_to_pdf_via_docker(tex_path):
-    """Компилирует .tex файл в .pdf с помощью Docker и LuaLaTeX/XeLaTeX."""
-    if not os.path.exists(tex_path):
-        print("❌ Указанный .tex файл не найден.")
+def _select_compiler(doc_class):
+    """MDPI собирается LuaLaTeX, остальное — XeLaTeX"""
+    if doc_class == "mdpi":
+        return "lualatex", "LuaLaTeX для MDPI"
+    return "xelatex", "XeLaTeX"
+
+
+def _cache_lookup(root_dir, files, compiler, output_pdf, executor):
+    """
+    Считает ключ кэша компиляции и при попадании копирует PDF и лог в output_pdf.
+    Возвращает: (ключ_или_None, найдено_в_кэше)
+    """
+    if not compile_cache.is_enabled():
+        return None, False
+
+    key = compile_cache.compute_cache_key(root_dir, files, compiler, executor.cache_identity(compiler))
+    hit = compile_cache.lookup(key)
+    if hit is None:
+        return key, False
+
+    cached_pdf, cached_log = hit
+    shutil.copy2(cached_pdf, output_pdf)
+    if cached_log:
+        shutil.copy2(cached_log, os.path.splitext(output_pdf)[0] + ".log")
+    print(f"♻️ Исходники не изменились — PDF взят из кэша: {output_pdf}")
+    return key, True
+
+
+# Файлы, которые LaTeX и latexmk пишут при сборке
+GENERATED_EXTENSIONS = ('.aux', '.bbl', '.blg', '.toc', '.lof', '.lot', '.out', '.log', '.fls',
+                        '.fdb_latexmk', '.bcf', '.run.xml', '.idx', '.ind', '.ilg', '.nav', '.snm')
+
+
+def _link_or_copy(src, dst, copy=False):
+    """Жёсткая ссылка вместо копии; копия — если ссылка невозможна или файл будет перезаписан"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if not copy:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _source_files(root_dir, tex_name):
+    """
+    Файлы каталога без результатов сборки и перевода: <stem>.pdf/.log/.diagnostics.json,
+    карты фрагментов, черновики *_preview.* и вспомогательные файлы LaTeX. Иначе они
+    попали бы в ключ кэша, и каждая сборка меняла бы ключ следующей.
+    """
+    from translate_tex import PREVIEW_SUFFIX
+
+    stem = os.path.splitext(tex_name)[0]
+    outputs = {stem + ".pdf", stem + ".log", stem + ".diagnostics.json"}
+    files = []
+    for rel_path in all_project_files(root_dir):
+        name = os.path.basename(rel_path)
+        if (
+            rel_path in outputs
+            or name.endswith((".segments.json", ".diagnostics.json"))
+            or os.path.splitext(name)[0].endswith(PREVIEW_SUFFIX)
+            or name.lower().endswith(GENERATED_EXTENSIONS)
+        ):
+            continue
+        files.append(rel_path)
+    return files
+
+
+def stage_project(src_root, files, work_dir, tex_name):
+    """
+    Раскладывает в work_dir файлы files жёсткими ссылками: для .tex из каталога —
+    зависимости документа (см. tex_deps), поэтому стоимость не зависит от того,
+    сколько ещё лежит рядом с .tex (например, накопившиеся результаты в outputs/);
+    для архива — все его файлы.
+    """
+    stem = os.path.splitext(tex_name)[0]
+    for rel_path in files:
+        # latexmk/bibtex перезаписывают файлы <stem>.* (например, .bbl) и .aux
+        # подключённых через \include — жёсткая ссылка испортила бы оригинал
+        # (и рабочую копию архива), поэтому их копируем
+        rewritten = (
+            (os.path.splitext(rel_path)[0] == stem and rel_path != tex_name)
+            or rel_path.lower().endswith(GENERATED_EXTENSIONS)
+        )
+        try:
+            _link_or_copy(os.path.join(src_root, rel_path), os.path.join(work_dir, rel_path), copy=rewritten)
+        except OSError as e:
+            print(f"⚠️ Не удалось подготовить {rel_path}: {e}")
+
+
+def _publish_pdf(work_dir, tex_name, output_pdf, cache_key):
+    """Копирует собранный PDF (и лог) из рабочего каталога и сохраняет их в кэш"""
+    stem = os.path.splitext(tex_name)[0]
+    generated_pdf = os.path.join(work_dir, stem + ".pdf")
+    if not os.path.exists(generated_pdf):
+        print("⚠️ PDF не найден после копирования.")
         return False
 
+    shutil.copy2(generated_pdf, output_pdf)
+    generated_log = os.path.join(work_dir, stem + ".log")
+    if os.path.exists(generated_log):
+        shutil.copy2(generated_log, os.path.splitext(output_pdf)[0] + ".log")
+    if cache_key:
+        compile_cache.store(cache_key, generated_pdf, generated_log)
+    print(f"✅ PDF создан: {output_pdf}")
+    return True
+
+
+def _compile_in_build_dir(executor, build_dir, tex_name, compiler, output_pdf, cache_key, source_path, quiet):
+    """
+    Компилирует подготовленный каталог сборки и собирает CompileResult: проходы latexmk,
+    ошибки из лога (с привязкой к фрагментам перевода из карты source_path),
+    предупреждения. Диагностика сохраняется в <pdf>.diagnostics.json.
+    """
+    prepared = None
+    if tex_format.is_enabled():
+        with tracing.span("tex.format", "compile"):
+            prepared = tex_format.prepare_format(executor, build_dir, tex_name, compiler, quiet=quiet)
+
+    fmt = prepared[0] if prepared else None
+    ok, run_result = _run_latexmk(executor, build_dir, tex_name, compiler, quiet=quiet, fmt=fmt)
+    if not ok and prepared:
+        # Формат мог устареть или не загрузиться — повторяем обычную компиляцию
+        print("⚠️ Сборка с форматом преамбулы не удалась — компилируем без него.")
+        tex_format.discard_format(build_dir, tex_name, *prepared)
+        ok, run_result = _run_latexmk(executor, build_dir, tex_name, compiler, quiet=quiet)
+    if ok:
+        ok = _publish_pdf(build_dir, tex_name, output_pdf, cache_key)
+
+    log_path = os.path.join(build_dir, os.path.splitext(tex_name)[0] + ".log")
+    result = build_compile_result(
+        ok, output_pdf if ok else None, run_result, log_path,
+        main_tex=tex_name, segment_map=load_segment_map(source_path),
+    )
     try:
-        subprocess.run(["docker", "info"], capture_output=True, check=True, timeout=10)
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-        print("ℹ️ Docker не запущен. Запустите Docker Desktop.")
-        return False
+        with open(os.path.splitext(output_pdf)[0] + ".diagnostics.json", "w", encoding="utf-8") as f:
+            json.dump(result.to_dict(), f, ensure_ascii=False, indent=1)
+    except OSError:
+        pass
+    if not quiet:
+        result.print_summary()
+    return result
+
+
+def _cached_result(output_pdf):
+    result = CompileResult(True, output_pdf)
+    result.cached = True
+    return result
+
+
+def compile_tex_to_pdf_via_docker(tex_path, use_cache=True, force_clean=False, quiet=False):
+    """
+    Компилирует .tex файл в .pdf с помощью Docker и LuaLaTeX/XeLaTeX.
+    Сборка идёт в постоянном каталоге проекта (см. tex_executor.project_build_dir);
+    force_clean=True — чистая пересборка без кэша и старых вспомогательных файлов;
+    quiet=True скрывает вывод latexmk (используется пулом компиляции).
+    Возвращает CompileResult (в логическом контексте — успех).
+    """
+    if not os.path.exists(tex_path):
+        print("❌ Указанный .tex файл не найден.")
+        return CompileResult(False)
+
+    tex_dir = os.path.dirname(os.path.abspath(tex_path))
+    tex_filename = os.path.basename(tex_path)
+    output_pdf = os.path.join(tex_dir, os.path.splitext(tex_filename)[0] + ".pdf")
 
     doc_class = detect_document_class(tex_path)
+    compiler, compiler_label = _select_compiler(doc_class)
+
+    files, missing, dynamic = resolve_tex_dependencies(tex_dir, tex_filename)
+    if missing:
+        print(f"⚠️ Не найдены файлы, на которые ссылается документ: {', '.join(sorted(missing))}")
+    if dynamic:
+        print(f"⚠️ Подключения, вычисляемые при компиляции: {', '.join(sorted(dynamic)[:3])}")
+    if dynamic:
+        # Список зависимостей может быть неполным — в сборку и ключ кэша идёт
+        # весь каталог, кроме результатов прошлых сборок и переводов
+        print("ℹ️ Зависимости определены не полностью — в сборку идут все исходники каталога.")
+        files = sorted(set(files) | set(_source_files(tex_dir, tex_filename)))
+
+    executor = get_executor()
+    cache_key = None
+    if use_cache and not force_clean:
+        with tracing.span("compile.cache_lookup", "cache"):
+            cache_key, hit = _cache_lookup(tex_dir, files, compiler, output_pdf, executor)
+        if hit:
+            return _cached_result(output_pdf)
+
+    if not executor.is_available():
+        print(executor.unavailable_message())
+        return CompileResult(False)
+
+    print(f"🐳 Компиляция в PDF через {executor.label} ({compiler_label})...")
+
+    with tracing.span("compile.stage", "compile", files=len(files)):
+        build_dir = project_build_dir(tex_path, force_clean=force_clean)
+        cleanup_build_dirs(keep=[build_dir])
+        stage_project(tex_dir, files, build_dir, tex_filename)
+
     if doc_class == "mdpi":
-        compiler = "lualatex"
-        print("🐳 Компиляция в PDF через Docker (LuaLaTeX для MDPI)...")
-    else:
-        compiler = "xelatex"
-        print("🐳 Компиляция в PDF через Docker (XeLaTeX)...")
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tex_dir = os.path.dirname(os.path.abspath(tex_path))
-        tex_filename = os.path.basename(tex_path)
-
-        # Копируем весь проект (tex + cls + figs + bib и т.д.)
-        for item in os.listdir(tex_dir):
-            src = os.path.join(tex_dir, item)
-            dst = os.path.join(tmpdir, item)
-            try:
-                if os.path.isfile(src):
-                    shutil.copy2(src, dst)
-                elif os.path.isdir(src):
-                    shutil.copytree(src, dst)
-            except Exception as e:
-                print(f"⚠️ Не удалось скопировать {item}: {e}")
-
-        if doc_class == "mdpi":
-            patch_mdpi_for_lualatex(tmpdir)
-
-        ok = _run_latexmk_in_docker(tmpdir, tex_filename, compiler)
-        if not ok:
-            return False
-
-        generated_pdf = os.path.join(tmpdir, os.path.splitext(tex_filename)[0] + ".pdf")
-        if os.path.exists(generated_pdf):
-            output_pdf = os.path.join(tex_dir, os.path.splitext(tex_filename)[0] + ".pdf")
-            shutil.copy2(generated_pdf, output_pdf)
-            print(f"✅ PDF создан: {output_pdf}")
-            return True
+        patch_mdpi_for_lualatex(build_dir)
 
-        print("⚠️ PDF не найден после копирования.")
-        return False
+    return _compile_in_build_dir(
+        executor, build_dir, tex_filename, compiler, output_pdf, cache_key, tex_path, quiet,
+    )
 
 
-def compile_zip_to_pdf_via_docker(zip_path, main_tex_name):
-    """Компилирует ZIP с LaTeX файлами в PDF."""
+def compile_zip_to_pdf_via_docker(zip_path, main_tex_name, use_cache=True, force_clean=False, quiet=False):
+    """
+    Компилирует ZIP с LaTeX файлами в PDF.
+    Архив распаковывается в постоянный каталог сборки проекта, поэтому .aux/.bbl
+    прошлых запусков переиспользуются; force_clean=True — чистая пересборка.
+    Возвращает CompileResult (в логическом контексте — успех).
+    """
     if not os.path.exists(zip_path):
         print("❌ ZIP-файл не найден.")
-        return False
+        return CompileResult(False)
 
-    try:
-        subprocess.run(["docker", "info"], capture_output=True, check=True, timeout=10)
-    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
-        print("ℹ️ Docker не запущен. Запустите Docker Desktop.")
-        return False
+    output_pdf = os.path.splitext(zip_path)[0] + ".pdf"
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(tmpdir)
-
-        full_tex_path = os.path.join(tmpdir, main_tex_name)
-        if not os.path.exists(full_tex_path):
-            print(f"❌ Главный .tex файл не найден: {main_tex_name}")
-            return False
-
-        doc_class = detect_document_class(full_tex_path)
-        if doc_class == "mdpi":
-            compiler = "lualatex"
-            print("🐳 Компиляция PDF через Docker (LuaLaTeX для MDPI)...")
-            patch_mdpi_for_lualatex(tmpdir)
-        else:
-            compiler = "xelatex"
-            print("🐳 Компиляция PDF через Docker (XeLaTeX)...")
-
-        ok = _run_latexmk_in_docker(tmpdir, main_tex_name, compiler)
-        if not ok:
-            return False
-
-        generated_pdf = os.path.join(tmpdir, os.path.splitext(main_tex_name)[0] + ".pdf")
-        if os.path.exists(generated_pdf):
-            output_pdf = os.path.splitext(zip_path)[0] + ".pdf"
-            shutil.copy2(generated_pdf, output_pdf)
-            print(f"✅ PDF создан: {output_pdf}")
-            return True
+    # Распакованная копия архива общая для перевода и компиляции (см. workspace)
+    project = workspace.open_workspace(zip_path)
+    source_root = project["root"]
+    full_tex_path = os.path.join(source_root, main_tex_name)
+    if not os.path.exists(full_tex_path):
+        print(f"❌ Главный .tex файл не найден: {main_tex_name}")
+        return CompileResult(False)
 
-        print("⚠️ PDF не найден после копирования.")
-        return False
+    doc_class = detect_document_class(full_tex_path)
+    compiler, compiler_label = _select_compiler(doc_class)
+
+    # В сборку и ключ кэша идёт весь архив: разбор зависимостей не видит
+    # подключений из макросов, а лишний файл архива дешевле пропущенного
+    archive_files = [os.path.normpath(rel_path) for rel_path in project["members"]]
+    executor = get_executor()
+    cache_key = None
+    if use_cache and not force_clean:
+        with tracing.span("compile.cache_lookup", "cache"):
+            cache_key, hit = _cache_lookup(source_root, archive_files, compiler, output_pdf, executor)
+        if hit:
+            return _cached_result(output_pdf)
+
+    build_dir = project_build_dir(zip_path, force_clean=force_clean)
+    cleanup_build_dirs(keep=[build_dir])
+    with tracing.span("compile.stage", "compile", file=os.path.basename(zip_path)):
+        stage_project(source_root, archive_files, build_dir, main_tex_name)
+
+    if not executor.is_available():
+        print(executor.unavailable_message())
+        return CompileResult(False)
+
+    print(f"🐳 Компиляция PDF через {executor.label} ({compiler_label})...")
+    if doc_class == "mdpi":
+        patch_mdpi_for_lualatex(build_dir)
+
+    return _compile_in_build_dir(
+        executor, build_dir, main_tex_name, compiler, output_pdf, cache_key, zip_path, quiet,
+    )
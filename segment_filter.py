@@ -0,0 +1,123 @@
+# segment_filter.py
+"""
+Локальный фильтр перед запросом к модели: фрагменты, которые переводить
+не нужно, возвращаются как есть без обращения к сети.
+
+Фрагмент пропускается, если в нём (без заглушек формул, команд LaTeX и ссылок):
+- нет букв — строки таблиц из чисел, одиночные макросы (\\maketitle), URL, DOI;
+- латинских слов из двух и более букв нет или почти нет на фоне чисел и символов;
+- кириллица преобладает, а переводим на русский — абзац уже переведён;
+- это код: большинство строк (кроме \\item и строк таблиц) — внутри
+  verbatim/lstlisting или начинаются с #include, def, import и подобного.
+
+Проверки — несколько регулярных выражений на фрагмент; SEGMENT_FILTER=0 отключает фильтр.
+"""
+import os
+import re
+import threading
+
+from translation_cache import PLACEHOLDER_RE
+
+# Доля кириллицы среди букв, начиная с которой фрагмент считается уже переведённым
+CYRILLIC_SHARE = 0.5
+# Минимальная доля латинских букв среди непробельных символов для коротких фрагментов
+MIN_ALPHA_DENSITY = 0.35
+
+_URL_RE = re.compile(r'(?:https?://|ftp://|www\.)\S+|\b[\w.+-]+@[\w-]+\.[\w.-]+\b|\b10\.\d{4,9}/\S+')
+# \begin{tabular}{cc}, \end{table} — имена окружений и спецификации колонок не текст
+_COMMAND_RE = re.compile(r'\\begin\{[^}]*\}(?:\{[^}]*\})?|\\end\{[^}]*\}|\\[A-Za-z@]+\*?')
+_LATIN_RE = re.compile(r'[A-Za-z]')
+_CYRILLIC_RE = re.compile(r'[А-Яа-яЁё]')
+_WORD_RE = re.compile(r'[A-Za-z]{2,}')
+_DIGIT_RE = re.compile(r'\d')
+# Только явные признаки кода: «;», «&&», «->», «::» встречаются и в LaTeX
+# (пункты списков, пустые ячейки таблиц, стрелки в тексте)
+_CODE_LINE_RE = re.compile(
+    r'^\s*(?:#include\b|#define\b|#!|def \w+\s*\(|class \w+\s*[:(]|from \S+ import |import \w[\w.]*\s*$'
+    r'|public (?:static )?\w+|int main\s*\()'
+)
+_CODE_ENV_BEGIN_RE = re.compile(r'\\begin\{(?:verbatim|Verbatim|lstlisting|minted)\}')
+_CODE_ENV_END_RE = re.compile(r'\\end\{(?:verbatim|Verbatim|lstlisting|minted)\}')
+# Пункты списков и строки таблиц/формул — разметка LaTeX, а не код
+_STRUCTURE_LINE_RE = re.compile(r'^\s*\\item\b|&|\\\\\s*$')
+
+REASONS = {
+    "no_text": "без текста (числа, макросы)",
+    "url": "ссылки и адреса",
+    "numeric": "числа и символы",
+    "russian": "уже по-русски",
+    "code": "код",
+}
+
+_lock = threading.Lock()
+stats = {reason: 0 for reason in REASONS}
+
+
+def is_enabled():
+    return os.getenv("SEGMENT_FILTER", "1") != "0"
+
+
+def classify(text, lang="ru"):
+    """
+    Причина не переводить фрагмент на язык lang (ключ REASONS) или None —
+    фрагмент нужно перевести. lang=None — язык не один (проверка «уже
+    по-русски» отключается).
+    """
+    without_placeholders = PLACEHOLDER_RE.sub(" ", text)
+    without_urls = _URL_RE.sub(" ", without_placeholders)
+    plain = _COMMAND_RE.sub(" ", without_urls)
+
+    latin = len(_LATIN_RE.findall(plain))
+    cyrillic = len(_CYRILLIC_RE.findall(plain))
+    if latin + cyrillic == 0:
+        return "url" if without_urls != without_placeholders else "no_text"
+    if lang == "ru" and cyrillic >= CYRILLIC_SHARE * (latin + cyrillic):
+        return "russian"
+
+    words = _WORD_RE.findall(plain)
+    if not words:
+        return "numeric"
+    if len(words) <= 3:
+        visible = sum(1 for char in plain if not char.isspace())
+        if latin < MIN_ALPHA_DENSITY * visible or len(_DIGIT_RE.findall(plain)) > latin:
+            return "numeric"
+
+    # Строки внутри verbatim/lstlisting — код; абзац текста рядом с листингом переводится
+    lines = code_lines = 0
+    in_listing = False
+    for line in without_placeholders.splitlines():
+        if _CODE_ENV_BEGIN_RE.search(line):
+            in_listing = True
+        if line.strip() and (in_listing or not _STRUCTURE_LINE_RE.search(line)):
+            lines += 1
+            code_lines += in_listing or bool(_CODE_LINE_RE.search(line))
+        if _CODE_ENV_END_RE.search(line):
+            in_listing = False
+    if lines >= 2 and code_lines * 2 > lines:
+        return "code"
+    return None
+
+
+def should_skip(text, lang="ru"):
+    """True, если фрагмент переводить не нужно (и учитывает его в статистике)"""
+    if not is_enabled():
+        return False
+    reason = classify(text, lang)
+    if reason is None:
+        return False
+    with _lock:
+        stats[reason] += 1
+    return True
+
+
+def reset_stats():
+    for reason in stats:
+        stats[reason] = 0
+
+
+def print_report():
+    """Сколько запросов к модели сэкономил фильтр с последнего reset_stats()"""
+    saved = sum(stats.values())
+    if saved:
+        details = ", ".join(f"{REASONS[reason]} — {count}" for reason, count in stats.items() if count)
+        print(f"🧹 Без запроса к модели: {saved} ({details})")
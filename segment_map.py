@@ -0,0 +1,102 @@
+# segment_map.py
+"""
+Карта фрагментов перевода: какие строки итогового .tex получены из какого
+исходного абзаца. Хранится рядом с результатом (<файл>.segments.json) и
+используется, чтобы привязать ошибки компиляции к фрагментам и перевести
+заново только их.
+
+Во время перевода каждый абзац оборачивается маркерами из области Private Use
+Unicode; они переживают все последующие regex-замены и вырезаются перед записью
+файла с подсчётом номеров строк.
+"""
+import json
+import os
+import re
+
+SEGMENT_START = "\ue000"
+SEGMENT_ID_END = "\ue001"
+SEGMENT_END = "\ue002"
+
+_MARKER_RE = re.compile(f"{SEGMENT_START}(\\d+){SEGMENT_ID_END}|{SEGMENT_END}")
+
+
+def wrap_segment(segment_id, text):
+    return f"{SEGMENT_START}{segment_id}{SEGMENT_ID_END}{text}{SEGMENT_END}"
+
+
+def extract_segment_markers(text, segments):
+    """
+    Убирает маркеры из текста и проставляет фрагментам start_line/end_line (с 1)
+    и text — итоговый текст фрагмента, по которому он находится при повторном переводе.
+    segments — список словарей с ключом "id" (как их собрал translate_body).
+    Возвращает текст без маркеров.
+    """
+    by_id = {segment["id"]: segment for segment in segments}
+    parts = []
+    length = 0
+    line = 1
+    pos = 0
+    open_segments = []
+    for m in _MARKER_RE.finditer(text):
+        chunk = text[pos:m.start()]
+        parts.append(chunk)
+        length += len(chunk)
+        line += chunk.count("\n")
+        pos = m.end()
+        if m.group(1) is not None:
+            open_segments.append((int(m.group(1)), line, length))
+        elif open_segments:
+            segment_id, start_line, start_offset = open_segments.pop()
+            segment = by_id.get(segment_id)
+            if segment is not None:
+                segment["start_line"] = start_line
+                segment["end_line"] = line
+                segment["_span"] = (start_offset, length)
+    parts.append(text[pos:])
+    result = "".join(parts)
+
+    for segment in segments:
+        span = segment.pop("_span", None)
+        if span is not None:
+            segment["text"] = result[span[0]:span[1]]
+    return result
+
+
+def segment_map_path(output_path):
+    """Путь карты фрагментов для переведённого .tex или .zip"""
+    return output_path + ".segments.json"
+
+
+def save_segment_map(output_path, files, lang=None):
+    """files — {относительный_путь_tex: [фрагменты]}; lang — язык перевода (для повторного перевода)"""
+    data = {"files": {}}
+    if lang is not None:
+        data["lang"] = lang
+    for rel_path, segments in files.items():
+        data["files"][rel_path.replace(os.sep, "/")] = [
+            segment for segment in segments if "start_line" in segment and "end_line" in segment
+        ]
+    with open(segment_map_path(output_path), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+
+
+def load_segment_map(output_path):
+    path = segment_map_path(output_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_segment(segment_map, file_name, line):
+    """Идентификатор фрагмента, содержащего строку line файла file_name, или None"""
+    key = os.path.normpath(file_name).replace(os.sep, "/")
+    if key.startswith("./"):
+        key = key[2:]
+    for segment in segment_map.get("files", {}).get(key, []):
+        if segment["start_line"] <= line <= segment["end_line"]:
+            return segment["id"]
+    return None
@@ -0,0 +1,204 @@
+# shared_quota.py
+"""
+Общая квота запросов к API для всех процессов переводчика на этой машине.
+
+Несколько человек и задач cron с одним ключом API раньше отступали от 429
+независимо друг от друга: все разом упирались в лимит, все разом замолкали.
+Теперь разрешения на запросы выдаёт одно ведро на ключ (хэш адреса сервера
+и ключа) в .cache/quota.sqlite3, а его изменения идут под блокировкой SQLite
+(BEGIN IMMEDIATE), поэтому суммарный поток всех процессов держится у лимита:
+
+- TRANSLATION_RPM — запросов в минуту, TRANSLATION_TPM — токенов в минуту
+  (оценка по translation_budget.estimate_tokens, после ответа уточняется по
+  usage). Ведро вмещает QUOTA_BURST_SECONDS секунд лимита, так что после
+  простоя не уходит разом поминутный объём;
+- 429 от сервера в любом процессе ставит общую паузу для всех: 2, 4, 8…
+  (до MAX_COOLDOWN) секунд подряд идущих отказов или Retry-After сервера;
+  первый успешный ответ сбрасывает счётчик.
+
+Квота действует для бэкендов с ограничением частоты (rate_limited);
+SHARED_QUOTA=0 отключает её.
+"""
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import tracing
+
+QUOTA_PATH = os.path.abspath(os.getenv("QUOTA_PATH", os.path.join(".cache", "quota.sqlite3")))
+
+QUOTA_BURST_SECONDS = 10
+BASE_COOLDOWN = 2.0
+MAX_COOLDOWN = 60.0
+# Ожидание проверяет ведро заново не реже, чем раз в столько секунд
+MAX_WAIT_STEP = 5.0
+
+_lock = threading.Lock()
+_connection = None
+
+# Счётчики с начала процесса
+stats = {"waits": 0, "waited_seconds": 0.0, "rate_limited": 0}
+
+
+def is_enabled():
+    return os.getenv("SHARED_QUOTA", "1") != "0"
+
+
+def _limit(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def limits():
+    """(запросов в минуту, токенов в минуту); None — без ограничения"""
+    return _limit("TRANSLATION_RPM"), _limit("TRANSLATION_TPM")
+
+
+def quota_key(url, api_key):
+    """Ведро на пару (сервер, ключ): сам ключ в файл не пишется"""
+    return hashlib.sha256(f"{url}\0{api_key or ''}".encode("utf-8")).hexdigest()[:32]
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(QUOTA_PATH), exist_ok=True)
+        # isolation_level=None — транзакции открываем сами (BEGIN IMMEDIATE)
+        _connection = sqlite3.connect(QUOTA_PATH, check_same_thread=False, timeout=30, isolation_level=None)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL,"
+            " cooldown_until REAL, strikes INTEGER)"
+        )
+    return _connection
+
+
+@contextlib.contextmanager
+def _bucket(key, rpm, tpm):
+    """
+    Строка ведра key под блокировкой записи (для всех процессов), пополненная
+    на время с прошлого обращения; изменения словаря сохраняются при выходе.
+    """
+    with _lock:
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = db.execute(
+                "SELECT requests, tokens, updated, cooldown_until, strikes FROM buckets WHERE key = ?", (key,),
+            ).fetchone()
+            request_capacity = _capacity(rpm)
+            token_capacity = _capacity(tpm)
+            if row is None:
+                bucket = {
+                    "requests": request_capacity, "tokens": token_capacity,
+                    "cooldown_until": 0.0, "strikes": 0,
+                }
+            else:
+                requests, tokens, updated, cooldown_until, strikes = row
+                elapsed = max(now - updated, 0.0)
+                bucket = {
+                    "requests": _refill(requests, elapsed, rpm, request_capacity),
+                    "tokens": _refill(tokens, elapsed, tpm, token_capacity),
+                    "cooldown_until": cooldown_until, "strikes": strikes,
+                }
+            bucket["now"] = now
+            yield bucket
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (key, requests, tokens, updated, cooldown_until, strikes)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, bucket["requests"], bucket["tokens"], now, bucket["cooldown_until"], bucket["strikes"]),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+
+def _capacity(per_minute):
+    if per_minute is None:
+        return 0.0
+    return max(per_minute * QUOTA_BURST_SECONDS / 60, 1.0)
+
+
+def _refill(level, elapsed, per_minute, capacity):
+    if per_minute is None:
+        return 0.0
+    # Лимит мог уменьшиться с прошлого запуска — запас не больше нового ведра
+    return min(level + elapsed * per_minute / 60, capacity)
+
+
+def acquire(key, tokens=0):
+    """
+    Ждёт разрешения на запрос ~tokens токенов по общей квоте ключа key:
+    общая пауза после 429, затем по одному запросу и tokens токенов из ведра.
+    """
+    rpm, tpm = limits()
+    waited = 0.0
+    while True:
+        with _bucket(key, rpm, tpm) as bucket:
+            now = bucket["now"]
+            wait = bucket["cooldown_until"] - now
+            if wait <= 0:
+                # Запрос крупнее всего ведра ждёт только его заполнения
+                needed = min(tokens, _capacity(tpm))
+                wait_requests = (1 - bucket["requests"]) * 60 / rpm if rpm else 0.0
+                wait_tokens = (needed - bucket["tokens"]) * 60 / tpm if tpm else 0.0
+                wait = max(wait_requests, wait_tokens)
+                if wait <= 0:
+                    if rpm:
+                        bucket["requests"] -= 1
+                    if tpm:
+                        bucket["tokens"] -= tokens
+                    break
+        step = min(wait, MAX_WAIT_STEP)
+        tracing.traced_sleep(step, "quota.wait")
+        waited += step
+    if waited:
+        with _lock:
+            stats["waits"] += 1
+            stats["waited_seconds"] += waited
+
+
+def settle(key, estimated, usage):
+    """
+    Заменяет оценку токенов фактическим расходом из ответа: usage=None — остаётся
+    оценка, {} — токены не израсходованы (неудачный запрос).
+    """
+    rpm, tpm = limits()
+    if not tpm or usage is None:
+        return
+    actual = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    with _bucket(key, rpm, tpm) as bucket:
+        # Уровень может уйти в минус: долг вернётся ожиданием следующих запросов
+        bucket["tokens"] -= actual - estimated
+
+
+def report(key, status, retry_after=None):
+    """
+    Итог запроса: 429 ставит общую паузу для всех процессов (Retry-After или
+    растущую с каждым отказом подряд), успешный ответ сбрасывает счётчик отказов.
+    """
+    rpm, tpm = limits()
+    with _bucket(key, rpm, tpm) as bucket:
+        if status == 429:
+            bucket["strikes"] += 1
+            pause = retry_after or min(BASE_COOLDOWN * 2 ** (bucket["strikes"] - 1), MAX_COOLDOWN)
+            bucket["cooldown_until"] = max(bucket["cooldown_until"], bucket["now"] + pause)
+        elif status == 200:
+            bucket["strikes"] = 0
+    if status == 429:
+        with _lock:
+            stats["rate_limited"] += 1
+
+
+def print_report():
+    """Сколько процесс ждал общую квоту с начала работы"""
+    if stats["waits"] or stats["rate_limited"]:
+        print(
+            f"🚦 Общая квота: ожиданий {stats['waits']} ({stats['waited_seconds']:.0f} с), "
+            f"ответов 429: {stats['rate_limited']}"
+        )
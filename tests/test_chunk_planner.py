@@ -0,0 +1,14 @@
+import chunk_planner
+
+
+def test_max_output_tokens_follows_chunk_size():
+    small = chunk_planner.max_output_tokens(500)
+    large = chunk_planner.max_output_tokens(max(chunk_planner.CANDIDATE_CHUNK_CHARS))
+    assert small < large
+    assert small == 500 * chunk_planner.OUTPUT_TOKENS_PER_CHAR + chunk_planner.OUTPUT_TOKENS_MARGIN
+    assert large < 4000
+
+
+def test_max_output_tokens_bounds():
+    assert chunk_planner.max_output_tokens(0) >= chunk_planner.MIN_OUTPUT_TOKENS
+    assert chunk_planner.max_output_tokens(10 ** 7) == chunk_planner.MAX_OUTPUT_TOKENS
@@ -0,0 +1,15 @@
+import compile_cache
+import tex_executor
+
+
+def test_cache_key_depends_on_executor(tmp_path):
+    (tmp_path / "main.tex").write_text("\\documentclass{article}", encoding="utf-8")
+    stub = tex_executor.get_executor("stub")
+    docker = tex_executor.get_executor("docker")
+
+    keys = {
+        compile_cache.compute_cache_key(str(tmp_path), ["main.tex"], "xelatex", executor.cache_identity("xelatex"))
+        for executor in (stub, docker)
+    }
+
+    assert len(keys) == 2
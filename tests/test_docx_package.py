@@ -0,0 +1,53 @@
+import pytest
+from lxml import etree
+
+import docx_package
+
+W = docx_package.W_NS
+R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _paragraph(body):
+    return etree.fromstring(f'<w:p xmlns:w="{W}" xmlns:r="{R}">{body}</w:p>')
+
+
+def _run(text):
+    return f'<w:r><w:t xml:space="preserve">{text}</w:t></w:r>'
+
+
+@pytest.fixture(autouse=True)
+def fake_translation(monkeypatch):
+    monkeypatch.setattr(docx_package, "chunk_text_by_sentences_safe", lambda text: [text])
+    monkeypatch.setattr(docx_package, "translate_chunk", lambda chunk: chunk.upper())
+
+
+def test_hyperlink_mid_paragraph_is_translated_in_place():
+    p = _paragraph(
+        _run("See the ")
+        + f'<w:hyperlink r:id="rId5">{_run("project documentation")}</w:hyperlink>'
+        + _run(" for more details.")
+    )
+
+    assert docx_package.translate_paragraph_xml(p)
+
+    tags = [etree.QName(child).localname for child in p]
+    assert tags == ["r", "hyperlink", "r"]
+    link = p.find(docx_package.W_HYPERLINK)
+    assert link.get(f"{{{R}}}id") == "rId5"
+    assert "".join(t.text for t in link.iter(docx_package.W_T)) == "PROJECT DOCUMENTATION"
+    assert "".join(t.text for t in p.iter(docx_package.W_T)) == "SEE THE PROJECT DOCUMENTATION FOR MORE DETAILS."
+
+
+def test_tracked_insertion_and_content_control_are_translated():
+    p = _paragraph(
+        _run("The method ")
+        + f'<w:ins w:id="1" w:author="A">{_run("was revised and")}</w:ins>'
+        + _run(" converges ")
+        + f'<w:sdt><w:sdtPr/><w:sdtContent>{_run("quite fast")}</w:sdtContent></w:sdt>'
+    )
+
+    assert docx_package.translate_paragraph_xml(p)
+
+    assert [etree.QName(child).localname for child in p] == ["r", "ins", "r", "sdt"]
+    text = "".join(t.text for t in p.iter(docx_package.W_T))
+    assert text == "THE METHOD WAS REVISED AND CONVERGES QUITE FAST"
@@ -0,0 +1,38 @@
+import segment_filter
+
+
+def test_itemize_with_semicolons_is_translated():
+    text = (
+        "We study the following problems in this paper:\n"
+        "\\begin{itemize}\n"
+        "\\item estimation of the drift parameter;\n"
+        "\\item estimation of the diffusion coefficient;\n"
+        "\\item testing the hypothesis of stationarity;\n"
+        "\\item numerical experiments on simulated data;\n"
+        "\\item application to the financial time series.\n"
+        "\\end{itemize}"
+    )
+    assert segment_filter.classify(text) is None
+
+
+def test_table_rows_with_empty_cells_are_translated():
+    text = (
+        "\\begin{tabular}{lll}\n"
+        "Parameter && Description \\\\\n"
+        "Drift && Mean rate of change \\\\\n"
+        "Volatility && Standard deviation of returns \\\\\n"
+        "\\end{tabular}"
+    )
+    assert segment_filter.classify(text) is None
+
+
+def test_prose_with_arrows_is_translated():
+    text = "The mapping x -> f(x) is continuous;\nhence the sequence converges -> the limit exists;"
+    assert segment_filter.classify(text) is None
+
+
+def test_code_is_skipped():
+    text = "#include <stdio.h>\nint main() {\n#define N 10\n"
+    assert segment_filter.classify(text) == "code"
+    listing = "\\begin{lstlisting}\nx = compute(y)\nprint(x)\n\\end{lstlisting}"
+    assert segment_filter.classify(listing) == "code"
@@ -0,0 +1,38 @@
+import tex_deps
+
+
+def _write(root, rel_path, content=""):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def test_plain_project_has_no_dynamic_references(tmp_path):
+    _write(tmp_path, "main.tex", "\\documentclass{article}\n\\input{intro}\n\\bibliography{a, b}\n")
+    _write(tmp_path, "intro.tex", "\\includegraphics{plot.png}\n")
+    for name in ("plot.png", "a.bib", "b.bib"):
+        _write(tmp_path, name)
+
+    files, missing, dynamic = tex_deps.resolve_tex_dependencies(str(tmp_path), "main.tex")
+
+    assert files == ["a.bib", "b.bib", "intro.tex", "main.tex", "plot.png"]
+    assert not missing and not dynamic
+
+
+def test_macro_includes_and_listings_are_dynamic(tmp_path):
+    _write(
+        tmp_path, "main.tex",
+        "\\newcommand{\\chapterfile}[1]{\\input{chapters/#1}}\n"
+        "\\graphicspath{{figs/}}\n"
+        "\\includegraphics{plot}\n"
+        "\\lstinputlisting{solver.py}\n",
+    )
+    _write(tmp_path, "figs/plot.pdf")
+    _write(tmp_path, "code/solver.py")
+
+    files, missing, dynamic = tex_deps.resolve_tex_dependencies(str(tmp_path), "main.tex")
+
+    assert "figs/plot.pdf" in files
+    assert not missing
+    assert len(dynamic) == 3
+    assert sorted(tex_deps.all_project_files(str(tmp_path))) == ["code/solver.py", "figs/plot.pdf", "main.tex"]
@@ -0,0 +1,41 @@
+import tex_executor
+
+
+def test_latexmk_command_passes_engine_command_as_one_argument():
+    args = tex_executor.latexmk_command("main.tex", "xelatex", fmt="preamble-abc")
+
+    assert args[0] == "latexmk"
+    assert args[1] == "-xelatex=xelatex -no-pdf -fmt=preamble-abc %O %S"
+    assert args[-1] == "main.tex"
+
+
+def test_latexmk_command_without_format():
+    args = tex_executor.latexmk_command("main.tex", "lualatex")
+
+    assert args[1] == "-lualatex"
+
+
+class _Inspect:
+    returncode = 0
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+
+def _container_image(monkeypatch, build_root, cache_root):
+    output = (
+        f"true sha256:abc\n"
+        f"{tex_executor.CONTAINER_BUILD_ROOT}={build_root}\n"
+        f"{tex_executor.CONTAINER_CACHE_ROOT}={cache_root}/abc\n"
+    )
+    monkeypatch.setattr(tex_executor.subprocess, "run", lambda *args, **kwargs: _Inspect(output))
+    return tex_executor.DockerExecExecutor()._container_image()
+
+
+def test_warm_container_is_reused_only_with_current_mounts(monkeypatch, tmp_path):
+    monkeypatch.setattr(tex_executor, "BUILD_ROOT", str(tmp_path / "build"))
+    monkeypatch.setattr(tex_executor, "TEX_CACHE_ROOT", str(tmp_path / "texmf"))
+
+    assert _container_image(monkeypatch, tmp_path / "build", tmp_path / "texmf") == "sha256:abc"
+    assert _container_image(monkeypatch, tmp_path / "other" / "build", tmp_path / "texmf") is None
+    assert _container_image(monkeypatch, tmp_path / "build", tmp_path / "other") is None
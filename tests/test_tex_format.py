@@ -0,0 +1,31 @@
+import tex_format
+
+
+def _body_line(content):
+    return content.split("\n").index("\\begin{document}")
+
+
+def test_preamble_without_blank_lines_keeps_body_line():
+    content = (
+        "\\documentclass{article}\n"
+        "\\usepackage{fontspec}\n"
+        "\\setmainfont{Times New Roman}\n"
+        "\\usepackage{amsmath}\n"
+        "\\usepackage{hyperref} % links\n"
+        "\\begin{document}\n"
+        "Text.\n"
+        "\\end{document}"
+    )
+
+    dump_text, document = tex_format.split_preamble(content)
+
+    assert _body_line(document) == _body_line(content)
+    assert "\\endofdump" in document.split("\n")
+    assert "\\setmainfont{Times New Roman}" in document.split("\n")
+    assert dump_text == "\\documentclass{article}\n\\usepackage{fontspec}\n\\usepackage{amsmath}\n\\usepackage{hyperref} % links"
+
+
+def test_preamble_too_short_to_compact_is_not_dumped():
+    content = "\\documentclass{article} % one line\n\\begin{document}\nText.\n\\end{document}"
+
+    assert tex_format.split_preamble(content) is None
@@ -0,0 +1,10 @@
+import translation_cache
+
+
+def test_all_placeholder_kinds_are_renumbered_and_restored():
+    text = "See __TEXTMATH_5__ and __MATH_9__ near __PROTECTED_12__, then __P4__ and __TEXTMATH_5__."
+
+    normalized, mapping = translation_cache.normalize_placeholders(text)
+
+    assert normalized == "See __TEXTMATH_0__ and __MATH_0__ near __PROTECTED_0__, then __P0__ and __TEXTMATH_0__."
+    assert translation_cache.restore_placeholders(normalized, mapping) == text
@@ -0,0 +1,237 @@
+# tex_deps.py
+"""
+Разбор зависимостей LaTeX-проекта: какие файлы реально нужны главному .tex
+(\\input, \\include, \\includegraphics, \\bibliography, локальные .cls/.sty/.bst).
+"""
+import os
+import re
+
+GRAPHICS_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.eps', '.ps', '.mps', '.svg', '.jbig2')
+
+# Файлы, которые разбираем рекурсивно в поисках новых зависимостей
+SCANNED_EXTENSIONS = {'.tex', '.cls', '.sty', '.ltx'}
+
+# Файлы, которые latexmk подхватывает из корня проекта сам
+ROOT_CONFIG_FILES = ('latexmkrc', '.latexmkrc')
+
+# Готовые вспомогательные файлы главного документа (например, .bbl из архива arXiv)
+PREBUILT_AUX_EXTENSIONS = ('.bbl', '.ind', '.gls', '.nls')
+
+_COMMENT_RE = re.compile(r'(?<!\\)%.*')
+
+_INPUT_RE = re.compile(
+    r'\\(?:input|include|subfile|InputIfFileExists|lstinputlisting|verbatiminput)'
+    r'(?:\[[^\]]*\])?\s*\{([^}]+)\}'
+)
+_INPUT_BARE_RE = re.compile(r'\\input\s+([^\s{}\\]+)')
+_IMPORT_RE = re.compile(r'\\(?:sub)?(?:import|includefrom|inputfrom)\*?\s*\{([^}]*)\}\s*\{([^}]+)\}')
+_GRAPHICS_RE = re.compile(r'\\includegraphics\*?(?:\[[^\]]*\])*\s*\{([^}]+)\}')
+_GRAPHICSPATH_RE = re.compile(r'\\graphicspath\s*\{((?:\s*\{[^}]*\})+)\s*\}')
+_BIBLIOGRAPHY_RE = re.compile(r'\\bibliography\s*\{([^}]+)\}')
+_BIBRESOURCE_RE = re.compile(r'\\addbibresource(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+_BIBSTYLE_RE = re.compile(r'\\bibliographystyle\s*\{([^}]+)\}')
+_CLASS_RE = re.compile(r'\\(?:documentclass|LoadClass(?:WithOptions)?)(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+_PACKAGE_RE = re.compile(r'\\(?:usepackage|RequirePackage(?:WithOptions)?)(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+# Имя файла вычисляется при компиляции: макрос или параметр макроса (#1)
+_DYNAMIC_NAME_RE = re.compile(r'[\\#]')
+# Библиографии multibib (\newcites) и \lstset{inputpath=...} — файлы ищутся не по имени
+_DYNAMIC_SOURCES_RE = re.compile(r'\\newcites\b|\binputpath\s*=')
+
+
+def _strip_comments(content):
+    return "\n".join(_COMMENT_RE.sub("", line) for line in content.splitlines())
+
+
+def _split_names(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class _Resolver:
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.found = set()
+        self.missing = set()
+        self.graphics_paths = [""]
+        self.support_dirs = set()
+        # Ссылки, которые разбор по именам не разрешает (см. resolve_tex_dependencies)
+        self.dynamic = set()
+
+    def _is_dynamic(self, match):
+        if _DYNAMIC_NAME_RE.search(match.group(1)):
+            self.dynamic.add(match.group(0)[:60])
+            return True
+        return False
+
+    def _existing(self, rel_path):
+        rel_path = os.path.normpath(rel_path.strip().strip('"'))
+        if rel_path.startswith(os.pardir) or os.path.isabs(rel_path):
+            return None
+        full = os.path.join(self.root_dir, rel_path)
+        return rel_path if os.path.isfile(full) else None
+
+    def _add(self, rel_path, queue):
+        if rel_path in self.found:
+            return
+        self.found.add(rel_path)
+        if os.path.splitext(rel_path)[1].lower() in SCANNED_EXTENSIONS:
+            queue.append(rel_path)
+
+    def _resolve_one(self, name, extensions, queue, base_dir="", required=True):
+        """Ищет файл name (с одним из расширений) относительно корня и base_dir"""
+        hits = []
+        for directory in dict.fromkeys([base_dir, ""]):
+            for ext in extensions:
+                candidate = self._existing(os.path.join(directory, name + ext))
+                if candidate:
+                    hits.append(candidate)
+            if hits:
+                break
+        for hit in hits:
+            self._add(hit, queue)
+        if not hits and required:
+            self.missing.add(name)
+        return hits
+
+    def scan(self, rel_path, queue):
+        try:
+            with open(os.path.join(self.root_dir, rel_path), "r", encoding="utf-8", errors="replace") as f:
+                content = _strip_comments(f.read())
+        except OSError:
+            return
+
+        base_dir = os.path.dirname(rel_path)
+
+        for m in _GRAPHICSPATH_RE.finditer(content):
+            for path in re.findall(r'\{([^}]*)\}', m.group(1)):
+                if path not in self.graphics_paths:
+                    self.graphics_paths.append(path)
+
+        for m in _DYNAMIC_SOURCES_RE.finditer(content):
+            self.dynamic.add(m.group(0))
+
+        for m in list(_INPUT_RE.finditer(content)) + list(_INPUT_BARE_RE.finditer(content)):
+            if self._is_dynamic(m):
+                continue
+            name = m.group(1).strip()
+            listing = m.group(0).startswith(("\\lstinputlisting", "\\verbatiminput"))
+            if not self._resolve_one(name, ("", ".tex"), queue, required=not listing) and listing:
+                # \lstinputlisting ищет и по inputpath, \verbatiminput — по путям TeX
+                self.dynamic.add(m.group(0)[:60])
+
+        for m in _IMPORT_RE.finditer(content):
+            self._resolve_one(os.path.join(m.group(1), m.group(2)), ("", ".tex"), queue)
+
+        for m in _GRAPHICS_RE.finditer(content):
+            if self._is_dynamic(m):
+                continue
+            name = m.group(1).strip()
+            if len(self.graphics_paths) > 1 and not os.path.splitext(name)[1]:
+                # Какое из расширений и из какого каталога \graphicspath возьмёт драйвер,
+                # решается при компиляции — берём все найденные и отмечаем сомнение
+                self.dynamic.add(m.group(0)[:60])
+            hits = []
+            for gpath in self.graphics_paths:
+                hits = self._resolve_one(
+                    os.path.join(gpath, name), ("",) + GRAPHICS_EXTENSIONS, queue, required=False,
+                )
+                if hits:
+                    break
+            if not hits:
+                self.missing.add(name)
+
+        for m in _BIBLIOGRAPHY_RE.finditer(content):
+            if self._is_dynamic(m):
+                continue
+            for name in _split_names(m.group(1)):
+                self._resolve_one(name, (".bib", ""), queue)
+        for m in _BIBRESOURCE_RE.finditer(content):
+            self._resolve_one(m.group(1), ("",), queue)
+
+        # Классы, пакеты и стили библиографии могут быть системными — отсутствие не ошибка
+        for m in _BIBSTYLE_RE.finditer(content):
+            self._resolve_one(m.group(1), (".bst",), queue, base_dir, required=False)
+        for m in _CLASS_RE.finditer(content):
+            for hit in self._resolve_one(m.group(1), (".cls",), queue, base_dir, required=False):
+                self._note_support_dir(hit)
+        for m in _PACKAGE_RE.finditer(content):
+            for name in _split_names(m.group(1)):
+                for hit in self._resolve_one(name, (".sty",), queue, base_dir, required=False):
+                    self._note_support_dir(hit)
+
+    def _note_support_dir(self, rel_path):
+        # Классы вроде Definitions/mdpi.cls тянут логотипы и конфиги из своего каталога
+        directory = os.path.dirname(rel_path)
+        if directory:
+            self.support_dirs.add(directory)
+
+    def add_support_dirs(self):
+        for directory in sorted(self.support_dirs):
+            for root, _, files in os.walk(os.path.join(self.root_dir, directory)):
+                for f in files:
+                    self.found.add(os.path.relpath(os.path.join(root, f), self.root_dir))
+
+
+def resolve_tex_dependencies(root_dir, main_tex):
+    """
+    Находит файлы, от которых зависит компиляция main_tex (путь относительно root_dir).
+    Возвращает: (отсортированный_список_относительных_путей, множество_ненайденных_ссылок,
+    множество_динамических_ссылок). Динамические — имена из макросов (\\input{\\dir/#1}),
+    \\includegraphics без расширения при \\graphicspath, ненайденный \\lstinputlisting,
+    \\newcites и inputpath: по ним список файлов может быть неполным.
+    """
+    resolver = _Resolver(root_dir)
+    main_rel = os.path.normpath(main_tex)
+    queue = []
+    resolver._add(main_rel, queue)
+
+    while queue:
+        resolver.scan(queue.pop(0), queue)
+
+    resolver.add_support_dirs()
+    main_stem = os.path.splitext(main_rel)[0]
+    extra = list(ROOT_CONFIG_FILES) + [main_stem + ext for ext in PREBUILT_AUX_EXTENSIONS]
+    for name in extra:
+        if os.path.isfile(os.path.join(resolver.root_dir, name)):
+            resolver.found.add(name)
+
+    return sorted(resolver.found), resolver.missing, resolver.dynamic
+
+
+def all_project_files(root_dir):
+    """Все файлы каталога проекта, кроме скрытых каталогов (.git, .cache)"""
+    files = []
+    for root, dirs, names in os.walk(root_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            files.append(os.path.relpath(os.path.join(root, name), root_dir))
+    return files
+
+
+def included_tex_files(root_dir, rel_path):
+    """
+    .tex-файлы, которые rel_path подключает напрямую (\\input, \\include,
+    \\subfile, \\import), в порядке подключения — рёбра графа включений.
+    """
+    resolver = _Resolver(root_dir)
+    try:
+        with open(os.path.join(resolver.root_dir, rel_path), "r", encoding="utf-8", errors="replace") as f:
+            content = _strip_comments(f.read())
+    except OSError:
+        return []
+
+    # \lstinputlisting и \verbatiminput подключают не LaTeX-текст
+    names = [
+        (m.start(), m.group(1)) for m in _INPUT_RE.finditer(content)
+        if m.group(0).startswith(("\\input", "\\include", "\\subfile"))
+    ]
+    names += [(m.start(), m.group(1)) for m in _INPUT_BARE_RE.finditer(content)]
+    names += [(m.start(), os.path.join(m.group(1), m.group(2))) for m in _IMPORT_RE.finditer(content)]
+
+    included = []
+    for _, name in sorted(names):
+        for ext in ("", ".tex"):
+            hit = resolver._existing(name.strip() + ext)
+            if hit and hit.lower().endswith(".tex") and hit not in included:
+                included.append(hit)
+                break
+    return included
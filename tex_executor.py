@@ -0,0 +1,524 @@
+# tex_executor.py
+"""
+Исполнители latexmk для pdf_converter.
+
+- DockerExecExecutor — долгоживущий контейнер texlive, команды через `docker exec`
+  (контейнер и прогретое дерево TeX переживают отдельные компиляции, а кэши
+  luaotfload/fontconfig и форматы — даже пересоздание контейнера);
+- LocalLatexmkExecutor — latexmk, установленный на хосте (кэши TeX хоста и так постоянны);
+- StubExecutor — заглушка для тестов, создаёт минимальный PDF без TeX.
+
+Выбор — переменная окружения TEX_EXECUTOR (auto | docker | local | stub).
+"""
+import hashlib
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+import tracing
+
+TEXLIVE_IMAGE = os.getenv("TEXLIVE_IMAGE", "texlive/texlive")
+WARM_CONTAINER_NAME = os.getenv("TEX_CONTAINER_NAME", "llm-translator-texlive")
+
+# Все каталоги сборки создаются внутри BUILD_ROOT:
+# он один раз монтируется в долгоживущий контейнер как /work
+BUILD_ROOT = os.path.abspath(os.getenv("TEX_BUILD_ROOT", os.path.join(".cache", "build")))
+CONTAINER_BUILD_ROOT = "/work"
+
+# Кэши шрифтов и форматов TeX (luaotfload, fontconfig, fmtutil --user) живут между
+# запусками в TEX_CACHE_ROOT/<id образа>: смена образа texlive их инвалидирует
+TEX_CACHE_ROOT = os.path.abspath(os.getenv("TEX_CACHE_ROOT", os.path.join(".cache", "texmf")))
+CONTAINER_CACHE_ROOT = "/texcache"
+CONTAINER_CACHE_ENV = {
+    "TEXMFVAR": f"{CONTAINER_CACHE_ROOT}/texmf-var",
+    "TEXMFCACHE": f"{CONTAINER_CACHE_ROOT}/texmf-var",
+    "XDG_CACHE_HOME": f"{CONTAINER_CACHE_ROOT}/xdg",
+}
+
+# Постоянные каталоги сборки проектов (BUILD_ROOT/projects/<ключ>):
+# .aux/.bbl/.toc/.fdb_latexmk сохраняются, и latexmk пропускает ненужные проходы
+PROJECTS_DIR = os.path.join(BUILD_ROOT, "projects")
+BUILD_DIR_MAX_AGE_DAYS = float(os.getenv("BUILD_DIR_MAX_AGE_DAYS", "14"))
+BUILD_DIR_MAX_COUNT = int(os.getenv("BUILD_DIR_MAX_COUNT", "20"))
+
+# Как долго доверять результату проверки исполнителя (сек)
+HEALTH_TTL = 300
+
+COMPILE_TIMEOUT = 240
+# Сколько ждать после SIGTERM по тайм-ауту, прежде чем добить процессы SIGKILL
+KILL_GRACE = 10
+
+_STUB_PDF = (
+    b"%PDF-1.4\n"
+    b"1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n"
+    b"%%EOF\n"
+)
+
+
+def latexmk_command(tex_name, compiler, fmt=None):
+    """
+    Аргументы latexmk, общие для всех исполнителей.
+    fmt — имя заранее собранного формата с преамбулой (см. tex_format).
+    """
+    if fmt is None:
+        engine = f"-{compiler}"
+    else:
+        # latexmk принимает команду движка значением одного аргумента
+        # (-xelatex="xelatex ... %O %S" в оболочке): команда запускается без оболочки,
+        # поэтому пробелы внутри элемента argv — часть значения, а не разделители.
+        # Своя команда заменяет и ключи движка по умолчанию: XeLaTeX должен писать .xdv
+        no_pdf = " -no-pdf" if compiler == "xelatex" else ""
+        engine = f"-{compiler}={compiler}{no_pdf} -fmt={fmt} %O %S"
+    return [
+        "latexmk", engine,
+        "-interaction=nonstopmode",
+        "-file-line-error",
+        "-shell-escape",
+        tex_name,
+    ]
+
+
+class RunResult:
+    """Результат запуска latexmk: код возврата и вывод с отметками времени (time.monotonic)"""
+
+    def __init__(self, returncode, lines, started, finished):
+        self.returncode = returncode
+        self.lines = lines
+        self.started = started
+        self.finished = finished
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    @property
+    def output(self):
+        return "\n".join(line for _, line in self.lines)
+
+
+def _run_streaming(args, timeout, quiet=False, cwd=None):
+    """
+    Запускает процесс, построчно читая его вывод: строки печатаются (если не quiet)
+    и сохраняются с отметкой времени, чтобы потом разложить время по проходам latexmk.
+    При превышении timeout убивается вся группа процессов (latexmk вместе с
+    xelatex/biber) и выбрасывается TimeoutExpired.
+    """
+    started = time.monotonic()
+    process = subprocess.Popen(
+        args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, errors="replace", bufsize=1, start_new_session=hasattr(os, "killpg"),
+    )
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (AttributeError, OSError):
+            process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    lines = []
+    try:
+        for line in process.stdout:
+            lines.append((time.monotonic(), line.rstrip("\n")))
+            if not quiet:
+                print(line, end="")
+        process.wait()
+    finally:
+        timer.cancel()
+        process.stdout.close()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(args, timeout)
+    return RunResult(process.returncode, lines, started, time.monotonic())
+
+
+def _same_path(mounted, expected):
+    """Источник монтирования (путь хоста) совпадает с ожидаемым каталогом"""
+    if not mounted:
+        return False
+    return os.path.normcase(os.path.realpath(mounted)) == os.path.normcase(os.path.realpath(expected))
+
+
+def font_cache_dir(image_id):
+    """
+    Каталог постоянного кэша шрифтов и форматов для данной версии образа TeX.
+    Кэши других версий образа удаляются: после обновления texlive они неверны.
+    """
+    key = (image_id or "unknown").split(":")[-1][:16]
+    cache_dir = os.path.join(TEX_CACHE_ROOT, key)
+    if os.path.isdir(TEX_CACHE_ROOT):
+        for name in os.listdir(TEX_CACHE_ROOT):
+            if name != key:
+                shutil.rmtree(os.path.join(TEX_CACHE_ROOT, name), ignore_errors=True)
+    for sub in ("texmf-var", "xdg"):
+        os.makedirs(os.path.join(cache_dir, sub), exist_ok=True)
+    return cache_dir
+
+
+def project_build_dir(project_path, force_clean=False):
+    """
+    Постоянный каталог сборки для проекта. Ключ — абсолютный путь исходника
+    (.tex или .zip), так что повторные компиляции одного проекта попадают в один каталог.
+    force_clean=True удаляет накопленные вспомогательные файлы (чистая пересборка).
+    """
+    identity = os.path.abspath(project_path)
+    stem = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.splitext(os.path.basename(identity))[0])[:40]
+    digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:12]
+    build_dir = os.path.join(PROJECTS_DIR, f"{stem}-{digest}")
+
+    if force_clean and os.path.isdir(build_dir):
+        shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir, exist_ok=True)
+    # Время последнего использования — для политики очистки
+    os.utime(build_dir)
+    return build_dir
+
+
+def cleanup_build_dirs(max_age_days=None, max_count=None, keep=()):
+    """
+    Удаляет постоянные каталоги сборки, не использовавшиеся дольше max_age_days,
+    и самые старые сверх max_count. Каталоги из keep не трогаются.
+    Возвращает число удалённых каталогов.
+    """
+    max_age_days = BUILD_DIR_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    max_count = BUILD_DIR_MAX_COUNT if max_count is None else max_count
+    if not os.path.isdir(PROJECTS_DIR):
+        return 0
+
+    keep = {os.path.abspath(path) for path in keep}
+    entries = []
+    for name in os.listdir(PROJECTS_DIR):
+        path = os.path.join(PROJECTS_DIR, name)
+        if os.path.isdir(path):
+            entries.append((os.path.getmtime(path), path))
+    entries.sort(reverse=True)
+
+    now = time.time()
+    removed = 0
+    for index, (mtime, path) in enumerate(entries):
+        if path in keep:
+            continue
+        too_old = now - mtime > max_age_days * 86400
+        too_many = index >= max_count
+        if too_old or too_many:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+class TexExecutor:
+    """Базовый исполнитель: кэширует проверку доступности на HEALTH_TTL секунд"""
+
+    name = "base"
+    label = "TeX"
+
+    def __init__(self):
+        self._healthy = None
+        self._checked_at = 0.0
+        # Параллельные компиляции не должны одновременно поднимать контейнер
+        self._health_lock = threading.Lock()
+
+    def is_available(self):
+        with self._health_lock:
+            now = time.monotonic()
+            if self._healthy is None or now - self._checked_at > HEALTH_TTL:
+                # Для Docker сюда входит запуск контейнера (и загрузка образа)
+                with tracing.span("tex.probe", "compile", executor=self.name):
+                    self._healthy = self._probe()
+                self._checked_at = now
+            return self._healthy
+
+    def invalidate(self):
+        """Сбрасывает кэш проверки (например, после сбоя запуска)"""
+        with self._health_lock:
+            self._healthy = None
+
+    def unavailable_message(self):
+        return f"ℹ️ Исполнитель {self.name} недоступен."
+
+    def _probe(self):
+        raise NotImplementedError
+
+    def run(self, work_dir, tex_name, compiler, timeout=COMPILE_TIMEOUT, quiet=False, fmt=None):
+        """
+        Запускает latexmk в work_dir. Возвращает RunResult (код возврата и вывод
+        latexmk) или None, если сам исполнитель не смог запуститься.
+        quiet=True скрывает вывод latexmk (параллельные компиляции, лог остаётся в .log).
+        """
+        return self.execute(work_dir, latexmk_command(tex_name, compiler, fmt), timeout, quiet)
+
+    def execute(self, work_dir, args, timeout=COMPILE_TIMEOUT, quiet=False):
+        """Запускает произвольную команду TeX в work_dir; результат — как у run()"""
+        raise NotImplementedError
+
+    def cache_identity(self, compiler):
+        """
+        Чем собран PDF — для ключа кэша компиляции: PDF заглушки или локального
+        TeX не должен достаться сборке в Docker (образ в ключе и так есть).
+        """
+        return self.name
+
+
+class DockerExecExecutor(TexExecutor):
+    """latexmk в долгоживущем контейнере texlive через `docker exec`"""
+
+    name = "docker"
+    label = "Docker"
+
+    def unavailable_message(self):
+        return "ℹ️ Docker не запущен. Запустите Docker Desktop."
+
+    def _probe(self):
+        try:
+            subprocess.run(["docker", "info"], capture_output=True, check=True, timeout=10)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+            return False
+        return self._ensure_container()
+
+    def _image_id(self):
+        try:
+            result = subprocess.run(
+                ["docker", "image", "inspect", "-f", "{{.Id}}", TEXLIVE_IMAGE],
+                capture_output=True, text=True, timeout=10,
+            )
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return None
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def _container_image(self):
+        """
+        ID образа запущенного контейнера или None, если контейнер не работает или
+        смонтирован не из этого BUILD_ROOT/TEX_CACHE_ROOT (запуск из другого каталога
+        или с другим TEX_BUILD_ROOT — тогда /work указывал бы на чужие файлы).
+        """
+        mounts = "{{range .Mounts}}{{.Destination}}={{.Source}}\n{{end}}"
+        try:
+            result = subprocess.run(
+                ["docker", "inspect", "-f", "{{.State.Running}} {{.Image}}\n" + mounts, WARM_CONTAINER_NAME],
+                capture_output=True, text=True, timeout=10,
+            )
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return None
+        if result.returncode != 0:
+            return None
+        lines = result.stdout.strip().splitlines()
+        running, _, image = (lines[0] if lines else "").partition(" ")
+        sources = dict(line.partition("=")[::2] for line in lines[1:] if line)
+        if running != "true":
+            return None
+        if not _same_path(sources.get(CONTAINER_BUILD_ROOT), BUILD_ROOT):
+            return None
+        if not _same_path(os.path.dirname(sources.get(CONTAINER_CACHE_ROOT, "")), TEX_CACHE_ROOT):
+            return None
+        return image
+
+    def _ensure_container(self):
+        """
+        Поднимает контейнер с примонтированными BUILD_ROOT и кэшем шрифтов/форматов,
+        если он ещё не запущен или создан из другой версии образа.
+        """
+        image_id = self._image_id()
+        running_image = self._container_image()
+        if running_image and (image_id is None or running_image == image_id):
+            return True
+
+        if image_id is None:
+            print("🐳 Загрузка образа TeX (однократно)...")
+            try:
+                subprocess.run(["docker", "pull", TEXLIVE_IMAGE], check=True, timeout=3600)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                print(f"💥 Не удалось загрузить образ {TEXLIVE_IMAGE}: {e}")
+                return False
+            image_id = self._image_id()
+
+        os.makedirs(BUILD_ROOT, exist_ok=True)
+        cache_dir = font_cache_dir(image_id)
+        subprocess.run(
+            ["docker", "rm", "-f", WARM_CONTAINER_NAME],
+            capture_output=True, timeout=30,
+        )
+        print("🐳 Запуск контейнера TeX (однократно)...")
+        try:
+            subprocess.run(
+                [
+                    "docker", "run", "-d",
+                    "--name", WARM_CONTAINER_NAME,
+                    "-v", f"{BUILD_ROOT}:{CONTAINER_BUILD_ROOT}",
+                    "-v", f"{cache_dir}:{CONTAINER_CACHE_ROOT}",
+                    TEXLIVE_IMAGE,
+                    "sleep", "infinity",
+                ],
+                capture_output=True, check=True, timeout=600,
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            print(f"💥 Не удалось запустить контейнер TeX: {e}")
+            return False
+        return True
+
+    def _exec_args(self, work_dir):
+        rel = os.path.relpath(os.path.abspath(work_dir), BUILD_ROOT)
+        if rel.startswith(os.pardir):
+            raise ValueError(f"Рабочий каталог вне {BUILD_ROOT}: {work_dir}")
+        container_dir = CONTAINER_BUILD_ROOT + "/" + rel.replace(os.sep, "/")
+        args = ["docker", "exec", "-w", container_dir, "-e", "HOME=/tmp"]
+        for name, value in CONTAINER_CACHE_ENV.items():
+            args += ["-e", f"{name}={value}"]
+        if hasattr(os, "getuid"):
+            # Файлы в BUILD_ROOT должны принадлежать пользователю хоста
+            args += ["-u", f"{os.getuid()}:{os.getgid()}"]
+        return args + [WARM_CONTAINER_NAME]
+
+    def execute(self, work_dir, args, timeout=COMPILE_TIMEOUT, quiet=False):
+        # Тайм-аут отсчитывается внутри контейнера: убить клиент docker exec на
+        # хосте мало — latexmk и xelatex продолжили бы работать в контейнере.
+        # timeout(1) посылает сигнал всей группе процессов команды
+        args = self._exec_args(work_dir) + ["timeout", "-k", str(KILL_GRACE), str(timeout)] + list(args)
+        for attempt in range(2):
+            try:
+                # Тайм-аут на хосте — запасной, если завис сам docker
+                result = _run_streaming(args, timeout + KILL_GRACE + 30, quiet)
+            except subprocess.TimeoutExpired:
+                print(f"⚠️ Тайм-аут компиляции ({timeout // 60} мин), Docker не отвечает.")
+                self.invalidate()
+                return None
+            except Exception as e:
+                print(f"💥 Ошибка запуска Docker: {e}")
+                self.invalidate()
+                return None
+
+            # 124 — сработал timeout (137 — после SIGKILL)
+            if result.returncode in (124, 137) and result.duration >= timeout:
+                print(f"⚠️ Тайм-аут компиляции ({timeout // 60} мин).")
+                return None
+
+            # 125-127 — ошибка самого docker exec (контейнер остановлен и т.п.)
+            if result.returncode in (125, 126, 127) and attempt == 0:
+                self.invalidate()
+                if not self.is_available():
+                    return None
+                continue
+            return result
+        return None
+
+
+class LocalLatexmkExecutor(TexExecutor):
+    """latexmk из локальной установки TeX"""
+
+    name = "local"
+    label = "локальный TeX"
+
+    def __init__(self):
+        super().__init__()
+        self._versions = {}
+
+    def unavailable_message(self):
+        return "ℹ️ latexmk не найден в PATH."
+
+    def _probe(self):
+        return shutil.which("latexmk") is not None
+
+    def cache_identity(self, compiler):
+        # Версия TeX хоста (первая строка `xelatex --version`): обновление дистрибутива меняет ключ
+        if compiler not in self._versions:
+            try:
+                result = subprocess.run([compiler, "--version"], capture_output=True, text=True, timeout=10)
+                version = (result.stdout.splitlines() or [""])[0].strip()
+            except (OSError, subprocess.TimeoutExpired):
+                version = "unknown"
+            self._versions[compiler] = version
+        return f"{self.name}\0{self._versions[compiler]}"
+
+    def run(self, work_dir, tex_name, compiler, timeout=COMPILE_TIMEOUT, quiet=False, fmt=None):
+        if shutil.which(compiler) is None:
+            print(f"⚠️ {compiler} не найден в PATH.")
+            return None
+        return super().run(work_dir, tex_name, compiler, timeout, quiet, fmt)
+
+    def execute(self, work_dir, args, timeout=COMPILE_TIMEOUT, quiet=False):
+        try:
+            return _run_streaming(list(args), timeout, quiet, cwd=work_dir)
+        except subprocess.TimeoutExpired:
+            print(f"⚠️ Тайм-аут компиляции ({timeout // 60} мин).")
+            return None
+        except Exception as e:
+            print(f"💥 Ошибка запуска {args[0]}: {e}")
+            return None
+
+
+class StubExecutor(TexExecutor):
+    """Заглушка для тестов: пишет минимальный PDF и лог, TeX не нужен"""
+
+    name = "stub"
+    label = "заглушка"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def _probe(self):
+        return True
+
+    def run(self, work_dir, tex_name, compiler, timeout=COMPILE_TIMEOUT, quiet=False, fmt=None):
+        self.calls.append((work_dir, tex_name, compiler, fmt))
+        started = time.monotonic()
+        stem = os.path.splitext(tex_name)[0]
+        with open(os.path.join(work_dir, stem + ".pdf"), "wb") as f:
+            f.write(_STUB_PDF)
+        with open(os.path.join(work_dir, stem + ".log"), "w", encoding="utf-8") as f:
+            f.write(f"Stub compile of {tex_name} with {compiler}\n")
+        lines = [(started, f"Run number 1 of rule '{compiler}'")]
+        return RunResult(0, lines, started, time.monotonic())
+
+    def execute(self, work_dir, args, timeout=COMPILE_TIMEOUT, quiet=False):
+        # Сборка формата (-ini -jobname=<имя>): пишем пустой .fmt
+        started = time.monotonic()
+        self.calls.append((work_dir, tuple(args)))
+        for arg in args:
+            if arg.startswith("-jobname="):
+                with open(os.path.join(work_dir, arg.split("=", 1)[1] + ".fmt"), "wb") as f:
+                    f.write(b"stub format\n")
+        return RunResult(0, [], started, time.monotonic())
+
+
+EXECUTORS = {
+    "docker": DockerExecExecutor,
+    "local": LocalLatexmkExecutor,
+    "stub": StubExecutor,
+}
+
+_instances = {}
+
+
+def get_executor(kind=None):
+    """
+    Возвращает исполнитель (экземпляры переиспользуются, вместе с кэшем проверки).
+    auto: локальный latexmk, если он есть, иначе Docker.
+    """
+    kind = (kind or os.getenv("TEX_EXECUTOR", "auto")).lower()
+    if kind == "auto":
+        local = get_executor("local")
+        return local if local.is_available() else get_executor("docker")
+
+    if kind not in EXECUTORS:
+        raise ValueError(f"Неизвестный TEX_EXECUTOR: {kind} (ожидается auto, {', '.join(EXECUTORS)})")
+
+    if kind not in _instances:
+        _instances[kind] = EXECUTORS[kind]()
+    return _instances[kind]
+
+
+def stop_warm_container():
+    """Останавливает долгоживущий контейнер TeX"""
+    subprocess.run(["docker", "rm", "-f", WARM_CONTAINER_NAME], capture_output=True, timeout=30)
+    if "docker" in _instances:
+        _instances["docker"].invalidate()
@@ -0,0 +1,231 @@
+# tex_format.py
+"""
+Предкомпилированная преамбула (в духе mylatexformat).
+
+Преамбула переведённого документа (класс, fontspec, babel/polyglossia, пакеты)
+одинакова между пересборками, а часто и между документами одного класса.
+Она один раз выгружается в формат TeX (.fmt), ключ — хэш преамбулы и локальных
+.cls/.sty; тело документа компилируется уже с этим форматом.
+
+XeTeX не может выгрузить в формат загруженные шрифты, поэтому команды
+\\setmainfont и подобные переносятся за \\endofdump и выполняются при каждом
+запуске. LuaLaTeX (MDPI) не поддерживается: состояние Lua (luaotfload) в формат
+не попадает. Включается переменной PRECOMPILED_PREAMBLE=1.
+"""
+import hashlib
+import os
+import re
+import shutil
+
+from tex_deps import resolve_tex_dependencies
+from tex_executor import BUILD_ROOT, TEXLIVE_IMAGE
+
+FORMATS_DIR = os.path.join(BUILD_ROOT, "formats")
+FORMAT_MAX_COUNT = int(os.getenv("PREAMBLE_FORMAT_MAX_COUNT", "10"))
+
+# Движок для режима -ini и компиляторы, для которых выгрузка формата работает
+FORMAT_ENGINES = {
+    "xelatex": "xetex",
+    "pdflatex": "pdftex",
+}
+
+# Файлы проекта, влияющие на содержимое формата
+FORMAT_INPUT_EXTENSIONS = ('.cls', '.sty', '.clo', '.cfg', '.def', '.ldf', '.fd')
+
+_COMMENT_RE = re.compile(r'(?<!\\)%.*')
+_BEGIN_DOCUMENT_RE = re.compile(r'^[^%\n]*\\begin\s*\{document\}', re.MULTILINE)
+_FONT_COMMAND_RE = re.compile(
+    r'^\s*\\(?:setmainfont|setsansfont|setmonofont|setromanfont|setmathfont|'
+    r'newfontfamily|newfontface|defaultfontfeatures|setfontfamily|babelfont)\b'
+)
+
+
+def is_enabled():
+    return os.getenv("PRECOMPILED_PREAMBLE", "0") == "1"
+
+
+def _balanced(line):
+    code = _COMMENT_RE.sub("", line)
+    return code.count("{") == code.count("}")
+
+
+def split_preamble(content):
+    """
+    Делит документ для выгрузки преамбулы.
+    Возвращает (выгружаемая_часть, документ_с_\\endofdump) или None, если преамбулу
+    выгрузить нельзя. Команды шрифтов собираются в одну строку после \\endofdump;
+    число строк документа сохраняется (см. _compact), чтобы номера строк в логе
+    по-прежнему совпадали с картой фрагментов перевода.
+    """
+    m = _BEGIN_DOCUMENT_RE.search(content)
+    if not m:
+        return None
+    begin_line = content.count("\n", 0, m.start())
+    lines = content.split("\n")
+    preamble, rest = lines[:begin_line], lines[begin_line:]
+
+    if any(line.strip() == r"\endofdump" for line in preamble):
+        index = next(i for i, line in enumerate(preamble) if line.strip() == r"\endofdump")
+        return "\n".join(preamble[:index]), content
+
+    dumped = []
+    fonts = []
+    tail = []
+    for index, line in enumerate(preamble):
+        if _FONT_COMMAND_RE.match(line):
+            if not _balanced(line):
+                # Многострочная команда шрифта — всё, что дальше, не выгружаем
+                tail = preamble[index:]
+                break
+            fonts.append(line.strip())
+            dumped.append("")
+        else:
+            dumped.append(line)
+
+    dump_text = "\n".join(line for line in dumped if line.strip())
+    if r"\documentclass" not in dump_text:
+        return None
+
+    added = [r"\endofdump"] + ([" ".join(fonts)] if fonts else [])
+    compacted = _compact(dumped, len(added))
+    if compacted is None:
+        # Освободить строки не из чего — без формата номера строк сдвинулись бы
+        return None
+    return dump_text, "\n".join(compacted + added + tail + rest)
+
+
+def _compact(lines, extra):
+    """
+    Укорачивает выгружаемую часть на extra строк, чтобы \endofdump и команды
+    шрифтов не сдвинули тело документа. При загрузке формата всё до \endofdump
+    пропускается, поэтому строки можно выбросить или склеить: сначала уходят
+    пустые строки и строки-комментарии, затем соседние строки без комментария
+    склеиваются через пробел (для TeX перевод строки — тот же пробел).
+    Возвращает новый список строк или None, если столько строк не освободить.
+    """
+    compacted = []
+    for line in lines:
+        if extra and (not line.strip() or line.lstrip().startswith("%")):
+            extra -= 1
+            continue
+        compacted.append(line)
+
+    index = 0
+    while extra and index < len(compacted) - 1:
+        if _COMMENT_RE.search(compacted[index]):
+            index += 1
+            continue
+        compacted[index] = compacted[index].rstrip() + " " + compacted.pop(index + 1).lstrip()
+        extra -= 1
+    return compacted if not extra else None
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def format_name(dump_text, compiler, executor_name, root_dir, files):
+    """Имя формата: хэш выгружаемой преамбулы, локальных классов/пакетов, движка и образа"""
+    h = hashlib.sha256()
+    h.update(f"{compiler}\0{executor_name}\0{TEXLIVE_IMAGE}\0".encode("utf-8"))
+    h.update(dump_text.encode("utf-8") + b"\0")
+    for rel_path in sorted(files):
+        if os.path.splitext(rel_path)[1].lower() in FORMAT_INPUT_EXTENSIONS:
+            h.update(rel_path.replace(os.sep, "/").encode("utf-8") + b"\0")
+            h.update(_file_digest(os.path.join(root_dir, rel_path)).encode("ascii") + b"\0")
+    return f"preamble-{compiler}-{h.hexdigest()[:16]}"
+
+
+def _write_replacing(path, content):
+    # Главный файл в каталоге сборки может быть жёсткой ссылкой на исходник
+    tmp_path = path + ".fmtdump"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _evict():
+    formats = []
+    for name in os.listdir(FORMATS_DIR):
+        path = os.path.join(FORMATS_DIR, name)
+        if name.endswith(".fmt"):
+            formats.append((os.path.getmtime(path), path))
+    for _, path in sorted(formats, reverse=True)[FORMAT_MAX_COUNT:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def prepare_format(executor, build_dir, tex_name, compiler, quiet=False):
+    """
+    Готовит формат с преамбулой для компиляции build_dir/tex_name: берёт его из
+    FORMATS_DIR или собирает (`<движок> -ini "&<компилятор>" mylatexformat.ltx`).
+    Главный файл в build_dir получает \\endofdump.
+    Возвращает (имя_формата, исходный_текст_главного_файла) или None —
+    тогда компилируем как обычно.
+    """
+    engine = FORMAT_ENGINES.get(compiler)
+    if engine is None:
+        if not quiet:
+            print(f"ℹ️ Предкомпилированная преамбула не поддерживается для {compiler}.")
+        return None
+
+    tex_path = os.path.join(build_dir, tex_name)
+    with open(tex_path, "r", encoding="utf-8") as f:
+        original = f.read()
+    split = split_preamble(original)
+    if split is None:
+        return None
+    dump_text, dump_content = split
+
+    files, _, _ = resolve_tex_dependencies(build_dir, tex_name)
+    fmt = format_name(dump_text, compiler, executor.name, build_dir, files)
+    stored = os.path.join(FORMATS_DIR, fmt + ".fmt")
+    local = os.path.join(build_dir, fmt + ".fmt")
+    _write_replacing(tex_path, dump_content)
+
+    # Форматы прежних версий преамбулы в каталоге сборки больше не нужны
+    for name in os.listdir(build_dir):
+        if name.startswith("preamble-") and name.endswith(".fmt") and name != fmt + ".fmt":
+            os.remove(os.path.join(build_dir, name))
+
+    if os.path.isfile(stored):
+        os.utime(stored)
+        if not os.path.isfile(local):
+            shutil.copy2(stored, local)
+        if not quiet:
+            print(f"⚡ Преамбула из готового формата {fmt}")
+        return fmt, original
+
+    if not quiet:
+        print(f"⚙️ Сборка формата преамбулы {fmt} (однократно)...")
+    args = [
+        engine, "-ini", "-etex", "-interaction=nonstopmode", "-shell-escape",
+        f"-jobname={fmt}", f"&{compiler}", "mylatexformat.ltx", tex_name,
+    ]
+    run_result = executor.execute(build_dir, args, quiet=True)
+    if run_result is None or run_result.returncode != 0 or not os.path.isfile(local):
+        print("⚠️ Не удалось выгрузить преамбулу в формат — компилируем без него.")
+        _write_replacing(tex_path, original)
+        return None
+
+    os.makedirs(FORMATS_DIR, exist_ok=True)
+    shutil.copy2(local, stored + ".tmp")
+    os.replace(stored + ".tmp", stored)
+    _evict()
+    return fmt, original
+
+
+def discard_format(build_dir, tex_name, fmt, original):
+    """Формат не подошёл (например, ошибка при загрузке): удаляем его и возвращаем исходный файл"""
+    for path in (os.path.join(FORMATS_DIR, fmt + ".fmt"), os.path.join(build_dir, fmt + ".fmt")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    _write_replacing(os.path.join(build_dir, tex_name), original)
@@ -0,0 +1,205 @@
+# tex_log.py
+"""
+Разбор вывода latexmk и лога движка в структурированный результат компиляции:
+проходы и их длительность, перезапуски bibtex/biber, ошибки с file:line,
+предупреждения, неопределённые ссылки и цитаты. Ошибки сопоставляются
+с фрагментами перевода (segment_map), чтобы переводить заново только их.
+"""
+import os
+import re
+
+_RULE_RE = re.compile(r"(?:Run number \d+ of rule|applying rule) '([^']+)'")
+
+_FILE_LINE_ERROR_RE = re.compile(r'^(\.?/?[^\s:][^:]*\.(?:tex|sty|cls|bbl|ltx|def)):(\d+): (.+)$')
+_BANG_ERROR_RE = re.compile(r'^! (.+)$')
+_WARNING_RE = re.compile(r'^((?:LaTeX|Package [\w.-]+|Class [\w.-]+) Warning: .+)$')
+_UNDEFINED_REF_RE = re.compile(r"Reference `([^']+)' on page \d+ undefined")
+_UNDEFINED_CITE_RE = re.compile(r"Citation `([^']+)' on page \d+ undefined")
+_BIBLATEX_MISSING_RE = re.compile(r"The following entry could not be found\s+in the database:\s+(\S+)")
+_BOX_RE = re.compile(r'^(?:Overfull|Underfull) \\[hv]box')
+
+BIB_RULES = ('bibtex', 'biber')
+
+
+class CompileResult:
+    """Итог компиляции; в логическом контексте — успех (есть PDF)"""
+
+    def __init__(self, ok, pdf_path=None):
+        self.ok = ok
+        self.pdf_path = pdf_path
+        self.cached = False
+        self.duration = 0.0
+        self.passes = []
+        self.errors = []
+        self.warnings = []
+        self.undefined_refs = []
+        self.undefined_citations = []
+        self.box_warnings = 0
+        self.log_path = None
+
+    def __bool__(self):
+        return bool(self.ok)
+
+    @property
+    def bib_runs(self):
+        return sum(1 for p in self.passes if p["rule"].split()[0].lower() in BIB_RULES)
+
+    @property
+    def failed_segments(self):
+        """Идентификаторы фрагментов перевода, к которым привязаны ошибки: {файл: [id, ...]}"""
+        segments = {}
+        for error in self.errors:
+            if error.get("segment") is not None:
+                ids = segments.setdefault(error["file"], [])
+                if error["segment"] not in ids:
+                    ids.append(error["segment"])
+        return segments
+
+    def to_dict(self):
+        return {
+            "ok": bool(self.ok),
+            "cached": self.cached,
+            "pdf_path": self.pdf_path,
+            "log_path": self.log_path,
+            "duration": round(self.duration, 3),
+            "passes": self.passes,
+            "bib_runs": self.bib_runs,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "undefined_refs": self.undefined_refs,
+            "undefined_citations": self.undefined_citations,
+            "box_warnings": self.box_warnings,
+        }
+
+    def short_status(self):
+        if self.cached:
+            return "из кэша"
+        parts = [f"проходов: {len(self.passes)}"]
+        if self.bib_runs:
+            parts.append(f"bib: {self.bib_runs}")
+        if self.errors:
+            parts.append(f"ошибок: {len(self.errors)}")
+        if self.warnings:
+            parts.append(f"предупр.: {len(self.warnings)}")
+        return ", ".join(parts)
+
+    def print_summary(self):
+        if self.cached:
+            return
+        print(f"\n📋 Диагностика компиляции ({self.duration:.1f} с):")
+        for number, p in enumerate(self.passes, 1):
+            print(f"  {number}. {p['rule']:<12} {p['duration']:>6.1f} с")
+        if not self.passes:
+            print("  Проходов не было — всё актуально.")
+        if self.undefined_refs:
+            print(f"  ⚠️ Неопределённые ссылки: {', '.join(self.undefined_refs[:10])}")
+        if self.undefined_citations:
+            print(f"  ⚠️ Неопределённые цитаты: {', '.join(self.undefined_citations[:10])}")
+        if self.warnings:
+            print(f"  ⚠️ Предупреждений: {len(self.warnings)}")
+        for error in self.errors[:10]:
+            location = f"{error['file']}:{error['line']}" if error.get("file") else "?"
+            segment = f" [фрагмент #{error['segment']}]" if error.get("segment") is not None else ""
+            print(f"  ❌ {location}: {error['message']}{segment}")
+        if len(self.errors) > 10:
+            print(f"  ... и ещё {len(self.errors) - 10} ошибок")
+
+
+def parse_latexmk_passes(run_result):
+    """Проходы latexmk по его выводу: правило и длительность до начала следующего"""
+    starts = []
+    for timestamp, line in run_result.lines:
+        m = _RULE_RE.search(line)
+        if m:
+            starts.append((timestamp, m.group(1)))
+
+    passes = []
+    for index, (timestamp, rule) in enumerate(starts):
+        end = starts[index + 1][0] if index + 1 < len(starts) else run_result.finished
+        passes.append({"rule": rule, "duration": round(end - timestamp, 3)})
+    return passes
+
+
+def parse_tex_log(log_text):
+    """Ошибки (file:line), предупреждения и неопределённые ссылки из .log движка"""
+    errors = []
+    warnings = []
+    refs = []
+    cites = []
+    boxes = 0
+
+    # Лог переносит длинные строки на 79 символах — склеиваем предупреждения целиком
+    lines = log_text.splitlines()
+    for index, line in enumerate(lines):
+        m = _FILE_LINE_ERROR_RE.match(line)
+        if m:
+            errors.append({
+                "file": os.path.normpath(m.group(1)),
+                "line": int(m.group(2)),
+                "message": m.group(3).strip(),
+            })
+            continue
+        m = _BANG_ERROR_RE.match(line)
+        if m:
+            line_no = None
+            for follow in lines[index + 1:index + 6]:
+                lm = re.match(r'^l\.(\d+)', follow)
+                if lm:
+                    line_no = int(lm.group(1))
+                    break
+            errors.append({"file": None, "line": line_no, "message": m.group(1).strip()})
+            continue
+        if _BOX_RE.match(line):
+            boxes += 1
+            continue
+        m = _WARNING_RE.match(line)
+        if m:
+            text = m.group(1)
+            for follow in lines[index + 1:index + 4]:
+                if not follow.strip() or follow.startswith(("(", "LaTeX", "Package")):
+                    break
+                text += " " + follow.strip()
+            warnings.append(text)
+            for ref in _UNDEFINED_REF_RE.findall(text):
+                if ref not in refs:
+                    refs.append(ref)
+            for cite in _UNDEFINED_CITE_RE.findall(text):
+                if cite not in cites:
+                    cites.append(cite)
+
+    for cite in _BIBLATEX_MISSING_RE.findall(log_text):
+        if cite not in cites:
+            cites.append(cite)
+
+    return errors, warnings, refs, cites, boxes
+
+
+def build_compile_result(ok, pdf_path, run_result, log_path, main_tex=None, segment_map=None):
+    """Собирает CompileResult из результата исполнителя и лога; ошибки связываются с фрагментами"""
+    result = CompileResult(ok, pdf_path)
+    if run_result is not None:
+        result.duration = run_result.duration
+        result.passes = parse_latexmk_passes(run_result)
+
+    if log_path and os.path.isfile(log_path):
+        result.log_path = log_path
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            log_text = f.read()
+        (result.errors, result.warnings, result.undefined_refs,
+         result.undefined_citations, result.box_warnings) = parse_tex_log(log_text)
+
+    if segment_map:
+        from segment_map import find_segment
+        for error in result.errors:
+            # Ошибки без имени файла (формат «! ...») относятся к главному файлу
+            file_name = error["file"] or (os.path.normpath(main_tex) if main_tex else None)
+            if file_name is None:
+                continue
+            if error["line"] is None:
+                continue
+            segment_id = find_segment(segment_map, file_name, error["line"])
+            if segment_id is not None:
+                error["file"] = file_name
+                error["segment"] = segment_id
+
+    return result
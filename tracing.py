@@ -0,0 +1,251 @@
+# tracing.py
+"""
+Лёгкая трассировка этапов конвейера: куда ушло время (и память) конкретного
+прогона — распаковка ZIP, маскирование, ожидание API, паузы между повторами,
+сборка, упаковка, компиляция в Docker.
+
+    with tracing.span("zip.extract", file=name):
+        ...
+
+Пока запись не включена (tracing.start()), span() ничего не делает и почти
+ничего не стоит. Результат выгружается:
+- export_chrome_trace — JSON в формате Chrome trace events (открывается в
+  ui.perfetto.dev или chrome://tracing: вложенные этапы по потокам, а если
+  включён tracemalloc — ещё и график занятой памяти);
+- export_folded — «свёрнутые» стеки этапов для flamegraph.pl / speedscope.
+
+profile() дополнительно оборачивает прогон в cProfile и tracemalloc
+(ключ --profile в main.py).
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+_lock = threading.Lock()
+_enabled = False
+_origin = 0.0
+_events = []
+_thread_names = {}
+_local = threading.local()
+
+
+def is_enabled():
+    return _enabled
+
+
+def start():
+    """Включает запись (прежние события сбрасываются)"""
+    global _enabled, _origin
+    with _lock:
+        _events.clear()
+        _thread_names.clear()
+        _origin = time.perf_counter()
+        _enabled = True
+
+
+def stop():
+    global _enabled
+    _enabled = False
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextlib.contextmanager
+def _record(name, category, args):
+    thread = threading.current_thread()
+    stack = _stack()
+    stack.append(name)
+    path = ";".join(stack)
+    memory_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    started = time.perf_counter()
+    try:
+        yield args
+    finally:
+        finished = time.perf_counter()
+        stack.pop()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (started - _origin) * 1e6,
+            "dur": (finished - started) * 1e6,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args,
+            "_path": path,
+        }
+        if memory_before is not None:
+            current = tracemalloc.get_traced_memory()[0]
+            args["memory_delta_kb"] = round((current - memory_before) / 1024, 1)
+            memory_event = {
+                "name": "memory", "ph": "C", "ts": event["ts"] + event["dur"],
+                "pid": os.getpid(), "args": {"traced_mb": round(current / 1024 ** 2, 2)},
+            }
+        else:
+            memory_event = None
+        with _lock:
+            if _enabled:
+                _thread_names.setdefault(thread.ident, thread.name)
+                _events.append(event)
+                if memory_event is not None:
+                    _events.append(memory_event)
+
+
+def span(name, category="stage", **args):
+    """Контекст-менеджер этапа; args попадают в событие (и могут дополняться внутри блока)"""
+    if not _enabled:
+        return contextlib.nullcontext(args)
+    return _record(name, category, args)
+
+
+def traced_sleep(seconds, reason="backoff"):
+    """time.sleep, видимый в трассе как отдельный этап"""
+    with span(reason, "wait", seconds=seconds):
+        time.sleep(seconds)
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def export_chrome_trace(path):
+    """Сохраняет события в формате Chrome trace events (JSON)"""
+    with _lock:
+        trace_events = [{k: v for k, v in event.items() if k != "_path"} for event in _events]
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in _thread_names.items()
+        ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + trace_events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+def export_folded(path):
+    """
+    Свёрнутые стеки («этап;вложенный_этап мкс» — собственное время этапа)
+    для flamegraph.pl и speedscope.
+    """
+    totals = {}
+    children = {}
+    for event in events():
+        if event.get("ph") != "X":
+            continue
+        key = event["_path"]
+        totals[key] = totals.get(key, 0.0) + event["dur"]
+        parent = key.rpartition(";")[0]
+        if parent:
+            children[parent] = children.get(parent, 0.0) + event["dur"]
+    with open(path, "w", encoding="utf-8") as f:
+        for key, total in sorted(totals.items()):
+            # Дочерние этапы из пула потоков могут перекрываться — не уходим в минус
+            own = max(total - children.get(key, 0.0), 0.0)
+            if own >= 1:
+                f.write(f"{key} {int(own)}\n")
+
+
+def summary(limit=15):
+    """[(этап, число вызовов, суммарное время с)] по убыванию времени"""
+    totals = {}
+    for event in events():
+        if event.get("ph") != "X":
+            continue
+        count, total = totals.get(event["name"], (0, 0.0))
+        totals[event["name"]] = (count + 1, total + event["dur"] / 1e6)
+    ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)
+    return [(name, count, total) for name, (count, total) in ranked[:limit]]
+
+
+def print_summary(limit=15):
+    rows = summary(limit)
+    if not rows:
+        return
+    print("\n⏱️ Этапы по суммарному времени (вложенные входят в родительские):")
+    for name, count, total in rows:
+        print(f"  {name:<28} {count:>6} × {total:>9.3f} с")
+
+
+def _export_memory(snapshot, prefix, limit=20):
+    """Топ строк по выделенной памяти и свёрнутые стеки выделений (для flame graph памяти)"""
+    # Собственные структуры трассировки и импорт модулей — не то, что мы ищем
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    statistics = snapshot.statistics("traceback")
+    with open(prefix + ".memory.txt", "w", encoding="utf-8") as f:
+        for stat in statistics[:limit]:
+            f.write(f"{stat.size / 1024:.1f} KiB в {stat.count} блоках\n")
+            for line in stat.traceback.format(most_recent_first=True):
+                f.write(line + "\n")
+            f.write("\n")
+    with open(prefix + ".memory.folded", "w", encoding="utf-8") as f:
+        for stat in statistics:
+            # Кадры идут от внешнего вызова к месту выделения — как и нужно flame graph
+            frames = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback)
+            f.write(f"{frames} {stat.size}\n")
+    return statistics[:5]
+
+
+@contextlib.contextmanager
+def profile(prefix="profile", trace_frames=25):
+    """
+    Прогон под cProfile и tracemalloc с записью этапов. Пишет:
+    prefix.prof (pstats: snakeviz, flameprof), prefix.trace.json (Perfetto),
+    prefix.folded (flame graph этапов по времени), prefix.memory.txt и
+    prefix.memory.folded (где выделялась память, оставшаяся к концу прогона).
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    tracemalloc.start(trace_frames)
+    start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stop()
+
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(prefix + ".prof")
+        export_chrome_trace(prefix + ".trace.json")
+        export_folded(prefix + ".folded")
+        top_memory = _export_memory(snapshot, prefix)
+
+        print_summary()
+        print(f"\n🧠 Пик памяти (tracemalloc): {peak / 1024 ** 2:.1f} МБ")
+        for stat in top_memory:
+            frame = stat.traceback[-1]
+            print(f"  {stat.size / 1024:>10.1f} KiB  {os.path.basename(frame.filename)}:{frame.lineno}")
+        print(
+            f"💾 Профиль: {prefix}.prof, трасса: {prefix}.trace.json, "
+            f"flame graph: {prefix}.folded, память: {prefix}.memory.txt"
+        )
+
+
+@contextlib.contextmanager
+def trace_to(path):
+    """Записывает этапы прогона и сохраняет их в path (Chrome trace JSON)"""
+    start()
+    try:
+        yield
+    finally:
+        stop()
+        export_chrome_trace(path)
+        print_summary()
+        print(f"💾 Трасса этапов: {path} (ui.perfetto.dev или chrome://tracing)")
@@ -1,8 +1,8 @@
+import os
 import re
 import sys
-from docx import Document
-from docx.oxml.ns import qn
 from tqdm import tqdm
+import tracing
 from common import translate_chunk, chunk_text_by_sentences_safe
 
 REFERENCE_TITLES = {
@@ -17,6 +17,8 @@ def extract_paragraph_with_math(paragraph):
     Извлекает текст из параграфа, заменяя математические OMML блоки на placeholder'ы
     Возвращает: (текст_с_placeholder'ами, список_OMML_элементов)
     """
+    from docx.oxml.ns import qn
+
     math_elements = []
     parts = []
 
@@ -86,9 +88,21 @@ def rebuild_paragraph_with_math(paragraph, translated_text, math_elements):
 
 
 def translate_docx(input_path, output_path):
-    """Переводит DOCX файл с сохранением OMML формул"""
+    """
+    Переводит DOCX файл с сохранением OMML формул.
+    По умолчанию используется lxml backend (docx_package), который правит только
+    текстовые части пакета; DOCX_BACKEND=python-docx включает прежнюю реализацию.
+    """
+    if os.getenv("DOCX_BACKEND", "lxml").lower() != "python-docx":
+        from docx_package import translate_docx_package
+        return translate_docx_package(input_path, output_path)
+
+    # python-docx нужен только этому пути — импортируем его здесь
+    from docx import Document
+
     try:
-        doc = Document(input_path)
+        with tracing.span("docx.open", file=os.path.basename(input_path)):
+            doc = Document(input_path)
     except Exception as e:
         print(f"❌ Не удалось открыть .docx: {e}")
         sys.exit(1)
@@ -96,11 +110,11 @@ def translate_docx(input_path, output_path):
     in_references = False
 
     for para in tqdm(doc.paragraphs, desc="Перевод .docx"):
-        if not para.text.strip():
+        para_text_clean = para.text.strip()
+        if not para_text_clean:
             continue
 
-        para_text_clean = para.text.strip().lower()
-        if para_text_clean in REFERENCE_TITLES:
+        if para_text_clean.lower() in REFERENCE_TITLES:
             in_references = True
             continue
 
@@ -139,5 +153,6 @@ def translate_docx(input_path, output_path):
         # Восстанавливаем параграф с OMML элементами
         rebuild_paragraph_with_math(para, translated, math_elements)
 
-    doc.save(output_path)
+    with tracing.span("docx.save", file=os.path.basename(output_path)):
+        doc.save(output_path)
     print(f"\n✅ Перевод завершён: {output_path}")
@@ -1,11 +1,23 @@
 # translate_tex.py
+import json
 import os
 import zipfile
 import sys
-from tqdm import tqdm
 import re
 
-from common import translate_chunk
+import segment_filter
+import tracing
+import translation_cache
+from common import get_target_language, plan_chunk_chars, translate_chunk, translate_jobs
+from languages import get_language, output_suffix
+from zip_utils import copy_zip_with_replacements, rewrite_zip_members
+from segment_map import (
+    extract_segment_markers,
+    load_segment_map,
+    save_segment_map,
+    segment_map_path,
+    wrap_segment,
+)
 
 # Файлы, которые НЕ нужно переводить
 EXCLUDE_FILES = {
@@ -24,6 +36,17 @@ EXCLUDE_EXTENSIONS = {
     '.sty',  # Пакеты стилей
 }
 
+BEGIN_DOCUMENT = r'\begin{document}'
+END_DOCUMENT = r'\end{document}'
+
+# Предпросмотр: черновик собирается, когда переведены титульная часть и первые
+# PREVIEW_SECTIONS разделов (при длинных разделах — не больше PREVIEW_SHARE текста)
+PREVIEW_SECTIONS = int(os.getenv("PREVIEW_SECTIONS", "2"))
+PREVIEW_SHARE = float(os.getenv("PREVIEW_SHARE", "0.25"))
+_SECTION_RE = re.compile(r'\\(?:chapter|section)\*?\s*[\[{]')
+# Черновик пишется рядом с результатом: paper_translated_preview.tex
+PREVIEW_SUFFIX = "_preview"
+
 def should_translate_file(filename):
     """Проверяет, нужно ли переводить файл"""
     basename = os.path.basename(filename).lower()
@@ -84,42 +107,163 @@ def fix_lualatex_compatibility(content):
     
     return content
 
-def translate_latex_text(latex_content, max_chunk_size=2000):
+def translate_latex_text(latex_content, max_chunk_size=None, segments=None, lang=None):
     """
-    Полный перевод LaTeX с сохранением структуры документа
+    Полный перевод LaTeX с сохранением структуры документа.
+    Если передан список segments, абзацы тела размечаются маркерами фрагментов
+    (см. segment_map); их нужно убрать extract_segment_markers перед записью.
+    max_chunk_size=None — размер чанка подбирает chunk_planner для текущей модели.
+    lang=None — язык по умолчанию (см. common.get_target_language).
     """
+    lang = lang or get_target_language()
+    segments_by_lang = None if segments is None else {lang: segments}
+    return translate_latex_languages(latex_content, [lang], max_chunk_size, segments_by_lang)[lang]
 
-    # Шаг 1: Разделяем на преамбулу, begin/end document и тело
-    begin_doc = r'\begin{document}'
-    end_doc = r'\end{document}'
-
-    if begin_doc not in latex_content:
-        # Нет структуры документа - переводим всё как есть
-        return translate_body(latex_content, max_chunk_size)
+def translate_latex_languages(latex_content, langs, max_chunk_size=None, segments=None):
+    """
+    Перевод LaTeX сразу на несколько языков: документ разбирается и маскируется
+    один раз, чанки всех языков переводятся общим пулом (см. common.translate_jobs).
+    segments — None или {язык: список фрагментов}. Возвращает {язык: текст}.
+    """
+    segments_by_key = None if segments is None else {None: segments}
+    return translate_documents([(None, latex_content)], langs, max_chunk_size, segments_by_key)[None]
 
-    # Разделяем
-    parts = latex_content.split(begin_doc, 1)
-    preamble = parts[0]
-    rest = parts[1] if len(parts) > 1 else ""
+def plan_document(latex_content, max_chunk_size=None, lang="ru"):
+    """Разбор документа на преамбулу, тело (см. plan_body) и окончание — без запросов к модели"""
 
-    if end_doc in rest:
-        body_parts = rest.split(end_doc, 1)
-        body = body_parts[0]
-        postamble = end_doc + body_parts[1] if len(body_parts) > 1 else end_doc
+    # Разделяем на преамбулу, begin/end document и тело
+    if BEGIN_DOCUMENT not in latex_content:
+        # Нет структуры документа - переводим всё как есть
+        preamble, body, postamble = None, latex_content, ""
     else:
-        body = rest
-        postamble = ""
-
-    # Шаг 2: Обрабатываем преамбулу - переводим \title и \author
-    translated_preamble = translate_preamble(preamble)
-
-    # Шаг 3: Переводим тело документа
-    translated_body = translate_body(body, max_chunk_size)
-
-    # Шаг 4: Собираем документ обратно
-    return translated_preamble + begin_doc + translated_body + postamble
-
-def translate_preamble(preamble):
+        preamble, rest = latex_content.split(BEGIN_DOCUMENT, 1)
+        if END_DOCUMENT in rest:
+            body, tail = rest.split(END_DOCUMENT, 1)
+            postamble = END_DOCUMENT + tail
+        else:
+            body, postamble = rest, ""
+
+    return {
+        "preamble": preamble,
+        "titles": {},
+        "plan": plan_body(body, max_chunk_size, lang),
+        "postamble": postamble,
+    }
+
+def _translate_titles(document, langs):
+    """Переводит \\title в преамбуле документа на каждый язык (один раз)"""
+    if document["preamble"] is None:
+        return
+    with tracing.span("tex.preamble"):
+        for lang in langs:
+            if lang not in document["titles"]:
+                document["titles"][lang] = translate_preamble(document["preamble"], lang)
+
+def assemble_document(document, lang, translations, segments=None):
+    """Собирает документ из плана (plan_document) и переводов чанков его тела"""
+    body = assemble_body(document["plan"], translations, segments)
+    if document["preamble"] is None:
+        return body
+    preamble = document["titles"].get(lang, document["preamble"])
+    return preamble + BEGIN_DOCUMENT + body + document["postamble"]
+
+def _preview_prefix(documents):
+    """
+    Сколько первых чанков каждого документа (документы — в порядке чтения) нужно
+    для черновика: титульная часть и первые PREVIEW_SECTIONS разделов, но не
+    больше PREVIEW_SHARE текста, если раздел уже начался.
+    """
+    total = sum(len(chunk) for document in documents for chunk in document["plan"]["chunks"])
+    has_sections = any(
+        _SECTION_RE.search(para) for document in documents for _, para, _ in document["plan"]["pending"]
+    )
+    sections = 0
+    done = 0
+    counts = []
+    finished = False
+    for document in documents:
+        chunks = document["plan"]["chunks"]
+        count = 0
+        for _, para, chunk_count in document["plan"]["pending"]:
+            if finished:
+                break
+            if _SECTION_RE.search(para):
+                sections += 1
+                finished = sections > PREVIEW_SECTIONS
+            if (sections or not has_sections) and done >= PREVIEW_SHARE * total:
+                finished = True
+            if finished:
+                break
+            done += sum(len(chunk) for chunk in chunks[count:count + chunk_count])
+            count += chunk_count
+        counts.append(count)
+    return counts
+
+def translate_documents(contents, langs, max_chunk_size=None, segments=None, on_draft=None):
+    """
+    Переводит LaTeX-документы (contents — [(ключ, текст)] в порядке чтения) на
+    языки langs: разбор и маскирование один раз, чанки всех документов и языков —
+    общим пулом (см. common.translate_jobs).
+    segments — None или {ключ: {язык: [фрагменты]}}. Возвращает {ключ: {язык: текст}}.
+
+    on_draft — предпросмотр: сначала переводятся титульная часть и первые
+    разделы (см. _preview_prefix), черновик {ключ: {язык: текст}} с остальным
+    текстом на языке оригинала передаётся в on_draft, затем переводится остальное.
+    """
+    filter_lang = langs[0] if len(langs) == 1 else None
+    documents = []
+    for key, content in contents:
+        with tracing.span("tex.plan", file=key, chars=len(content)):
+            documents.append(plan_document(content, max_chunk_size, filter_lang))
+
+    # Непереведённый чанк — сам исходный текст: так собирается черновик
+    translations = [{lang: list(document["plan"]["chunks"]) for lang in langs} for document in documents]
+    positions = [
+        (doc_index, chunk_index)
+        for doc_index, document in enumerate(documents)
+        for chunk_index in range(len(document["plan"]["chunks"]))
+    ]
+
+    def translate_wave(wave, desc):
+        # Порядок задач — порядок чтения: пул берёт их по очереди
+        jobs = [(documents[d]["plan"]["chunks"][c], lang) for d, c in wave for lang in langs]
+        results = iter(translate_jobs(jobs, desc) if jobs else [])
+        for d, c in wave:
+            for lang in langs:
+                translations[d][lang][c] = next(results)
+
+    if on_draft is not None:
+        prefix = _preview_prefix(documents)
+        first = [(d, c) for d, c in positions if c < prefix[d]]
+        # Если начало — это весь документ, черновик совпал бы с результатом
+        if len(first) < len(positions):
+            with tracing.span("preview.prefix", chunks=len(first), total=len(positions)):
+                for document in documents:
+                    _translate_titles(document, langs)
+                translate_wave(first, "Предпросмотр")
+            with tracing.span("preview.draft"):
+                on_draft({
+                    key: {lang: assemble_document(document, lang, translations[i][lang]) for lang in langs}
+                    for i, ((key, _), document) in enumerate(zip(contents, documents))
+                })
+            positions = [(d, c) for d, c in positions if c >= prefix[d]]
+
+    for document in documents:
+        _translate_titles(document, langs)
+    translate_wave(positions, "Перевод")
+
+    return {
+        key: {
+            lang: assemble_document(
+                document, lang, translations[i][lang],
+                None if segments is None else segments[key][lang],
+            )
+            for lang in langs
+        }
+        for i, ((key, _), document) in enumerate(zip(contents, documents))
+    }
+
+def translate_preamble(preamble, lang=None):
     """Переводит только \title{} в преамбуле, автора оставляет"""
     result = preamble
 
@@ -134,7 +278,7 @@ def translate_preamble(preamble):
         title_text = re.sub(r'\$[^$]+\$', protect, title_text)
 
         # Переводим
-        translated = translate_chunk(title_text)
+        translated = translate_chunk(title_text, lang=lang)
 
         # Восстанавливаем
         for i in range(len(protected)-1, -1, -1):
@@ -146,9 +290,11 @@ def translate_preamble(preamble):
 
     return result
 
-def translate_body(body, max_chunk_size=2000):
-    """Переводит тело документа с защитой математики и технических команд"""
-
+def protect_body(body):
+    """
+    Заменяет формулы, технические окружения и команды (\\label, \\cite, \\input...)
+    заглушками __PROTECTED_N__. Возвращает (текст, список_защищённых_блоков).
+    """
     protected_blocks = []
 
     def protect_block(match):
@@ -190,32 +336,60 @@ def translate_body(body, max_chunk_size=2000):
     text = re.sub(r'(\\bibliography\{[^}]*\})', protect_block, text)
     text = re.sub(r'(\\addbibresource\{[^}]*\})', protect_block, text)
 
+    return text, protected_blocks
+
+def translate_body(body, max_chunk_size=None, segments=None, lang=None):
+    """Переводит тело документа с защитой математики и технических команд"""
+    lang = lang or get_target_language()
+    segments_by_key = None if segments is None else {None: {lang: segments}}
+    return translate_documents([(None, body)], [lang], max_chunk_size, segments_by_key)[None][lang]
+
+def plan_body(body, max_chunk_size=None, lang="ru"):
+    """
+    Маскирует тело документа и режет абзацы на чанки. Результат не зависит от
+    языка перевода (кроме проверки «уже по-русски» при lang="ru") и собирается
+    в текст assemble_body для каждого языка отдельно.
+    """
+
+    if max_chunk_size is None:
+        max_chunk_size = plan_chunk_chars(len(body))
+
+    with tracing.span("tex.mask", chars=len(body)) as span_args:
+        text, protected_blocks = protect_body(body)
+        span_args["blocks"] = len(protected_blocks)
+
     # Разбиваем на параграфы
     paragraphs = re.split(r'(\n\s*\n)', text)
 
-    translated_parts = []
+    # Сначала режем абзацы на чанки, затем переводим все чанки разом —
+    # бэкенд держит несколько запросов одновременно (см. translate_chunks)
+    parts = []
+    pending = []  # (индекс в parts, абзац, число чанков)
+    all_chunks = []
 
-    for para in tqdm(paragraphs, desc="Перевод"):
+    for para in paragraphs:
         if not para.strip():
-            translated_parts.append(para)
+            parts.append(para)
             continue
 
         # Если только защищённые блоки - не переводим
         if re.fullmatch(r'[\s__PROTECTED_\d+__]+', para):
-            translated_parts.append(para)
+            parts.append(para)
+            continue
+
+        # Числа, ссылки, код, уже переведённый текст — без запроса к модели (см. segment_filter)
+        if segment_filter.should_skip(para, lang):
+            parts.append(para)
             continue
 
         # Проверяем, есть ли что переводить
-        temp = para
-        for i in range(len(protected_blocks)):
-            temp = temp.replace(f"__PROTECTED_{i}__", "")
+        temp = re.sub(r'__PROTECTED_\d+__', "", para)
 
         # Если после удаления защищённого осталось только пробелы/LaTeX команды
         if not re.search(r'[a-zA-Z]{2,}', temp):
-            translated_parts.append(para)
+            parts.append(para)
             continue
 
-        # Переводим
         if len(para) > max_chunk_size:
             sentences = re.split(r'(?<=[.!?])\s+', para)
             chunks = []
@@ -233,21 +407,47 @@ def translate_body(body, max_chunk_size=2000):
 
             if current:
                 chunks.append(' '.join(current))
-
-            translated = ' '.join(translate_chunk(chunk) for chunk in chunks if chunk.strip())
+            chunks = [chunk for chunk in chunks if chunk.strip()]
         else:
-            translated = translate_chunk(para)
+            chunks = [para]
+
+        pending.append((len(parts), para, len(chunks)))
+        parts.append(None)
+        all_chunks.extend(chunks)
+
+    return {"parts": parts, "pending": pending, "chunks": all_chunks, "protected": protected_blocks}
 
-        translated_parts.append(translated)
+def assemble_body(plan, translations, segments=None):
+    """Собирает тело из плана (plan_body) и переводов его чанков в том же порядке"""
+    protected_blocks = plan["protected"]
+    translated_parts = list(plan["parts"])
+    translations = iter(translations)
+    for index, para, count in plan["pending"]:
+        translated = ' '.join(next(translations) for _ in range(count))
+
+        if segments is not None:
+            segment_id = len(segments)
+            segments.append({"id": segment_id, "source": _restore_protected(para, protected_blocks)})
+            translated = wrap_segment(segment_id, translated)
+
+        translated_parts[index] = translated
 
     result = ''.join(translated_parts)
 
     # Восстанавливаем защищённые блоки
-    for i in range(len(protected_blocks) - 1, -1, -1):
-        result = result.replace(f"__PROTECTED_{i}__", protected_blocks[i])
+    with tracing.span("tex.unmask", blocks=len(protected_blocks)):
+        for i in range(len(protected_blocks) - 1, -1, -1):
+            result = result.replace(f"__PROTECTED_{i}__", protected_blocks[i])
 
     return result
 
+def _restore_protected(text, protected_blocks):
+    """Подставляет защищённые блоки обратно (блоки могут быть вложены друг в друга)"""
+    pattern = re.compile(r'__PROTECTED_(\d+)__')
+    while pattern.search(text):
+        text = pattern.sub(lambda m: protected_blocks[int(m.group(1))], text)
+    return text
+
 def restore_bibliography_commands(original_content, translated_content):
     """Восстанавливает библиографические команды из оригинала без лишних backslash."""
     # bibliographystyle
@@ -274,117 +474,223 @@ def restore_bibliography_commands(original_content, translated_content):
 
     return translated_content
 
-def process_zip_for_translation(zip_path, output_dir):
+def process_zip_for_translation(zip_path, output_dir, lang=None):
     """Обрабатывает ZIP-архив с LaTeX файлами"""
-    import tempfile
+    lang = lang or get_target_language()
+    outputs, main_tex_rel = process_zip_languages(zip_path, output_dir, [lang])
+    return outputs[lang], main_tex_rel
 
-    with tempfile.TemporaryDirectory() as tmp_extract_dir:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(tmp_extract_dir)
-
-        tex_files = []
-        main_tex = None
-        is_mdpi = False  # Флаг для определения MDPI
-        
-        for root, _, files in os.walk(tmp_extract_dir):
-            for f in files:
-                if f.lower().endswith('.tex'):
-                    full_path = os.path.join(root, f)
-                    
-                    # ПРОВЕРЯЕМ, НУЖНО ЛИ ПЕРЕВОДИТЬ ФАЙЛ
-                    if not should_translate_file(f):
-                        print(f"⏭️  Пропуск файла (технический): {f}")
-                        continue
-                    
-                    tex_files.append(full_path)
-                    if main_tex is None:
-                        try:
-                            with open(full_path, 'r', encoding='utf-8') as fp:
-                                content = fp.read()
-                                if r'\begin{document}' in content:
-                                    main_tex = full_path
-                                    # Проверяем, это MDPI?
-                                    if 'mdpi' in content.lower() and '\\documentclass' in content:
-                                        is_mdpi = True
-                        except:
-                            pass
-
-        if not tex_files:
-            # Проверяем, есть ли вообще .tex файлы
-            all_tex = []
-            for root, _, files in os.walk(tmp_extract_dir):
-                for f in files:
-                    if f.lower().endswith('.tex'):
-                        all_tex.append(os.path.join(root, f))
-            
-            if not all_tex:
-                raise ValueError("В архиве нет .tex файлов.")
-            else:
-                print("⚠️  Все .tex файлы были исключены (технические файлы).")
-                print("ℹ️  Создаём архив без изменений...")
-                # Находим главный файл для компиляции
-                for tf in all_tex:
-                    try:
-                        with open(tf, 'r', encoding='utf-8') as fp:
-                            if r'\begin{document}' in fp.read():
-                                main_tex = tf
-                                break
-                    except:
-                        pass
-                
-                if not main_tex:
-                    main_tex = all_tex[0]
-
-        if main_tex is None and tex_files:
-            main_tex = tex_files[0]
-            print("⚠️ Не найден \\begin{document}. Используем первый .tex как главный.")
-
-        # Переводим только отобранные файлы
-        for tex_path in tex_files:
-            print(f"\n📄 Перевод файла: {os.path.basename(tex_path)}")
-            with open(tex_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-
-            content_with_preamble = add_russian_preamble(original_content)
-            translated = translate_latex_text(content_with_preamble)
-            translated = restore_bibliography_commands(original_content, translated)
-
-            # Восстанавливаем \documentclass из оригинала
-            docclass_match = re.search(r'\\documentclass(?:\[[^\]]*\])?\{[^\}]+\}', original_content)
-            if docclass_match:
-                orig_docclass = docclass_match.group(0)
-                translated = re.sub(
-                    r'\\documentclass(?:\[[^\]]*\])?\{[^\}]+\}',
-                    lambda m: orig_docclass,
-                    translated,
-                    count=1
+def process_zip_languages(zip_path, output_dir, langs, on_preview=None):
+    """
+    Переводит ZIP-архив на несколько языков: распаковка и разбор один раз,
+    по архиву на язык. Возвращает ({язык: путь архива}, главный_tex).
+    on_preview({язык: путь черновика}, главный_tex) вызывается, когда готовы
+    архивы-черновики с переведённым началом (см. translate_documents).
+    """
+    import workspace
+
+    # Распаковка, поиск главного файла и граф включений — из кэша рабочих копий
+    project = workspace.open_workspace(zip_path)
+    source_root = project["root"]
+    members = project["members"]
+    if project["main_tex"] is None:
+        raise ValueError("В архиве нет .tex файлов.")
+    main_tex_rel = os.path.normpath(project["main_tex"])
+
+    # Главный файл и подключаемые им — в порядке чтения: один разбор на все языки
+    tex_files = []
+    for rel_path in workspace.reading_order(project):
+        if not should_translate_file(os.path.basename(rel_path)):
+            print(f"⏭️  Пропуск файла (технический): {os.path.basename(rel_path)}")
+            continue
+        tex_files.append(rel_path)
+
+    if not tex_files:
+        print("⚠️  Все .tex файлы были исключены (технические файлы).")
+        print("ℹ️  Создаём архив без изменений...")
+    elif project["main_guessed"]:
+        print("⚠️ Не найден \\begin{document}. Используем первый .tex как главный.")
+
+    originals = {}
+    for rel_path in tex_files:
+        print(f"📄 Перевод файла: {os.path.normpath(rel_path)}")
+        with open(os.path.join(source_root, rel_path), 'r', encoding='utf-8') as f:
+            originals[rel_path] = f.read()
+    # ПРИМЕНЯЕМ ФИКС ДЛЯ MDPI
+    mdpi_rel = project["main_tex"] if project["is_mdpi"] else None
+    base_name = os.path.splitext(os.path.basename(zip_path))[0]
+
+    def write_archives(translated, suffix="", segments=None):
+        # Нетронутые файлы копируются из исходного архива без перепаковки
+        outputs = {}
+        for lang in langs:
+            replacements = {}
+            for rel_path, original_content in originals.items():
+                text = _finish_translation(original_content, translated[rel_path][lang], lang, rel_path == mdpi_rel)
+                if segments is not None:
+                    text = extract_segment_markers(text, segments[rel_path][lang])
+                replacements[members[rel_path.replace(os.sep, '/')]] = text.encode('utf-8')
+            output_zip = os.path.join(output_dir, f"{base_name}{output_suffix(lang)}{suffix}.zip")
+            with tracing.span("zip.write", file=os.path.basename(output_zip)):
+                copy_zip_with_replacements(zip_path, output_zip, replacements)
+            if segments is not None:
+                save_segment_map(
+                    output_zip, {rel_path: segments[rel_path][lang] for rel_path in originals}, lang,
                 )
-            
-            # ПРИМЕНЯЕМ ФИКС ДЛЯ MDPI
-            if is_mdpi and tex_path == main_tex:
-                translated = fix_lualatex_compatibility(translated)
-                print("  ✓ Применён фикс совместимости LuaLaTeX для MDPI")
+            outputs[lang] = output_zip
+        return outputs
+
+    on_draft = None
+    if on_preview is not None:
+        def on_draft(drafts):
+            on_preview(write_archives(drafts, PREVIEW_SUFFIX), main_tex_rel)
+
+    segments = {rel_path: {lang: [] for lang in langs} for rel_path in originals}
+    translated = translate_documents(list(originals.items()), langs, segments=segments, on_draft=on_draft)
+    if mdpi_rel in originals:
+        print("  ✓ Применён фикс совместимости LuaLaTeX для MDPI")
+    return write_archives(translated, segments=segments), main_tex_rel
+
+def _finish_translation(original_content, translated, lang, mdpi_fix=False):
+    """Преамбула языка, библиография и \\documentclass из оригинала, фикс MDPI"""
+    translated = add_language_preamble(translated, lang)
+    translated = restore_bibliography_commands(original_content, translated)
+
+    # Восстанавливаем \documentclass из оригинала
+    docclass_match = re.search(r'\\documentclass(?:\[[^\]]*\])?\{[^\}]+\}', original_content)
+    if docclass_match:
+        orig_docclass = docclass_match.group(0)
+        translated = re.sub(
+            r'\\documentclass(?:\[[^\]]*\])?\{[^\}]+\}',
+            lambda m: orig_docclass,
+            translated,
+            count=1
+        )
+    if mdpi_fix:
+        translated = fix_lualatex_compatibility(translated)
+    return translated
 
-            with open(tex_path, 'w', encoding='utf-8') as f:
-                f.write(translated)
+def translate_tex_file(input_path, output_dir, lang=None):
+    """Переводит одиночный .tex файл. Возвращает путь к переведённому файлу"""
+    lang = lang or get_target_language()
+    return translate_tex_file_languages(input_path, output_dir, [lang])[lang]
 
-        base_name = os.path.splitext(os.path.basename(zip_path))[0]
-        output_zip = os.path.join(output_dir, f"{base_name}_translated.zip")
+def translate_tex_file_languages(input_path, output_dir, langs, on_preview=None):
+    """
+    Переводит .tex на несколько языков за один разбор; {язык: путь результата}.
+    on_preview({язык: путь черновика}) — см. translate_documents.
+    """
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    key = os.path.basename(input_path)
+    with open(input_path, 'r', encoding='utf-8') as f:
+        original_content = f.read()
+
+    def write_files(translated, suffix="", segments=None):
+        outputs = {}
+        for lang in langs:
+            output_tex = os.path.join(output_dir, f"{base}{output_suffix(lang)}{suffix}.tex")
+            text = _finish_translation(original_content, translated[key][lang], lang)
+            if segments is not None:
+                text = extract_segment_markers(text, segments[key][lang])
+            with open(output_tex, 'w', encoding='utf-8') as f:
+                f.write(text)
+            if segments is not None:
+                save_segment_map(output_tex, {os.path.basename(output_tex): segments[key][lang]}, lang)
+            outputs[lang] = output_tex
+        return outputs
+
+    on_draft = None
+    if on_preview is not None:
+        def on_draft(drafts):
+            on_preview(write_files(drafts, PREVIEW_SUFFIX))
+
+    with tracing.span("tex.file", file=key, languages=len(langs)):
+        segments = {key: {lang: [] for lang in langs}}
+        translated = translate_documents([(key, original_content)], langs, segments=segments, on_draft=on_draft)
+    return write_files(translated, segments=segments)
+
+def retranslate_segments(output_path, failed):
+    """
+    Переводит заново только указанные фрагменты уже переведённого .tex или .zip.
+    failed — {относительный_путь_tex: [id фрагментов]} (см. CompileResult.failed_segments).
+    Возвращает число обновлённых фрагментов.
+    """
+    segment_map = load_segment_map(output_path)
+    if not segment_map:
+        print("⚠️ Карта фрагментов не найдена — перевести выборочно нельзя.")
+        return 0
+
+    is_zip = output_path.lower().endswith('.zip')
+    if is_zip:
+        zip_ref = zipfile.ZipFile(output_path, 'r')
+        names = {os.path.normpath(name).replace(os.sep, '/'): name for name in zip_ref.namelist()}
+    replacements = {}
+    updated = 0
+
+    for rel_path, ids in failed.items():
+        key = os.path.normpath(rel_path).replace(os.sep, '/')
+        segments = segment_map["files"].get(key, [])
+        targets = [segment for segment in segments if segment["id"] in ids]
+        if not targets:
+            continue
+
+        if is_zip:
+            if key not in names:
+                continue
+            content = zip_ref.read(names[key]).decode('utf-8')
+        else:
+            with open(output_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+        # С конца файла, чтобы смещения ещё не обработанных фрагментов не менялись
+        for segment in sorted(targets, key=lambda seg: seg["start_line"], reverse=True):
+            line_offset = 0
+            for _ in range(segment["start_line"] - 1):
+                line_offset = content.index('\n', line_offset) + 1
+            position = content.find(segment["text"], line_offset)
+            if position < 0:
+                print(f"⚠️ Фрагмент #{segment['id']} изменён вручную — пропуск.")
+                continue
+
+            print(f"🔁 Повторный перевод фрагмента #{segment['id']} ({rel_path}:{segment['start_line']})")
+            # Кэш переводов здесь не читаем: там лежит перевод, который и привёл к ошибке
+            with translation_cache.bypass():
+                new_text = translate_body(segment["source"], lang=segment_map.get("lang"))
+            content = content[:position] + new_text + content[position + len(segment["text"]):]
+
+            delta = new_text.count('\n') - segment["text"].count('\n')
+            for other in segments:
+                if other["start_line"] > segment["start_line"]:
+                    other["start_line"] += delta
+                    other["end_line"] += delta
+            segment["end_line"] += delta
+            segment["text"] = new_text
+            updated += 1
+
+        if is_zip:
+            replacements[names[key]] = content.encode('utf-8')
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write(content)
 
-        with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as new_zip:
-            for root, _, files in os.walk(tmp_extract_dir):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    arc_path = os.path.relpath(full_path, tmp_extract_dir)
-                    new_zip.write(full_path, arc_path)
+    if is_zip:
+        zip_ref.close()
+        if replacements:
+            rewrite_zip_members(output_path, replacements)
 
-        main_tex_rel = os.path.relpath(main_tex, tmp_extract_dir)
-        return output_zip, main_tex_rel
+    with open(segment_map_path(output_path), 'w', encoding='utf-8') as f:
+        json.dump(segment_map, f, ensure_ascii=False, indent=1)
+    return updated
 
 def add_russian_preamble(latex_content):
     """Добавляет поддержку русского языка в преамбулу с учётом LuaLaTeX для MDPI"""
+    return add_language_preamble(latex_content, "ru")
+
+def add_language_preamble(latex_content, lang):
+    """Добавляет поддержку языка lang в преамбулу (babel или polyglossia для MDPI)"""
     if r"\documentclass" not in latex_content:
         return latex_content
+    language = get_language(lang)
 
     # Удаляем старые babel команды
     lines = []
@@ -404,10 +710,10 @@ def add_russian_preamble(latex_content):
     if is_mdpi:
         # Для MDPI используем настройки для LuaLaTeX
         new_preamble = [
-            "% Поддержка русского языка (автоматически добавлено для LuaLaTeX)",
+            f"% Поддержка {language['genitive']} языка (автоматически добавлено для LuaLaTeX)",
             r"\usepackage{fontspec}",
             r"\usepackage{polyglossia}",
-            r"\setmainlanguage{russian}",
+            rf"\setmainlanguage{{{language['polyglossia']}}}",
             r"\setotherlanguage{english}",
             r"\defaultfontfeatures{Ligatures=TeX,Scale=MatchLowercase}",
             r"\setmainfont{DejaVu Serif}",
@@ -418,9 +724,9 @@ def add_russian_preamble(latex_content):
     else:
         # Для обычных документов
         new_preamble = [
-            "% Поддержка русского языка (автоматически добавлено)",
+            f"% Поддержка {language['genitive']} языка (автоматически добавлено)",
             r"\usepackage{fontspec}",
-            r"\usepackage[russian]{babel}",
+            rf"\usepackage[{language['babel']}]{{babel}}",
             r"\setmainfont{DejaVu Serif}",
             r"\setsansfont{DejaVu Sans}",
             r"\setmonofont{DejaVu Sans Mono}",
@@ -0,0 +1,237 @@
+# translation_backends.py
+"""
+Бэкенды перевода для common.translate_chunk.
+
+- OpenRouterBackend — OpenRouter (OPENROUTER_API_KEY);
+- OpenAICompatibleBackend — любой сервер с OpenAI Chat Completions API:
+  proxyapi.ru, llama.cpp server, vLLM, Ollama (PROXY_API_URL, PROXY_API_KEY —
+  для локальных серверов ключ не обязателен);
+- StubBackend — детерминированная заглушка без сети (тесты, замеры).
+
+Каждый бэкенд объявляет, сколько запросов можно держать одновременно
+(concurrency) и ограничивает ли сервер частоту запросов (rate_limited):
+локальный vLLM сам собирает параллельные запросы в батчи, и на него
+имеет смысл отправлять много запросов сразу.
+
+Ответ, упёршийся в max_tokens (finish_reason=length), можно продолжить:
+complete(..., continue_from=начало_ответа) просит модель дописать его
+с места обрыва, не переводя фрагмент заново.
+
+Выбор — переменная окружения TRANSLATION_BACKEND (auto | openrouter | openai | stub);
+auto: OpenRouter, если задан OPENROUTER_API_KEY, иначе OpenAI-совместимый сервер.
+"""
+import os
+from urllib.parse import urlparse
+
+OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+PROXY_API_URL_DEFAULT = "https://api.proxyapi.ru/openai/v1/chat/completions"
+
+REQUEST_TIMEOUT = 120
+
+CONTINUATION_PROMPT = (
+    "Ответ оборвался. Продолжи перевод ровно с того места, где остановился: "
+    "не повторяй уже написанное и ничего не добавляй от себя."
+)
+
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1", "0.0.0.0")
+
+
+class Completion:
+    """
+    Ответ модели: текст, причина остановки (stop | length | ...), HTTP-статус,
+    расход токенов ({"prompt_tokens", "completion_tokens"}), если сервер его сообщил,
+    и пауза из Retry-After (в секундах) для ответа 429.
+    """
+
+    def __init__(self, text, finish_reason=None, status=200, usage=None, retry_after=None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.status = status
+        self.usage = usage
+        self.retry_after = retry_after
+
+    @property
+    def ok(self):
+        return self.status == 200 and bool(self.text)
+
+    @property
+    def truncated(self):
+        return self.finish_reason == "length"
+
+
+class TranslationBackend:
+    """Базовый бэкенд: настройка из окружения и один запрос к модели"""
+
+    name = "base"
+    label = "LLM"
+    # Сколько запросов держать одновременно и ограничивает ли сервер их частоту
+    concurrency = 1
+    rate_limited = True
+    # Модель по умолчанию, если пользователь не выбрал (None — выбор обязателен)
+    default_model = None
+
+    def configure(self):
+        """Читает настройки из окружения; ValueError, если их не хватает"""
+
+    def complete(self, model, prompt, max_tokens, source=None, timeout=REQUEST_TIMEOUT, continue_from=None):
+        """
+        Отправляет prompt модели. source — исходный текст без инструкций
+        (нужен заглушке); continue_from — уже полученное начало обрезанного
+        ответа: модель продолжает его, а Completion.text содержит только
+        продолжение. Возвращает Completion; сетевые ошибки пробрасываются.
+        """
+        raise NotImplementedError
+
+    def quota_key(self):
+        """Ключ общей для всех процессов квоты (см. shared_quota) или None — квоты нет"""
+        return None
+
+    def describe(self):
+        mode = "с ограничением частоты" if self.rate_limited else "без ограничения частоты"
+        return f"{self.label}: до {self.concurrency} запросов одновременно, {mode}"
+
+
+class OpenAICompatibleBackend(TranslationBackend):
+    """Сервер с OpenAI Chat Completions API (proxyapi, llama.cpp, vLLM)"""
+
+    name = "openai"
+    label = "OpenAI-совместимый сервер"
+
+    def __init__(self):
+        self.url = None
+        self.api_key = None
+
+    def configure(self):
+        self.url = os.getenv("PROXY_API_URL", PROXY_API_URL_DEFAULT)
+        self.api_key = os.getenv("PROXY_API_KEY")
+        local = urlparse(self.url).hostname in _LOCAL_HOSTS
+        if not self.api_key and not local:
+            raise ValueError("❌ PROXY_API_KEY не найден в .env. Добавьте его (для локального сервера не нужен).")
+        # Локальный сервер не ограничивает частоту — упираемся только в его пропускную способность
+        self.rate_limited = not local
+        self.concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", "16" if local else "4"))
+        self.default_model = os.getenv("PROXY_API_MODEL")
+
+    def quota_key(self):
+        if not self.rate_limited:
+            return None
+        from shared_quota import quota_key
+        return quota_key(self.url, self.api_key)
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def complete(self, model, prompt, max_tokens, source=None, timeout=REQUEST_TIMEOUT, continue_from=None):
+        import requests
+
+        messages = [{"role": "user", "content": prompt}]
+        if continue_from is not None:
+            messages += [
+                {"role": "assistant", "content": continue_from},
+                {"role": "user", "content": CONTINUATION_PROMPT},
+            ]
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": 0.2,
+            "top_p": 0.95
+        }
+        response = requests.post(self.url, json=payload, headers=self._headers(), timeout=timeout)
+        if response.status_code != 200:
+            return Completion("", status=response.status_code, retry_after=_retry_after(response))
+        data = response.json()
+        choice = data.get("choices", [{}])[0]
+        text = choice.get("message", {}).get("content") or ""
+        # Продолжение может начинаться с пробела между словами — его не срезаем
+        text = text.rstrip() if continue_from is not None else text.strip()
+        return Completion(text, choice.get("finish_reason"), usage=data.get("usage"))
+
+
+def _retry_after(response):
+    """Retry-After в секундах (форма с датой не поддерживается) или None"""
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class OpenRouterBackend(OpenAICompatibleBackend):
+    """OpenRouter: тот же протокол, свой ключ и заголовки атрибуции"""
+
+    name = "openrouter"
+    label = "OpenRouter"
+
+    def configure(self):
+        self.url = os.getenv("OPENROUTER_API_URL", OPENROUTER_API_URL)
+        self.api_key = os.getenv("OPENROUTER_API_KEY")
+        if not self.api_key:
+            raise ValueError("❌ OPENROUTER_API_KEY не найден в .env. Добавьте его.")
+        self.rate_limited = True
+        self.concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", "4"))
+
+    def _headers(self):
+        headers = super()._headers()
+        headers["HTTP-Referer"] = "https://github.com/llm-translator"
+        headers["X-Title"] = "LLM Translator"
+        return headers
+
+
+class StubBackend(TranslationBackend):
+    """
+    Заглушка: «переводит» детерминированно и мгновенно, без сети.
+    Как настоящая модель, обрывает ответ длиннее max_tokens (~4 символа на токен).
+    """
+
+    name = "stub"
+    label = "заглушка"
+    rate_limited = False
+    default_model = "stub"
+
+    def __init__(self):
+        self.calls = 0
+
+    def configure(self):
+        self.concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", "8"))
+
+    def complete(self, model, prompt, max_tokens, source=None, timeout=REQUEST_TIMEOUT, continue_from=None):
+        self.calls += 1
+        text = source if source is not None else prompt
+        answer = f"[ru] {text.strip()}"
+        if continue_from is not None:
+            answer = answer[len(continue_from):]
+        limit = max_tokens * 4
+        if len(answer) > limit:
+            return Completion(answer[:limit], "length")
+        return Completion(answer, "stop")
+
+
+BACKENDS = {
+    "openrouter": OpenRouterBackend,
+    "openai": OpenAICompatibleBackend,
+    "stub": StubBackend,
+}
+
+_instances = {}
+
+
+def get_backend(kind=None):
+    """
+    Возвращает настроенный бэкенд (экземпляры переиспользуются).
+    Бросает ValueError, если для него не хватает настроек в окружении.
+    """
+    kind = (kind or os.getenv("TRANSLATION_BACKEND", "auto")).lower()
+    if kind == "auto":
+        kind = "openrouter" if os.getenv("OPENROUTER_API_KEY") else "openai"
+
+    if kind not in BACKENDS:
+        raise ValueError(f"Неизвестный TRANSLATION_BACKEND: {kind} (ожидается auto, {', '.join(BACKENDS)})")
+
+    if kind not in _instances:
+        backend = BACKENDS[kind]()
+        backend.configure()
+        _instances[kind] = backend
+    return _instances[kind]
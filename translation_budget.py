@@ -0,0 +1,225 @@
+# translation_budget.py
+"""
+Оценка перевода до запуска и лимит расхода во время перевода.
+
+- Оценка (translate --dry-run): документы проходят весь локальный конвейер —
+  распаковку, маскирование, фильтр, кэш, нарезку на чанки, — но вместо запроса
+  к модели translate_chunk только учитывает его здесь (одинаковые промпты —
+  один раз). print_estimate() печатает число запросов, токены, стоимость для
+  моделей из PAID_MODELS и время при текущей параллельности по статистике
+  задержек модели (см. chunk_planner.estimate_wall_time).
+- Лимит (--max-tokens, --max-cost или TRANSLATION_MAX_TOKENS, TRANSLATION_MAX_COST):
+  перед каждым запросом его оценка резервируется, после ответа заменяется
+  фактическим расходом (usage из ответа API, если сервер его вернул). Запрос,
+  который вышел бы за лимит, не отправляется — бросается BudgetExceeded;
+  уже переведённое остаётся в кэше, и повторный запуск продолжит с того же места.
+
+Токены оцениваются по символам: ~4 символа латиницы или ~2.5 символа кириллицы
+на токен; ответ — 0.5 токена на символ исходника для кириллических языков.
+"""
+import contextlib
+import math
+import os
+import re
+import threading
+
+CHARS_PER_TOKEN_ASCII = 4.0
+CHARS_PER_TOKEN_OTHER = 2.5
+# Токенов ответа на символ исходного текста
+COMPLETION_TOKENS_PER_CHAR = {"ru": 0.5, "uk": 0.5}
+DEFAULT_COMPLETION_TOKENS_PER_CHAR = 0.35
+
+_PRICE_RE = re.compile(r'\$\s*([\d.]+)\s*/\s*1M')
+
+
+class BudgetExceeded(Exception):
+    """Следующий запрос превысил бы лимит токенов или стоимости"""
+
+
+_lock = threading.Lock()
+_dry_run = False
+_seen = set()
+plan = {"requests": 0, "duplicates": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0}
+_sizes = []
+
+limits = {"tokens": None, "cost": None, "price": None}
+spent = {"tokens": 0, "cost": 0.0}
+
+
+def estimate_tokens(text):
+    other = sum(1 for char in text if ord(char) > 127)
+    return math.ceil((len(text) - other) / CHARS_PER_TOKEN_ASCII + other / CHARS_PER_TOKEN_OTHER)
+
+
+def estimate_completion_tokens(text, lang):
+    return math.ceil(len(text) * COMPLETION_TOKENS_PER_CHAR.get(lang, DEFAULT_COMPLETION_TOKENS_PER_CHAR))
+
+
+def model_price(model):
+    """Цена модели в $ за 1M токенов (по PAID_MODELS; TRANSLATION_PRICE — для прочих) или None"""
+    from common import FREE_MODELS, PAID_MODELS
+    for entry in PAID_MODELS:
+        if entry["id"] == model:
+            match = _PRICE_RE.search(entry["price"])
+            return float(match.group(1)) if match else None
+    if model in FREE_MODELS or (model or "").endswith(":free"):
+        return 0.0
+    price = os.getenv("TRANSLATION_PRICE")
+    return float(price) if price else None
+
+
+# --- оценка без запросов к API ---
+
+def is_dry_run():
+    return _dry_run
+
+
+@contextlib.contextmanager
+def dry_run():
+    """Внутри блока translate_chunk не обращается к модели, а учитывает запросы в plan"""
+    global _dry_run
+    with _lock:
+        _seen.clear()
+        _sizes.clear()
+        for key in plan:
+            plan[key] = 0
+        _dry_run = True
+    try:
+        yield plan
+    finally:
+        _dry_run = False
+
+
+def record_cached():
+    if _dry_run:
+        with _lock:
+            plan["cached"] += 1
+
+
+def record_request(key, prompt, text, lang):
+    """Учитывает запрос, который отправил бы translate_chunk (повторы — отдельно)"""
+    with _lock:
+        if key in _seen:
+            plan["duplicates"] += 1
+            return
+        _seen.add(key)
+        plan["requests"] += 1
+        plan["prompt_tokens"] += estimate_tokens(prompt)
+        plan["completion_tokens"] += estimate_completion_tokens(text, lang)
+        _sizes.append(len(text))
+
+
+def _format_duration(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f} с"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.1f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+def print_estimate(model):
+    """Итог оценки: запросы, токены, время для model, стоимость по PAID_MODELS"""
+    from common import PAID_MODELS, estimate_wall_time, get_translation_backend
+
+    tokens = plan["prompt_tokens"] + plan["completion_tokens"]
+    print("\n" + "=" * 70)
+    print("🧮 ОЦЕНКА ПЕРЕВОДА (без запросов к API)")
+    print("-" * 70)
+    print(
+        f"Запросов к модели: {plan['requests']} "
+        f"(ещё {plan['cached']} — из кэша, {plan['duplicates']} — повторы)"
+    )
+    print(
+        f"Токенов: ~{plan['prompt_tokens']:,} на входе + ~{plan['completion_tokens']:,} на выходе "
+        f"= ~{tokens:,}".replace(",", " ")
+    )
+
+    concurrency = get_translation_backend().concurrency
+    seconds = estimate_wall_time(list(_sizes))
+    if seconds is None:
+        print(f"Время: нет статистики задержек {model} (копится при переводе, см. chunk_planner)")
+    else:
+        print(f"Время: ~{_format_duration(seconds)} при {concurrency} одновременных запросах ({model})")
+
+    print("Стоимость:")
+    models = [(entry["id"], entry["name"]) for entry in PAID_MODELS]
+    if model not in {model_id for model_id, _ in models}:
+        models.insert(0, (model, model))
+    for model_id, name in models:
+        price = model_price(model_id)
+        if price is None:
+            cost = "цена неизвестна (TRANSLATION_PRICE)"
+        else:
+            dollars = tokens * price / 1e6
+            cost = f"~${dollars:.2f}" if dollars >= 0.01 or dollars == 0 else "< $0.01"
+        mark = "👉" if model_id == model else "  "
+        print(f"  {mark} {name:<40} {cost}")
+    print("=" * 70)
+
+
+# --- лимит расхода ---
+
+def set_limits(max_tokens=None, max_cost=None, model=None):
+    """Лимиты на прогон (None — из TRANSLATION_MAX_TOKENS / TRANSLATION_MAX_COST); расход обнуляется"""
+    if max_tokens is None and os.getenv("TRANSLATION_MAX_TOKENS"):
+        max_tokens = int(os.getenv("TRANSLATION_MAX_TOKENS"))
+    if max_cost is None and os.getenv("TRANSLATION_MAX_COST"):
+        max_cost = float(os.getenv("TRANSLATION_MAX_COST"))
+    price = model_price(model) if max_cost is not None else None
+    if max_cost is not None and price is None:
+        print(f"⚠️ Цена {model} неизвестна — лимит стоимости не действует (задайте TRANSLATION_PRICE)")
+    with _lock:
+        limits["tokens"] = max_tokens
+        limits["cost"] = max_cost if price is not None else None
+        limits["price"] = price
+        spent["tokens"] = 0
+        spent["cost"] = 0.0
+
+
+def _cost(tokens):
+    return tokens * limits["price"] / 1e6 if limits["price"] is not None else 0.0
+
+
+def reserve(prompt, text, lang):
+    """
+    Резервирует оценку запроса; BudgetExceeded, если он вышел бы за лимит.
+    Возвращает зарезервированное число токенов (для settle).
+    """
+    if limits["tokens"] is None and limits["cost"] is None:
+        return 0
+    tokens = estimate_tokens(prompt) + estimate_completion_tokens(text, lang)
+    with _lock:
+        if limits["tokens"] is not None and spent["tokens"] + tokens > limits["tokens"]:
+            raise BudgetExceeded(
+                f"Лимит токенов исчерпан: израсходовано ~{spent['tokens']} из {limits['tokens']}"
+            )
+        if limits["cost"] is not None and spent["cost"] + _cost(tokens) > limits["cost"]:
+            raise BudgetExceeded(
+                f"Лимит стоимости исчерпан: израсходовано ~${spent['cost']:.2f} из ${limits['cost']:.2f}"
+            )
+        spent["tokens"] += tokens
+        spent["cost"] += _cost(tokens)
+    return tokens
+
+
+def settle(reserved, usage):
+    """
+    Заменяет резерв фактическим расходом из ответа API: usage=None — остаётся
+    оценка, {} — запрос не оплачен (резерв возвращается).
+    """
+    if not reserved or usage is None:
+        return
+    actual = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    with _lock:
+        spent["tokens"] += actual - reserved
+        spent["cost"] += _cost(actual - reserved)
+
+
+def print_spent():
+    """Расход за прогон, если задан лимит"""
+    if limits["tokens"] is None and limits["cost"] is None:
+        return
+    text = f"💸 Израсходовано: ~{spent['tokens']} токенов"
+    if limits["price"] is not None:
+        text += f", ~${spent['cost']:.2f}"
+    print(text)
@@ -0,0 +1,151 @@
+# translation_cache.py
+"""
+Точный кэш переводов: один и тот же фрагмент с той же моделью и тем же
+промптом не переводится повторно. Благодаря ему повторный перевод изменённого
+документа (режим наблюдения) отправляет в API только изменившиеся абзацы.
+
+Маркеры-заглушки (__PROTECTED_17__, __MATH_3__, __TEXTMATH_2__, __P0__) перед поиском
+перенумеровываются в порядке появления, поэтому правка в начале документа,
+сдвигающая нумерацию, не делает промахами все следующие абзацы.
+
+Хранилище — SQLite в .cache/translations.sqlite3; TRANSLATION_CACHE=0 отключает кэш.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+TRANSLATION_CACHE_PATH = os.path.abspath(
+    os.getenv("TRANSLATION_CACHE_PATH", os.path.join(".cache", "translations.sqlite3"))
+)
+
+# Заглушки всех видов: __PROTECTED_7__ (translate_tex), __MATH_3__ и __TEXTMATH_2__
+# (translate_docx), __P0__; группы — вид и номер. Общее выражение для всех модулей
+PLACEHOLDER_RE = re.compile(r'__(PROTECTED|MATH|TEXTMATH|P)_?(\d+)__')
+
+_lock = threading.Lock()
+_connection = None
+# Глубина вложенных bypass(): общая для всех потоков, так как перевод идёт пулом
+_bypass_depth = 0
+
+# Счётчики с начала процесса (или с последнего reset_stats)
+stats = {"hits": 0, "misses": 0}
+
+
+def is_enabled():
+    return os.getenv("TRANSLATION_CACHE", "1") != "0"
+
+
+def _placeholder(kind, number):
+    return f"__P{number}__" if kind == "P" else f"__{kind}_{number}__"
+
+
+def normalize_placeholders(text):
+    """
+    Перенумеровывает заглушки с нуля в порядке появления.
+    Возвращает (нормализованный_текст, {новая_заглушка: исходная}).
+    """
+    mapping = {}
+    numbers = {}
+
+    def renumber(match):
+        original = match.group(0)
+        kind = match.group(1)
+        key = (kind, original)
+        if key not in numbers:
+            numbers[key] = sum(1 for k, _ in numbers if k == kind)
+            mapping[_placeholder(kind, numbers[key])] = original
+        return _placeholder(kind, numbers[key])
+
+    return PLACEHOLDER_RE.sub(renumber, text), mapping
+
+
+def restore_placeholders(text, mapping):
+    if not mapping:
+        return text
+    return PLACEHOLDER_RE.sub(lambda m: mapping.get(m.group(0), m.group(0)), text)
+
+
+def cache_key(model, prompt):
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(TRANSLATION_CACHE_PATH), exist_ok=True)
+        _connection = sqlite3.connect(TRANSLATION_CACHE_PATH, check_same_thread=False, timeout=30)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY, model TEXT, translation TEXT, created REAL)"
+        )
+        _connection.commit()
+    return _connection
+
+
+def is_bypassed():
+    return _bypass_depth > 0
+
+
+@contextlib.contextmanager
+def bypass():
+    """
+    Внутри блока кэш не читается (но новые переводы в него записываются) —
+    для повторного перевода фрагментов, уже переведённых с ошибкой.
+    """
+    global _bypass_depth
+    with _lock:
+        _bypass_depth += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _bypass_depth -= 1
+
+
+def lookup(key):
+    """Перевод из кэша или None"""
+    if not is_enabled() or is_bypassed():
+        return None
+    try:
+        with _lock:
+            row = _db().execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+            stats["misses" if row is None else "hits"] += 1
+    except sqlite3.Error as e:
+        print(f"⚠️ Кэш переводов недоступен: {e}")
+        return None
+    return None if row is None else row[0]
+
+
+def store(key, model, translation):
+    if not is_enabled():
+        return
+    try:
+        with _lock:
+            db = _db()
+            db.execute(
+                "INSERT OR REPLACE INTO translations (key, model, translation, created) VALUES (?, ?, ?, ?)",
+                (key, model, translation, time.time()),
+            )
+            db.commit()
+    except sqlite3.Error as e:
+        print(f"⚠️ Не удалось сохранить перевод в кэш: {e}")
+
+
+def reset_stats():
+    stats["hits"] = 0
+    stats["misses"] = 0
+
+
+def clear():
+    """Полностью очищает кэш переводов"""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(TRANSLATION_CACHE_PATH)
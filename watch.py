@@ -0,0 +1,195 @@
+# watch.py
+"""
+Режим наблюдения: следит за inputs/ и после каждого сохранения переводит
+изменённый файл заново и перекомпилирует результат.
+
+Изменения отслеживаются через inotify (Linux), иначе — опросом mtime/размера.
+Серии сохранений (редактор пишет файл несколько раз подряд) склеиваются:
+обработка начинается, когда файлы не менялись WATCH_DEBOUNCE секунд.
+Заново в API уходят только изменившиеся абзацы — остальные берутся из кэша
+переводов (translation_cache), а компиляция переиспользует каталог сборки.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from formats import get_format, translatable_extensions
+
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "1.0"))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "1.0"))
+
+# Маски inotify: файл дописан и закрыт, либо переименован в каталог (атомарное сохранение)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_watched(name):
+    # Временные файлы редакторов (.#a.tex, ~a.tex, a.tex.swp) не интересны
+    return name.lower().endswith(translatable_extensions()) and not name.startswith((".", "~"))
+
+
+class InotifyWatcher:
+    """Изменённые файлы каталога через inotify (ctypes, без сторонних пакетов)"""
+
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc не найдена")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+
+    def wait(self, timeout):
+        """Имена изменившихся файлов за время ожидания (может быть пусто)"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Запасной вариант: сравнение mtime и размера файлов раз в WATCH_POLL_INTERVAL"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            snapshot[name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, WATCH_POLL_INTERVAL))
+        current = self._scan()
+        changed = {name for name, state in current.items() if self._snapshot.get(name) != state}
+        self._snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory, polling=False):
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            # AttributeError — в libc нет inotify (macOS, Windows)
+            pass
+    print("ℹ️ inotify недоступен — изменения отслеживаются опросом.")
+    return PollingWatcher(directory)
+
+
+def wait_for_changes(watcher, debounce=WATCH_DEBOUNCE):
+    """Блокируется до первого изменения, затем собирает серию до паузы в debounce секунд"""
+    changed = set()
+    while not changed:
+        changed = {name for name in watcher.wait(3600) if _is_watched(name)}
+    quiet_since = time.monotonic()
+    while time.monotonic() - quiet_since < debounce:
+        more = {name for name in watcher.wait(debounce) if _is_watched(name)}
+        if more:
+            changed |= more
+            quiet_since = time.monotonic()
+    return sorted(changed)
+
+
+def rebuild(paths, output_dir, scheduler=None):
+    """Переводит изменённые файлы (повторы — из кэша) и ставит результаты на компиляцию"""
+    import segment_filter
+    import translation_cache
+    import translation_memory
+    import translation_tiers
+    from common import print_truncation_report, reset_truncation_stats
+
+    for input_path in paths:
+        if not os.path.exists(input_path):
+            continue
+        backend = get_format(input_path)
+        started = time.monotonic()
+        translation_cache.reset_stats()
+        translation_memory.reset_stats()
+        reset_truncation_stats()
+        segment_filter.reset_stats()
+        translation_tiers.reset_stats()
+        try:
+            output_path, main_tex_name = backend["translate"](input_path, output_dir)
+        except Exception as e:
+            print(f"💥 {os.path.basename(input_path)}: {e}")
+            continue
+        cached = translation_cache.stats["hits"]
+        reused = translation_memory.stats["reused"]
+        referenced = translation_memory.stats["referenced"]
+        fresh = max(translation_cache.stats["misses"] - reused - referenced, 0)
+        print(
+            f"✅ {os.path.basename(output_path)}: переведено заново {fresh}, "
+            f"по образцу {referenced}, без модели {reused}, "
+            f"из кэша {cached} ({time.monotonic() - started:.1f} с)"
+        )
+        segment_filter.print_report()
+        translation_tiers.print_report()
+        print_truncation_report()
+        if scheduler is not None and backend["compile"]:
+            scheduler.submit(output_path, main_tex_name)
+
+    if scheduler is not None:
+        from compile_pool import print_compile_report
+        print_compile_report(scheduler.wait())
+
+
+def watch_inputs(input_dir, output_dir, compile_after=True, polling=False, debounce=WATCH_DEBOUNCE):
+    """Цикл наблюдения; завершается по Ctrl+C"""
+    scheduler = None
+    if compile_after:
+        from compile_pool import CompileScheduler
+        scheduler = CompileScheduler()
+
+    watcher = create_watcher(input_dir, polling)
+    print(f"👀 Наблюдение за '{input_dir}' (Ctrl+C — выход)...")
+    try:
+        while True:
+            changed = wait_for_changes(watcher, debounce)
+            print(f"\n✏️ Изменены: {', '.join(changed)}")
+            rebuild([os.path.join(input_dir, name) for name in changed], output_dir, scheduler)
+            print(f"\n👀 Ожидание изменений в '{input_dir}'...")
+    except KeyboardInterrupt:
+        print("\n⏹️ Наблюдение остановлено.")
+    finally:
+        watcher.close()
+        if scheduler is not None:
+            scheduler.shutdown()
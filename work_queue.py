@@ -0,0 +1,296 @@
+# work_queue.py
+"""
+Распределённый перевод: координатор и воркеры с общей очередью сегментов.
+
+Координатор (translate --queue PATH или WORK_QUEUE) разбирает и маскирует
+документы как обычно, но чанки из common.translate_jobs не переводит сам, а
+публикует пакетом в очередь — файл SQLite на общем томе — и ждёт результатов;
+документы собирает и записывает тоже он. Воркеры (python main.py worker --queue
+PATH --model ID) на любых машинах с доступом к тому берут сегменты своей модели
+в аренду, переводят их через translate_chunk (со своими кэшем и квотой) и
+возвращают результат.
+
+Аренда длится WORK_LEASE_SECONDS; живой воркер продлевает её, пока запрос
+идёт. Если воркер упал, аренда истекает и сегмент получает другой воркер;
+сегмент, взятый в аренду MAX_ATTEMPTS раз без результата (в том числе когда
+translate_chunk исчерпал попытки и вернул исходник), считается неудачным
+и остаётся на языке оригинала. Пакет брошенного координатора (нет отметки дольше
+BATCH_TIMEOUT) воркеры не берут, и он удаляется при следующей публикации.
+
+Распределяется только тело LaTeX-документов (common.translate_jobs); \\title и
+DOCX переводит сам координатор.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", "300"))
+BATCH_TIMEOUT = 600
+MAX_ATTEMPTS = 5
+POLL_SECONDS = 1.0
+
+_queue_path = os.getenv("WORK_QUEUE") or None
+_lock = threading.Lock()
+_connections = {}
+
+
+def set_queue_path(path):
+    """Включает режим координатора: чанки уходят в очередь path (None — перевод на месте)"""
+    global _queue_path
+    _queue_path = os.path.abspath(path) if path else None
+
+
+def get_queue_path():
+    return _queue_path
+
+
+def _db(path):
+    if path not in _connections:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # isolation_level=None — транзакции открываем сами; без WAL, чтобы файл
+        # работал и на сетевом томе
+        connection = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        connection.execute("CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, created REAL, heartbeat REAL)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT, position INTEGER, model TEXT,"
+            " lang TEXT, text TEXT, status TEXT, worker TEXT, lease_until REAL,"
+            " attempts INTEGER DEFAULT 0, result TEXT)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, model)")
+        connection.execute("CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch, status)")
+        _connections[path] = connection
+    return _connections[path]
+
+
+def _transaction(path, work):
+    """Выполняет work(db) под блокировкой записи всей очереди (для всех процессов)"""
+    with _lock:
+        db = _db(path)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(db)
+            db.execute("COMMIT")
+            return result
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+
+# --- координатор ---
+
+def publish(path, jobs, model):
+    """Кладёт пары (чанк, язык) в очередь одним пакетом; возвращает id пакета"""
+    batch = uuid.uuid4().hex
+
+    def work(db):
+        now = time.time()
+        # Пакеты упавших координаторов никто не заберёт
+        stale = [
+            row[0] for row in db.execute("SELECT id FROM batches WHERE heartbeat < ?", (now - BATCH_TIMEOUT,))
+        ]
+        for stale_batch in stale:
+            db.execute("DELETE FROM jobs WHERE batch = ?", (stale_batch,))
+            db.execute("DELETE FROM batches WHERE id = ?", (stale_batch,))
+        db.execute("INSERT INTO batches (id, created, heartbeat) VALUES (?, ?, ?)", (batch, now, now))
+        db.executemany(
+            "INSERT INTO jobs (batch, position, model, lang, text, status) VALUES (?, ?, ?, ?, ?, 'pending')",
+            [(batch, position, model, lang, text) for position, (text, lang) in enumerate(jobs)],
+        )
+
+    _transaction(path, work)
+    return batch
+
+
+def _collect(path, batch):
+    """Готовые результаты пакета [(позиция, статус, результат)]; забранные строки удаляются"""
+    def work(db):
+        now = time.time()
+        db.execute("UPDATE batches SET heartbeat = ? WHERE id = ?", (now, batch))
+        # MAX_ATTEMPTS аренд без результата — сегмент больше не раздаём
+        db.execute(
+            "UPDATE jobs SET status = 'failed' WHERE batch = ? AND attempts >= ?"
+            " AND (status = 'pending' OR (status = 'leased' AND lease_until < ?))",
+            (batch, MAX_ATTEMPTS, now),
+        )
+        rows = db.execute(
+            "SELECT id, position, status, result FROM jobs WHERE batch = ? AND status IN ('done', 'failed')",
+            (batch,),
+        ).fetchall()
+        db.executemany("DELETE FROM jobs WHERE id = ?", [(row[0],) for row in rows])
+        return [row[1:] for row in rows]
+
+    return _transaction(path, work)
+
+
+def _drop(path, batch):
+    def work(db):
+        db.execute("DELETE FROM jobs WHERE batch = ?", (batch,))
+        db.execute("DELETE FROM batches WHERE id = ?", (batch,))
+
+    _transaction(path, work)
+
+
+def run_jobs(jobs, desc, model):
+    """
+    Переводит пары (чанк, язык) воркерами через очередь. Порядок результатов
+    совпадает с порядком jobs; неудачные сегменты остаются на языке оригинала.
+    """
+    from tqdm import tqdm
+
+    path = _queue_path
+    batch = publish(path, jobs, model)
+    print(f"📮 В очереди {len(jobs)} сегментов для воркеров {model} ({path})")
+    results = [text for text, _ in jobs]
+    failed = 0
+    remaining = len(jobs)
+    try:
+        with tqdm(total=len(jobs), desc=desc) as progress:
+            while remaining:
+                rows = _collect(path, batch)
+                for position, status, result in rows:
+                    if status == "done" and result is not None:
+                        results[position] = result
+                    else:
+                        failed += 1
+                remaining -= len(rows)
+                progress.update(len(rows))
+                if remaining:
+                    time.sleep(POLL_SECONDS)
+    finally:
+        _drop(path, batch)
+    if failed:
+        print(f"⚠️ Не переведено воркерами: {failed} сегментов (оставлены на языке оригинала)")
+    return results
+
+
+# --- воркер ---
+
+def _lease(path, worker, model, limit):
+    """Берёт в аренду до limit сегментов модели model: свободные и с истёкшей арендой"""
+    def work(db):
+        now = time.time()
+        rows = db.execute(
+            "SELECT jobs.id, jobs.text, jobs.lang FROM jobs JOIN batches ON batches.id = jobs.batch"
+            " WHERE jobs.model = ? AND batches.heartbeat > ? AND jobs.attempts < ?"
+            " AND (jobs.status = 'pending' OR (jobs.status = 'leased' AND jobs.lease_until < ?))"
+            " ORDER BY batches.created, jobs.position LIMIT ?",
+            (model, now - BATCH_TIMEOUT, MAX_ATTEMPTS, now, limit),
+        ).fetchall()
+        db.executemany(
+            "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+            [(worker, now + WORK_LEASE_SECONDS, row[0]) for row in rows],
+        )
+        return rows
+
+    return _transaction(path, work)
+
+
+def _renew(path, worker, job_ids):
+    def work(db):
+        db.executemany(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            [(time.time() + WORK_LEASE_SECONDS, job_id, worker) for job_id in job_ids],
+        )
+
+    _transaction(path, work)
+
+
+def _finish(path, worker, job_id, result):
+    """
+    Результат сегмента (None — вернуть в очередь). Вернуть может только
+    держатель аренды; готовый перевод годится от любого воркера, если аренду
+    уже перехватил другой.
+    """
+    def work(db):
+        if result is None:
+            db.execute(
+                "UPDATE jobs SET status = 'pending', lease_until = 0"
+                " WHERE id = ? AND worker = ? AND status = 'leased'", (job_id, worker),
+            )
+        else:
+            db.execute(
+                "UPDATE jobs SET status = 'done', result = ? WHERE id = ? AND status != 'done'", (result, job_id),
+            )
+
+    _transaction(path, work)
+
+
+def _translate(text, lang):
+    """
+    Перевод сегмента воркером; None — translate_chunk отправлял запросы, но
+    сдался и вернул исходник (такой сегмент возвращается в очередь).
+    """
+    from common import request_usage, translate_chunk
+
+    requests_before = request_usage()[0]
+    result = translate_chunk(text, lang=lang)
+    if result == text and request_usage()[0] > requests_before:
+        return None
+    return result
+
+
+def run_worker(path, model, exit_when_idle=False):
+    """
+    Цикл воркера: держит до backend.concurrency сегментов в работе, продлевает
+    их аренду и возвращает результаты. exit_when_idle — выйти, когда очередь пуста.
+    Возвращает число переведённых сегментов.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    import translation_budget
+    from common import get_translation_backend
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    concurrency = get_translation_backend().concurrency
+    print(f"🛠️ Воркер {worker}: модель {model}, до {concurrency} сегментов одновременно ({path})")
+
+    in_flight = {}
+    done = 0
+    renewed = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="worker") as pool:
+        try:
+            while True:
+                free = concurrency - len(in_flight)
+                if free:
+                    for job_id, text, lang in _lease(path, worker, model, free):
+                        in_flight[pool.submit(_translate, text, lang)] = job_id
+                if not in_flight:
+                    if exit_when_idle:
+                        break
+                    time.sleep(POLL_SECONDS)
+                    continue
+
+                finished, _ = wait(in_flight, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job_id = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                        if result is None:
+                            print(f"⚠️ Сегмент #{job_id}: модель не ответила — вернул в очередь")
+                    except translation_budget.BudgetExceeded:
+                        _finish(path, worker, job_id, None)
+                        raise
+                    except Exception as e:
+                        print(f"⚠️ Сегмент #{job_id}: {str(e)[:80]} — вернул в очередь")
+                        result = None
+                    _finish(path, worker, job_id, result)
+                    if result is not None:
+                        done += 1
+                        if done % 50 == 0:
+                            print(f"🛠️ Переведено сегментов: {done}")
+
+                if time.monotonic() - renewed > WORK_LEASE_SECONDS / 3:
+                    _renew(path, worker, list(in_flight.values()))
+                    renewed = time.monotonic()
+        finally:
+            # Недоделанное сразу отдаём другим воркерам, не дожидаясь конца аренды
+            for future, job_id in in_flight.items():
+                future.cancel()
+                _finish(path, worker, job_id, None)
+    print(f"🛠️ Воркер {worker} завершил работу: переведено {done} сегментов")
+    return done
@@ -0,0 +1,250 @@
+# workspace.py
+"""
+Кэш распакованных архивов проектов.
+
+Архив распаковывается один раз в .cache/workspaces/<хэш содержимого>/, а в
+индексе .cache/workspaces.sqlite3 лежат метаданные проекта: главный .tex,
+класс документа, признак MDPI, список .tex и граф \\input/\\include. Перевод
+и компиляция (включая режим «только компиляция») берут всё это отсюда вместо
+повторной распаковки и чтения всех .tex. Хэш архива запоминается по
+(путь, размер, mtime), поэтому повторное открытие того же файла его не читает.
+
+Рабочая копия только для чтения: компиляция раскладывает файлы в свой каталог
+сборки жёсткими ссылками (см. pdf_converter.stage_project), перевод читает
+исходники и пишет новый архив. Хранится не больше WORKSPACE_MAX_COUNT копий —
+давно не использованные удаляются.
+
+Главный файл определяется по заголовкам: \\documentclass в первых HEADER_BYTES
+байтах .tex. Если таких файлов несколько, выбирается тот, что не подключён
+другим (корень графа включений) и не standalone.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zipfile
+
+import tracing
+from tex_deps import _CLASS_RE, _strip_comments, included_tex_files
+
+WORKSPACES_DIR = os.path.abspath(os.getenv("WORKSPACES_DIR", os.path.join(".cache", "workspaces")))
+WORKSPACE_INDEX_PATH = os.path.abspath(
+    os.getenv("WORKSPACE_INDEX_PATH", os.path.join(".cache", "workspaces.sqlite3"))
+)
+WORKSPACE_MAX_COUNT = int(os.getenv("WORKSPACE_MAX_COUNT", "20"))
+
+HEADER_BYTES = 4096
+
+# Меняется, когда меняется состав метаданных
+INDEX_VERSION = 1
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(WORKSPACE_INDEX_PATH), exist_ok=True)
+        _connection = sqlite3.connect(WORKSPACE_INDEX_PATH, check_same_thread=False, timeout=30)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS archives ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS workspaces ("
+            " digest TEXT PRIMARY KEY, version INTEGER, meta TEXT, last_used REAL)"
+        )
+        _connection.commit()
+    return _connection
+
+
+def archive_digest(zip_path):
+    """SHA-256 содержимого архива; пересчитывается, только если изменились размер или mtime"""
+    path = os.path.abspath(zip_path)
+    stat = os.stat(path)
+    with _lock:
+        row = _db().execute(
+            "SELECT digest FROM archives WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+    if row:
+        return row[0]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _lock:
+        _db().execute(
+            "INSERT OR REPLACE INTO archives (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, digest),
+        )
+        _db().commit()
+    return digest
+
+
+def open_workspace(zip_path):
+    """
+    Рабочая копия архива. Возвращает dict:
+    root — каталог с распакованными файлами (не изменять!),
+    members — {относительный путь: имя в архиве}, tex_files — .tex в порядке архива,
+    main_tex — главный .tex или None, main_guessed — главный выбран наугад,
+    doc_class, is_mdpi, includes — {tex: [подключаемые им .tex]}.
+    """
+    digest = archive_digest(zip_path)
+    root = os.path.join(WORKSPACES_DIR, digest[:32])
+    with _lock:
+        row = _db().execute(
+            "SELECT meta FROM workspaces WHERE digest = ? AND version = ?", (digest, INDEX_VERSION),
+        ).fetchone()
+        if row and os.path.isdir(root):
+            meta = json.loads(row[0])
+            _db().execute("UPDATE workspaces SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            _db().commit()
+        else:
+            with tracing.span("zip.extract", file=os.path.basename(zip_path)):
+                members = _extract(zip_path, root)
+            meta = _describe(root, members)
+            _db().execute(
+                "INSERT OR REPLACE INTO workspaces (digest, version, meta, last_used) VALUES (?, ?, ?, ?)",
+                (digest, INDEX_VERSION, json.dumps(meta, ensure_ascii=False), time.time()),
+            )
+            _db().commit()
+            _evict(keep=digest)
+    meta["root"] = root
+    meta["digest"] = digest
+    return meta
+
+
+def _extract(zip_path, root):
+    """Распаковывает архив во временный каталог и атомарно переименовывает его в root"""
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        members = {
+            os.path.normpath(name).replace(os.sep, "/"): name
+            for name in zip_ref.namelist() if not name.endswith("/")
+        }
+        if os.path.isdir(root):
+            # Каталог без записи в индексе (прерванный запуск, другой процесс) — проверять нечего
+            return members
+        tmp_root = root + f".tmp{os.getpid()}.{threading.get_ident()}"
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        zip_ref.extractall(tmp_root)
+    try:
+        os.replace(tmp_root, root)
+    except OSError:
+        # Тот же архив успел распаковать другой процесс
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    return members
+
+
+def _read_header(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return _strip_comments(f.read(HEADER_BYTES))
+    except OSError:
+        return ""
+
+
+def _describe(root, members):
+    """Метаданные проекта: главный .tex по заголовкам, класс, MDPI, граф включений"""
+    tex_files = [rel_path for rel_path in members if rel_path.lower().endswith(".tex")]
+    includes = {rel_path: included_tex_files(root, rel_path) for rel_path in tex_files}
+    included = {child for children in includes.values() for child in children}
+
+    classes = {}
+    for rel_path in tex_files:
+        match = _CLASS_RE.search(_read_header(os.path.join(root, rel_path)))
+        if match and match.group(0).startswith("\\documentclass"):
+            classes[rel_path] = match.group(1).strip()
+
+    main_tex = None
+    main_guessed = False
+    if classes:
+        # Корни графа включений раньше подключаемых, standalone-рисунки — в конце
+        main_tex = min(
+            classes,
+            key=lambda rel_path: (
+                rel_path in included, classes[rel_path] == "standalone",
+                rel_path.count("/"), tex_files.index(rel_path),
+            ),
+        )
+    else:
+        # \documentclass не в начале файла — ищем \begin{document} по всему тексту
+        for rel_path in tex_files:
+            try:
+                with open(os.path.join(root, rel_path), "rb") as f:
+                    if b"\\begin{document}" in f.read():
+                        main_tex = rel_path
+                        break
+            except OSError:
+                pass
+        if main_tex is None and tex_files:
+            main_tex = tex_files[0]
+            main_guessed = True
+
+    doc_class = classes.get(main_tex)
+    is_mdpi = False
+    if main_tex is not None:
+        try:
+            with open(os.path.join(root, main_tex), "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            is_mdpi = "mdpi" in content.lower() and "\\documentclass" in content
+        except OSError:
+            pass
+
+    return {
+        "members": members,
+        "tex_files": tex_files,
+        "main_tex": main_tex,
+        "main_guessed": main_guessed,
+        "doc_class": doc_class,
+        "is_mdpi": is_mdpi,
+        "includes": includes,
+    }
+
+
+def reading_order(workspace):
+    """Все .tex архива: главный, подключённые им в порядке чтения (вглубь), затем остальные"""
+    order = []
+
+    def visit(rel_path):
+        if rel_path in order:
+            return
+        order.append(rel_path)
+        for child in workspace["includes"].get(rel_path, []):
+            visit(child)
+
+    if workspace["main_tex"]:
+        visit(workspace["main_tex"])
+    return order + [rel_path for rel_path in workspace["tex_files"] if rel_path not in order]
+
+
+def _evict(keep):
+    """Удаляет рабочие копии сверх WORKSPACE_MAX_COUNT, начиная с давно не использованных"""
+    rows = _db().execute(
+        "SELECT digest FROM workspaces WHERE digest != ? ORDER BY last_used DESC", (keep,),
+    ).fetchall()
+    for (digest,) in rows[max(WORKSPACE_MAX_COUNT - 1, 0):]:
+        shutil.rmtree(os.path.join(WORKSPACES_DIR, digest[:32]), ignore_errors=True)
+        _db().execute("DELETE FROM workspaces WHERE digest = ?", (digest,))
+        _db().execute("DELETE FROM archives WHERE digest = ?", (digest,))
+    _db().commit()
+
+
+def clear():
+    """Удаляет все рабочие копии и индекс"""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        shutil.rmtree(WORKSPACES_DIR, ignore_errors=True)
+        try:
+            os.remove(WORKSPACE_INDEX_PATH)
+        except OSError:
+            pass
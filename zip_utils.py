@@ -0,0 +1,82 @@
+# zip_utils.py
+"""Работа с ZIP-архивами без лишней распаковки"""
+import os
+import struct
+import zipfile
+
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def copy_zip_member_raw(src_zip, dst_zip, info):
+    """
+    Копирует элемент архива в другой архив без распаковки: сжатые байты
+    переносятся как есть, CRC и размеры берутся из исходного заголовка.
+    """
+    src_fp = src_zip.fp
+    src_fp.seek(info.header_offset)
+    header = src_fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Повреждён локальный заголовок: {info.filename}")
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    name_len, extra_len = fields[10], fields[11]
+    src_fp.seek(name_len + extra_len, 1)
+
+    new_info = zipfile.ZipInfo(info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.comment = info.comment
+    new_info.extra = info.extra
+    new_info.create_system = info.create_system
+    new_info.create_version = info.create_version
+    new_info.extract_version = info.extract_version
+    new_info.internal_attr = info.internal_attr
+    new_info.external_attr = info.external_attr
+    # Размеры известны заранее — data descriptor не нужен
+    new_info.flag_bits = info.flag_bits & ~0x08
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+
+    dst_fp = dst_zip.fp
+    new_info.header_offset = dst_fp.tell()
+    dst_fp.write(new_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining > 0:
+        block = src_fp.read(min(_COPY_BLOCK_SIZE, remaining))
+        if not block:
+            raise zipfile.BadZipFile(f"Неожиданный конец данных: {info.filename}")
+        dst_fp.write(block)
+        remaining -= len(block)
+
+    dst_zip.filelist.append(new_info)
+    dst_zip.NameToInfo[new_info.filename] = new_info
+    dst_zip._didModify = True
+    if hasattr(dst_zip, "start_dir"):
+        dst_zip.start_dir = dst_fp.tell()
+
+
+def copy_zip_with_replacements(src_path, dst_path, replacements):
+    """
+    Копия архива src_path в dst_path, где содержимое указанных элементов
+    (replacements: {имя: bytes}) заменено, а остальные перенесены байт в байт.
+    """
+    with zipfile.ZipFile(src_path, "r") as src_zip, \
+            zipfile.ZipFile(dst_path, "w", zipfile.ZIP_DEFLATED) as dst_zip:
+        for info in src_zip.infolist():
+            if info.filename in replacements:
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = zipfile.ZIP_DEFLATED
+                new_info.external_attr = info.external_attr
+                dst_zip.writestr(new_info, replacements[info.filename])
+            else:
+                copy_zip_member_raw(src_zip, dst_zip, info)
+
+
+def rewrite_zip_members(zip_path, replacements):
+    """
+    Заменяет содержимое указанных элементов архива (replacements: {имя: bytes}),
+    остальные элементы переносит байт в байт. Архив перезаписывается атомарно.
+    """
+    tmp_path = zip_path + ".tmp"
+    copy_zip_with_replacements(zip_path, tmp_path, replacements)
+    os.replace(tmp_path, zip_path)